@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存分析：ABC 分类、库存周转率、可用天数、日均用量
+出入库流水先在 SQLite 中按物资汇总（走 (item_id, operation_time, quantity) 覆盖索引），
+汇总结果按列读入 NumPy 数组后向量化计算；未安装 NumPy 时退回纯 Python 实现，结果相同
+"""
+
+import json
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖
+    np = None
+
+from database import DatabaseManager, TIMESTAMP_FORMAT
+from records import record_type
+
+# ABC 分类阈值：按消耗金额降序累计，前 80% 为 A 类，80%~95% 为 B 类，其余为 C 类
+ABC_THRESHOLDS = (0.80, 0.95)
+ABC_CLASSES = ('A', 'B', 'C')
+
+# 分析结果行（界面表格和导出使用）
+AnalyticsRecord = record_type('AnalyticsRecord', (
+    'item_id', 'item_code', 'item_name', 'unit', 'abc_class', 'usage', 'consumption_value',
+    'avg_daily_usage', 'current_stock', 'turnover', 'days_of_cover',
+))
+
+
+class InventoryAnalytics:
+    """库存分析器
+
+    结果按 (统计窗口, 截止日期, 流水版本) 缓存，有新的入库/出库/物资或其他库存变化（流水日志事件）后自动失效；
+    物资进价变化后调用 invalidate。
+
+    Args:
+        db: 数据库管理器
+        use_numpy: 是否使用 NumPy（None 表示已安装则使用）
+    """
+
+    def __init__(self, db: DatabaseManager, use_numpy: Optional[bool] = None):
+        self.db = db
+        self.use_numpy = np is not None if use_numpy is None else (use_numpy and np is not None)
+        self._cache = {}
+
+    def invalidate(self):
+        """清空缓存"""
+        self._cache = {}
+
+    def compute(self, window_days: int = 365) -> Dict:
+        """计算全部物资的分析指标
+
+        有新流水但没有新物资时只汇总新增的流水行并累加到缓存的按物资汇总上，
+        不重新扫描整个流水表；统计窗口按天滚动，跨天后重新全量汇总。
+        版本的任一分量变小（归档迁出了最新的记录、数据被清空重建）或有流水迁入归档库时同样全量汇总，
+        避免重复累加；统计窗口内已归档的流水从与窗口有交集的归档分区读取。
+
+        Returns:
+            {'columns': {字段: 数组/列表}, 'summary': 汇总, 'window_days', 'since', 'version'}
+            columns 按 item_id 升序排列，字段同 AnalyticsRecord（不含编码、名称、单位）
+        """
+        since = (datetime.utcnow() - timedelta(days=window_days)).strftime(TIMESTAMP_FORMAT)
+        version = self.db.get_movement_version()
+        key = (window_days, since[:10])
+        cached = self._cache.get(key)
+        if cached is not None and cached['version'] == version:
+            return cached
+
+        if (cached is not None and cached['version'][2] == version[2] and cached['version'][4] == version[4]
+                and all(new >= old for new, old in zip(version, cached['version']))):
+            totals = self._apply_new_movements(cached['totals'], cached['version'])
+        else:
+            totals = self._load_totals(since)
+        columns = self._derive(totals, window_days)
+
+        result = {
+            'columns': columns,
+            'summary': self._summarize(columns),
+            'window_days': window_days,
+            'since': since,
+            'version': version,
+            'totals': totals,
+        }
+        # 只保留最近一个截止日期的结果
+        self._cache = {k: v for k, v in self._cache.items() if k[1] == key[1]}
+        self._cache[key] = result
+        return result
+
+    def _scatter(self, item_ids, rows):
+        """把按物资汇总的 (item_id, 数量) 行展开成与完整物资列表对齐的数组，没有流水的物资为 0"""
+        if self.use_numpy:
+            values = np.zeros(len(item_ids), dtype=np.float64)
+            if rows:
+                keys, sums = zip(*rows)
+                positions = np.searchsorted(item_ids, np.array(keys, dtype=np.int64))
+                values[positions] = np.array(sums, dtype=np.float64)
+            return values
+        sums = dict(rows)
+        return [float(sums.get(item_id) or 0) for item_id in item_ids]
+
+    def _load_totals(self, since: str) -> Dict:
+        """全量汇总：物资单价、当前库存、窗口内出库量、窗口内入库量（均按 item_id 升序对齐）"""
+        items = self.db.execute_query('''
+            SELECT item_id, COALESCE(purchase_price, 0) FROM items ORDER BY item_id
+        ''')
+        stock_rows = self.db.execute_query('''
+            SELECT item_id, SUM(quantity) FROM inventory GROUP BY item_id
+        ''')
+        out_rows = self._sum_window('stock_out', since)
+        in_rows = self._sum_window('stock_in', since)
+
+        ids = [row[0] for row in items]
+        prices = [float(row[1]) for row in items]
+        if self.use_numpy:
+            ids = np.array(ids, dtype=np.int64)
+            prices = np.array(prices, dtype=np.float64)
+        return {
+            'item_id': ids,
+            'price': prices,
+            'stock': self._scatter(ids, stock_rows),
+            'usage': self._scatter(ids, out_rows),
+            'received': self._scatter(ids, in_rows),
+        }
+
+    def _sum_window(self, table: str, since: str) -> List:
+        """统计窗口内按物资汇总的流水数量：主库加上与窗口有交集的归档分区"""
+        partitions, condition, params = self.db._ledger_scope(table, False, since, None)
+        source = self.db._ledger_source(table, "item_id, quantity", partitions, condition)
+        return self.db.execute_query(f'''
+            SELECT item_id, SUM(quantity) FROM {source}
+            GROUP BY item_id
+        ''', params * (len(partitions) + 1), attach_archive=bool(partitions))
+
+    def _apply_new_movements(self, totals: Dict, version) -> Dict:
+        """只汇总上次计算之后新增的入库/出库行和流水日志事件，累加到已有汇总
+
+        库存变化取流水日志事件（包含不产生入库/出库记录的调拨等变化）。
+        """
+        # 新增行很少，按主键范围读取后在内存中汇总（SQL 中 GROUP BY 会让优化器改走 item_id 索引全扫）
+        sums = []
+        for query, last_id in (("SELECT item_id, quantity FROM stock_out WHERE stock_out_id > ?", version[1]),
+                               ("SELECT item_id, quantity FROM stock_in WHERE stock_in_id > ?", version[0]),
+                               ("SELECT item_id, quantity FROM movement_journal WHERE event_id > ?", version[3])):
+            totals_by_item = {}
+            for item_id, quantity in self.db.execute_query(query, (last_id,)):
+                totals_by_item[item_id] = totals_by_item.get(item_id, 0) + quantity
+            sums.append(sorted(totals_by_item.items()))
+        ids = totals['item_id']
+        new_out = self._scatter(ids, sums[0])
+        new_in = self._scatter(ids, sums[1])
+        stock_change = self._scatter(ids, sums[2])
+        if self.use_numpy:
+            return dict(totals, stock=totals['stock'] + stock_change,
+                        usage=totals['usage'] + new_out, received=totals['received'] + new_in)
+        return dict(totals,
+                    stock=[s + c for s, c in zip(totals['stock'], stock_change)],
+                    usage=[u + o for u, o in zip(totals['usage'], new_out)],
+                    received=[r + i for r, i in zip(totals['received'], new_in)])
+
+    def _derive(self, totals: Dict, window_days: int) -> Dict:
+        """由按物资汇总计算各项指标"""
+        if self.use_numpy:
+            return self._derive_numpy(totals, window_days)
+        return self._derive_python(totals, window_days)
+
+    @staticmethod
+    def _derive_numpy(totals: Dict, window_days: int) -> Dict:
+        stock, usage, received = totals['stock'], totals['usage'], totals['received']
+        value = usage * totals['price']
+        avg_daily = usage / window_days
+        # 期初库存由期末库存倒推，平均库存取期初期末的平均
+        average_stock = (2 * stock - received + usage) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            turnover = np.where(average_stock > 0, usage / average_stock * (365.0 / window_days), np.nan)
+            days_of_cover = np.where(avg_daily > 0, stock / avg_daily, np.inf)
+
+        abc = np.full(len(value), 'C', dtype='<U1')
+        total = value.sum()
+        if total > 0:
+            order = np.argsort(-value, kind='stable')
+            sorted_value = value[order]
+            # 按进入该物资之前的累计占比判定，保证消耗最大的物资总是 A 类
+            share_before = (np.cumsum(sorted_value) - sorted_value) / total
+            classes = np.where(share_before < ABC_THRESHOLDS[0], 'A',
+                               np.where(share_before < ABC_THRESHOLDS[1], 'B', 'C'))
+            classes[sorted_value <= 0] = 'C'
+            abc[order] = classes
+
+        return {
+            'item_id': totals['item_id'],
+            'usage': usage,
+            'consumption_value': value,
+            'avg_daily_usage': avg_daily,
+            'current_stock': stock,
+            'turnover': turnover,
+            'days_of_cover': days_of_cover,
+            'abc_class': abc,
+        }
+
+    @staticmethod
+    def _derive_python(totals: Dict, window_days: int) -> Dict:
+        stock, usage, received = totals['stock'], totals['usage'], totals['received']
+        value = [u * p for u, p in zip(usage, totals['price'])]
+        avg_daily = [u / window_days for u in usage]
+        turnover = []
+        days_of_cover = []
+        for s, u, r, d in zip(stock, usage, received, avg_daily):
+            average_stock = (2 * s - r + u) / 2
+            turnover.append(u / average_stock * (365.0 / window_days) if average_stock > 0 else math.nan)
+            days_of_cover.append(s / d if d > 0 else math.inf)
+
+        abc = ['C'] * len(value)
+        total = sum(value)
+        if total > 0:
+            cumulative = 0.0
+            for index in sorted(range(len(value)), key=lambda i: -value[i]):
+                if value[index] <= 0:
+                    break
+                share_before = cumulative / total
+                abc[index] = 'A' if share_before < ABC_THRESHOLDS[0] else (
+                    'B' if share_before < ABC_THRESHOLDS[1] else 'C')
+                cumulative += value[index]
+
+        return {
+            'item_id': totals['item_id'],
+            'usage': usage,
+            'consumption_value': value,
+            'avg_daily_usage': avg_daily,
+            'current_stock': stock,
+            'turnover': turnover,
+            'days_of_cover': days_of_cover,
+            'abc_class': abc,
+        }
+
+    @staticmethod
+    def _summarize(columns: Dict) -> Dict:
+        """各 ABC 类别的物资数和消耗金额占比"""
+        vectorized = np is not None and isinstance(columns['abc_class'], np.ndarray)
+        if vectorized:
+            total_value = float(columns['consumption_value'].sum())
+        else:
+            total_value = float(sum(columns['consumption_value']))
+        summary = {'item_count': len(columns['item_id']), 'total_value': round(total_value, 2)}
+        for abc_class in ABC_CLASSES:
+            if vectorized:
+                mask = columns['abc_class'] == abc_class
+                count = int(mask.sum())
+                value = float(columns['consumption_value'][mask].sum())
+            else:
+                pairs = [v for c, v in zip(columns['abc_class'], columns['consumption_value']) if c == abc_class]
+                count = len(pairs)
+                value = sum(pairs)
+            summary[abc_class] = {
+                'count': count,
+                'value': round(value, 2),
+                'value_share': round(value / total_value, 4) if total_value else 0.0,
+            }
+        return summary
+
+    def get_rows(self, window_days: int = 365, abc_class: Optional[str] = None,
+                 limit: int = 500) -> List:
+        """按消耗金额降序返回分析结果行（附物资编码、名称、单位），只查询显示的物资"""
+        columns = self.compute(window_days)['columns']
+        if self.use_numpy:
+            indexes = np.arange(len(columns['item_id']))
+            if abc_class:
+                indexes = indexes[columns['abc_class'] == abc_class]
+            order = np.argsort(-columns['consumption_value'][indexes], kind='stable')
+            indexes = indexes[order][:limit].tolist()
+        else:
+            indexes = [i for i in range(len(columns['item_id']))
+                       if not abc_class or columns['abc_class'][i] == abc_class]
+            indexes.sort(key=lambda i: -columns['consumption_value'][i])
+            indexes = indexes[:limit]
+
+        item_ids = [int(columns['item_id'][i]) for i in indexes]
+        details = {row[0]: row[1:] for row in self.db.execute_query('''
+            SELECT item_id, item_code, item_name, unit FROM items
+            WHERE item_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(item_ids),))}
+
+        rows = []
+        for index, item_id in zip(indexes, item_ids):
+            item_code, item_name, unit = details.get(item_id, ('', '', ''))
+            turnover = float(columns['turnover'][index])
+            days_of_cover = float(columns['days_of_cover'][index])
+            rows.append((
+                item_id, item_code, item_name, unit, str(columns['abc_class'][index]),
+                float(columns['usage'][index]), float(columns['consumption_value'][index]),
+                float(columns['avg_daily_usage'][index]), float(columns['current_stock'][index]),
+                None if math.isnan(turnover) else turnover,
+                None if math.isinf(days_of_cover) else days_of_cover,
+            ))
+        return AnalyticsRecord.from_rows(rows)
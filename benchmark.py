@@ -0,0 +1,1160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+在独立的临时数据库上运行，不会改动 inventory.db
+"""
+
+import argparse
+import collections
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+
+from database import DEFAULT_BUSY_TIMEOUT_MS, DEFAULT_MAX_RETRIES, DatabaseManager, InventoryStatusRecord
+from query_stats import QueryStats
+from sample_data import SIZE_PRESETS, ScaledDataGenerator, get_benchmark_db
+from sharding import ShardedDatabaseManager
+
+
+def _timed(func, *args, **kwargs):
+    """执行函数并返回 (结果, 耗时毫秒)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _generate(db_path, **options):
+    """用合成数据生成器填充基准测试数据库"""
+    generator = ScaledDataGenerator(db_path, **options)
+    try:
+        generator.generate()
+    finally:
+        generator.close()
+
+
+@contextmanager
+def _benchmark_db(db_path=None):
+    """提供基准测试数据库路径；未指定时使用临时文件并在结束后删除"""
+    if db_path is not None:
+        yield db_path
+        return
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        yield db_path
+    finally:
+        os.remove(db_path)
+
+
+def bench_stock_as_of(ledger_rows=10000000, item_count=10000, days=730,
+                      interval_days=7, samples=20, db_path=None):
+    """历史时点库存重建：对比无快照全量回放与快照 + 增量回放"""
+    with _benchmark_db(db_path) as db_path:
+        _generate(db_path, items=item_count, movements=ledger_rows, days=days)
+        db = DatabaseManager(db_path)
+        start = datetime.utcnow() - timedelta(days=days)
+
+        rng = random.Random(7)
+        timestamps = [start + timedelta(seconds=rng.randrange(days * 86400)) for _ in range(samples)]
+        item_ids = [rng.randint(1, item_count) for _ in range(samples)]
+
+        def run(label):
+            single = [_timed(db.get_stock_as_of, ts, item_id)[1] for ts, item_id in zip(timestamps, item_ids)]
+            full = [_timed(db.get_stock_as_of, ts)[1] for ts in timestamps[:max(1, samples // 4)]]
+            print(f"  {label}: 单品 平均 {sum(single) / len(single):.2f}ms 最大 {max(single):.2f}ms | "
+                  f"全部物资 平均 {sum(full) / len(full):.1f}ms 最大 {max(full):.1f}ms")
+
+        run("无快照（全量回放）")
+
+        created, elapsed = _timed(db.create_periodic_snapshots, interval_days)
+        print(f"  创建 {created} 个快照（间隔 {interval_days} 天）耗时 {elapsed / 1000:.1f}s")
+
+        run("快照 + 增量回放")
+
+
+def bench_allocation(batches_per_item=5000, items=3, operations=500, db_path=None):
+    """出库批次分配：每种物资数千个批次，测量 FEFO/FIFO 出库延迟"""
+    with _benchmark_db(db_path) as db_path:
+        db = DatabaseManager(db_path)
+        rng = random.Random(42)
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO categories (category_name) VALUES ('基准测试')")
+        conn.executemany('''
+            INSERT INTO items (item_code, item_name, category_id, unit) VALUES (?, ?, 1, '个')
+        ''', [(f"BM{i:07d}", f"基准物资{i}") for i in range(1, items + 1)])
+        base = datetime(2024, 1, 1)
+        conn.executemany('''
+            INSERT INTO inventory (item_id, quantity, batch_number, production_date, expiry_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(item_id, rng.randint(1, 20), f"B{item_id}-{n:05d}",
+               (base + timedelta(days=n % 365)).strftime("%Y-%m-%d"),
+               (base + timedelta(days=365 + rng.randrange(720))).strftime("%Y-%m-%d"))
+              for item_id in range(1, items + 1) for n in range(batches_per_item)])
+        conn.commit()
+        conn.close()
+        print(f"{items} 种物资 × {batches_per_item} 个批次")
+
+        for strategy in ("FEFO", "FIFO"):
+            latencies = []
+            for _ in range(operations):
+                ok, elapsed = _timed(db.stock_out, rng.randint(1, items), rng.randint(1, 40), 1.0,
+                                     strategy=strategy)
+                latencies.append(elapsed)
+            latencies.sort()
+            print(f"  {strategy}: {operations} 次出库 平均 {sum(latencies) / len(latencies):.2f}ms "
+                  f"p95 {latencies[int(len(latencies) * 0.95)]:.2f}ms 最大 {latencies[-1]:.2f}ms")
+
+
+def bench_search(item_count=1000000, page_size=100, db_path=None):
+    """组合筛选：每种条件组合的全量结果和首页（键集分页）耗时"""
+    with _benchmark_db(db_path) as db_path:
+        db = DatabaseManager(db_path)
+        if not db.execute_query("SELECT COUNT(*) FROM items")[0][0]:
+            # 生成器要切换日志模式，先关闭常驻读连接
+            db.close()
+            _generate(db_path, items=item_count, movements=item_count * 2, days=365)
+
+        keywords = ("", "1234")
+        categories = ("全部", "办公用品")
+        suppliers = ("全部", "供应商0007")
+        statuses = ("全部", "库存不足", "库存过高", "正常")
+
+        print(f"{'方法':<24}{'关键词':<10}{'类目':<10}{'供应商/状态':<12}{'结果数':>9}{'全量ms':>10}{'首页ms':>10}")
+        for keyword, category, supplier in itertools.product(keywords, categories, suppliers):
+            result, full_ms = _timed(db.search_items, keyword, category, supplier)
+            _, page_ms = _timed(db.search_items, keyword, category, supplier, limit=page_size)
+            print(f"{'search_items':<24}{keyword or '-':<10}{category:<10}{supplier:<12}"
+                  f"{len(result):>9}{full_ms:>10.1f}{page_ms:>10.1f}")
+        for keyword, category, status in itertools.product(keywords, categories, statuses):
+            result, full_ms = _timed(db.search_inventory_status, keyword, category, status)
+            _, page_ms = _timed(db.search_inventory_status, keyword, category, status, limit=page_size)
+            print(f"{'search_inventory_status':<24}{keyword or '-':<10}{category:<10}{status:<12}"
+                  f"{len(result):>9}{full_ms:>10.1f}{page_ms:>10.1f}")
+
+
+def bench_sort(item_count=1000000, page_size=200, pages=5, db_path=None):
+    """表头排序：每个可排序列升序/降序的首页和后续键集分页耗时（物资、库存状态、出入库记录）"""
+    from database import LEDGER_SORT_COLUMNS
+    from query_builder import sort_key
+
+    with _benchmark_db(db_path) as db_path:
+        db = DatabaseManager(db_path)
+        if not db.execute_query("SELECT COUNT(*) FROM items")[0][0]:
+            # 生成器要切换日志模式，先关闭常驻读连接
+            db.close()
+            _generate(db_path, items=item_count, movements=item_count * 2, days=365)
+
+        ledger_key = {'stock_in': 'stock_in_id', 'stock_out': 'stock_out_id'}
+        targets = [
+            ('search_items', db.search_items, ('item_id', 'item_code', 'item_name'), sort_key),
+            ('search_inventory_status', db.search_inventory_status, ('item_code', 'item_name'), sort_key),
+        ]
+        for table, fetch in (('stock_in', db.get_stock_in_records), ('stock_out', db.get_stock_out_records)):
+            targets.append((f"get_{table}_records", fetch, LEDGER_SORT_COLUMNS[table],
+                            lambda row, sort_by, key=ledger_key[table]: (row[sort_by], row[key])))
+
+        print(f"{'方法':<26}{'排序列':<16}{'方向':<6}{'首页ms':>10}{f'后{pages - 1}页平均ms':>16}")
+        slowest = 0.0
+        for name, fetch, columns, page_key in targets:
+            for sort_by, descending in itertools.product(columns, (False, True)):
+                rows, first_ms = _timed(fetch, sort_by=sort_by, descending=descending, limit=page_size)
+                next_ms = []
+                for _ in range(pages - 1):
+                    if len(rows) < page_size:
+                        break
+                    rows, elapsed = _timed(fetch, sort_by=sort_by, descending=descending,
+                                           after=page_key(rows[-1], sort_by), limit=page_size)
+                    next_ms.append(elapsed)
+                slowest = max(slowest, first_ms, *next_ms)
+                average = sum(next_ms) / len(next_ms) if next_ms else 0.0
+                print(f"{name:<26}{sort_by:<16}{'降序' if descending else '升序':<6}{first_ms:>10.1f}{average:>16.1f}")
+        print(f"最慢一页 {slowest:.1f}ms")
+
+
+def _drop_os_cache(path):
+    """请求操作系统丢弃文件的页缓存（仅 Linux 等支持 posix_fadvise 的系统，否则冷查询只冷在 SQLite 缓存）"""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for file_path in (path, path + "-wal"):
+        if os.path.exists(file_path):
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+STORAGE_QUERIES = (
+    ("get_inventory_status", lambda db: db.get_inventory_status()),
+    ("状态首页(库存不足)", lambda db: db.search_inventory_status(status_filter="库存不足", limit=100)),
+    ("物资关键词搜索", lambda db: db.search_items("1234")),
+    ("库存预警", lambda db: db.get_stock_alerts()),
+)
+
+
+def bench_storage(preset="medium", profiles=None, rounds=5, seed=42):
+    """存储配置：各配置下查询的冷（新连接、丢弃文件缓存）、预读后首次和热（常驻连接重复执行）耗时"""
+    from database import STORAGE_PROFILES
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_storage_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        # 打开一次完成建表迁移和流水日志期初事件，不计入各配置的冷查询
+        DatabaseManager(db_path, storage_profile="default")
+        _bench_storage_profiles(db_path, profiles or list(STORAGE_PROFILES), rounds)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _bench_storage_profiles(db_path, profiles, rounds):
+    print(f"{'配置':<10}{'查询':<24}{'冷ms':>10}{'预读后ms':>10}{'热ms':>10}")
+    for profile in profiles:
+        prewarm_seconds = 0.0
+        for name, query in STORAGE_QUERIES:
+            os_cache_dropped = _drop_os_cache(db_path)
+            db = DatabaseManager(db_path, storage_profile=profile)
+            _, cold_ms = _timed(query, db)
+            db.close()
+
+            _drop_os_cache(db_path)
+            db = DatabaseManager(db_path, storage_profile=profile)
+            prewarm_seconds = db.prewarm()['seconds']
+            _, prewarmed_ms = _timed(query, db)
+            warm = sorted(_timed(query, db)[1] for _ in range(rounds))
+            db.close()
+            print(f"{profile:<10}{name:<24}{cold_ms:>10.1f}{prewarmed_ms:>10.1f}{warm[len(warm) // 2]:>10.1f}")
+        print(f"{profile:<10}预读耗时 {prewarm_seconds * 1000:.1f}ms"
+              f"{'' if os_cache_dropped else '（不支持丢弃文件缓存，冷查询只冷在 SQLite 页缓存）'}")
+
+
+def bench_records(rows=1000000):
+    """结果行表示：按行字典 vs 元组行对象 vs 按列结果的构造耗时、内存和访问耗时"""
+    conn = sqlite3.connect(":memory:")
+    result = conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        SELECT i, printf('SKU%07d', i), '物资' || i, '类目' || (i % 50), '个',
+               i % 20, 100 + i % 50, i % 150,
+               CASE WHEN i % 150 <= i % 20 THEN '库存不足' WHEN i % 150 >= 100 + i % 50 THEN '库存过高' ELSE '正常' END
+        FROM n
+    ''', (rows,)).fetchall()
+    conn.close()
+    fields = InventoryStatusRecord._fields
+
+    def build_dicts():
+        return [{
+            'item_id': row[0],
+            'item_code': row[1],
+            'item_name': row[2],
+            'category_name': row[3],
+            'unit': row[4],
+            'min_stock': row[5],
+            'max_stock': row[6],
+            'current_stock': row[7],
+            'status': row[8]
+        } for row in result]
+
+    def build_records():
+        return InventoryStatusRecord.from_rows(result)
+
+    def build_columns():
+        return InventoryStatusRecord.columns(result)
+
+    def access(data):
+        # 与界面刷新表格时的读取方式相同
+        total = 0
+        for item in data:
+            total += item['current_stock']
+            if item['status'] == '库存不足':
+                total += item['min_stock']
+        return total
+
+    def access_attributes(data):
+        total = 0
+        for item in data:
+            total += item.current_stock
+            if item.status == '库存不足':
+                total += item.min_stock
+        return total
+
+    def access_columns(columns):
+        return sum(columns['current_stock']) + sum(
+            minimum for minimum, status in zip(columns['min_stock'], columns['status'])
+            if status == '库存不足')
+
+    print(f"{rows} 行，{len(fields)} 列")
+    print(f"{'表示':<12}{'构造ms':>10}{'内存MB':>10}{'访问ms':>10}")
+    for label, build, read in (("dict", build_dicts, access),
+                               ("Record[键]", build_records, access),
+                               ("Record.属性", build_records, access_attributes),
+                               ("按列", build_columns, access_columns)):
+        gc.collect()
+        data, build_ms = _timed(build)
+        _, access_ms = _timed(read, data)
+        del data
+        # 内存单独测量，tracemalloc 会拖慢构造
+        gc.collect()
+        tracemalloc.start()
+        data = build()
+        memory_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+        del data
+        print(f"{label:<12}{build_ms:>10.1f}{memory_mb:>10.1f}{access_ms:>10.1f}")
+
+
+def bench_analytics(preset="medium", window_days=730, seed=42):
+    """库存分析：NumPy 与纯 Python 实现的全量计算、缓存命中、新增流水后增量更新的耗时"""
+    from analytics import InventoryAnalytics, np
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_analytics_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db = DatabaseManager(db_path)
+        item_count = db.execute_query("SELECT COUNT(*) FROM items")[0][0]
+        movements = db.execute_query(
+            "SELECT (SELECT COUNT(*) FROM stock_in) + (SELECT COUNT(*) FROM stock_out)")[0][0]
+        print(f"{item_count} 种物资，{movements} 条流水，统计窗口 {window_days} 天")
+        modes = [("NumPy", True), ("纯 Python", False)] if np is not None else [("纯 Python", False)]
+        for label, use_numpy in modes:
+            analytics = InventoryAnalytics(db, use_numpy=use_numpy)
+            _, full_ms = _timed(analytics.compute, window_days)
+            _, cached_ms = _timed(analytics.compute, window_days)
+            db.stock_in(1, 10, 1.0)
+            db.stock_out(1, 5, 1.0)
+            result, delta_ms = _timed(analytics.compute, window_days)
+            _, rows_ms = _timed(analytics.get_rows, window_days, None, 500)
+            summary = result['summary']
+            print(f"{label:<10} 全量 {full_ms:>9.1f}ms  缓存 {cached_ms:>7.2f}ms  增量 {delta_ms:>7.1f}ms  "
+                  f"前500行 {rows_ms:>7.1f}ms  "
+                  f"A/B/C = {summary['A']['count']}/{summary['B']['count']}/{summary['C']['count']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_purchase(preset="medium", seed=42):
+    """采购建议：把全部物资调成低库存后，计算建议与生成草稿采购单的耗时（NumPy 与纯 Python）"""
+    from replenishment import PurchasePlanner, np
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_purchase_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db = DatabaseManager(db_path)
+        db.execute_update("UPDATE items SET min_stock = min_stock + 1000000, max_stock = max_stock + 2000000")
+        modes = [("NumPy", True), ("纯 Python", False)] if np is not None else [("纯 Python", False)]
+        for label, use_numpy in modes:
+            planner = PurchasePlanner(db, use_numpy=use_numpy)
+            plan, suggest_ms = _timed(planner.suggest)
+            print(f"{label:<10} 建议 {len(plan['lines']['item_id'])} 种物资 / {len(plan['orders'])} 个供应商 "
+                  f"{suggest_ms:>8.1f}ms")
+        result, create_ms = _timed(PurchasePlanner(db).create_draft_orders)
+        _, again_ms = _timed(PurchasePlanner(db).create_draft_orders)
+        print(f"生成草稿采购单 {result['orders']} 张 / {result['lines']} 行 {create_ms:>8.1f}ms，"
+              f"再次生成（全部在途）{again_ms:>8.1f}ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_journal(preset="medium", operations=1000, seed=42):
+    """流水日志：期初事件生成、投影从零追赶（崩溃后最坏情况）、出入库追加日志后的增量追赶、
+    由日志重建批次库存与核对的耗时"""
+    from journal import JournalProjector
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_journal_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db, open_ms = _timed(DatabaseManager, db_path)
+        events = db.execute_query("SELECT COUNT(*) FROM movement_journal")[0][0]
+        print(f"期初事件 {events} 条（首次打开 {open_ms:.1f}ms）")
+
+        projector = JournalProjector(db)
+        result, catch_up_ms = _timed(projector.catch_up)
+        print(f"投影从零追赶 {result['events']} 个事件 {result['transactions']} 个事务 {catch_up_ms:>8.1f}ms "
+              f"({result['events'] / catch_up_ms * 1000:.0f} 事件/s)")
+
+        item_count = db.execute_query("SELECT MAX(item_id) FROM items")[0][0]
+        rng = random.Random(seed)
+        latencies = []
+        for n in range(operations):
+            item_id = rng.randint(1, item_count)
+            if n % 2 == 0:
+                _, elapsed = _timed(db.stock_in, item_id, rng.randint(1, 20), 1.0, batch_number=f"J{n}")
+            else:
+                _, elapsed = _timed(db.stock_out, item_id, 1, 1.0)
+            latencies.append(elapsed)
+        latencies.sort()
+        print(f"出入库 {operations} 次（含追加日志）平均 {sum(latencies) / len(latencies):.2f}ms "
+              f"p95 {_percentile(latencies, 0.95):.2f}ms")
+
+        result, delta_ms = _timed(projector.catch_up)
+        print(f"增量追赶 {result['events']} 个事件 {delta_ms:>8.1f}ms")
+        _, refresh_ms = _timed(projector.refresh_alerts)
+        print(f"全量重算预警 {len(db.get_stock_alerts())} 种物资 {refresh_ms:>8.1f}ms")
+        rebuilt, rebuild_ms = _timed(projector.rebuild_inventory)
+        print(f"由日志重建批次库存 {rebuilt} 行 {rebuild_ms:>8.1f}ms")
+        mismatches, verify_ms = _timed(projector.verify)
+        print(f"核对 {mismatches} {verify_ms:>8.1f}ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_maintenance(preset="medium", months=12, seed=42):
+    """数据库维护：备份期间并发写入的延迟、历史流水归档、空闲页归还与统计信息更新的耗时"""
+    import threading
+    from maintenance import DatabaseMaintenance
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_maintenance_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db = DatabaseManager(db_path)
+        maintenance = DatabaseMaintenance(db)
+        stats = maintenance.get_file_stats()
+        print(f"数据库 {stats['size_mb']}MB / {stats['page_count']} 页，清理模式 {stats['auto_vacuum']}")
+
+        item_count = db.execute_query("SELECT MAX(item_id) FROM items")[0][0]
+        for pages_per_step in (-1, 1024):
+            stop = threading.Event()
+            latencies = []
+
+            def writer():
+                writer_db = DatabaseManager(db_path)
+                rng = random.Random(seed)
+                while not stop.is_set():
+                    _, elapsed = _timed(writer_db.stock_in, rng.randint(1, item_count), 1, 1.0)
+                    latencies.append(elapsed)
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            try:
+                result = maintenance.backup(os.path.join(work_dir, "backup.db"), pages_per_step)
+            finally:
+                stop.set()
+                thread.join()
+            latencies.sort()
+            label = "一次复制" if pages_per_step < 0 else f"每步 {pages_per_step} 页"
+            print(f"备份（{label}）{result['seconds'] * 1000:>8.1f}ms {result['steps']} 步 "
+                  f"重新开始 {result['restarts']} 次；期间入库 {len(latencies)} 次 "
+                  f"p95 {_percentile(latencies, 0.95) if latencies else 0:.2f}ms")
+
+        _, recent_ms = _timed(db.get_stock_in_records)
+        result = maintenance.archive_ledgers(months)
+        moved = "，".join(f"{table} {count}" for table, count in result['rows'].items())
+        print(f"归档 {result['cutoff']} 之前的流水（{moved}）{result['seconds'] * 1000:>8.1f}ms")
+        _, archived_recent_ms = _timed(db.get_stock_in_records)
+        _, all_ms = _timed(db.get_stock_in_records, True)
+        print(f"入库记录查询：归档前 {recent_ms:.1f}ms，归档后 {archived_recent_ms:.1f}ms，"
+              f"包含归档 {all_ms:.1f}ms")
+        for ledger, partition_key, min_time, max_time, rows in db.get_ledger_partitions('stock_in'):
+            records, range_ms = _timed(db.get_stock_in_records, start=f"{partition_key}-03-01",
+                                       end=f"{partition_key}-03-31")
+            print(f"  分区 {partition_key}（{rows} 行）内查询一个月 {len(records)} 条 {range_ms:.1f}ms")
+
+        if maintenance.get_file_stats()['auto_vacuum'] != 'incremental':
+            result = maintenance.enable_incremental_vacuum()
+            print(f"切换增量清理（整库 VACUUM）{result['size_mb_before']}MB -> {result['size_mb_after']}MB "
+                  f"{result['seconds'] * 1000:>8.1f}ms")
+        else:
+            result = maintenance.incremental_vacuum()
+            print(f"增量归还空闲页 {result['freelist_before']} -> {result['freelist_after']} "
+                  f"{result['size_mb_before']}MB -> {result['size_mb_after']}MB {result['seconds'] * 1000:>8.1f}ms")
+        for limit in (None, 1000):
+            result = maintenance.analyze(limit)
+            print(f"ANALYZE（analysis_limit={limit}）{result['seconds'] * 1000:>8.1f}ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_read_model(preset="medium", operations=1000, seed=42):
+    """进程内读模型：加载耗时与内存、状态计数/预警清单与 SQL 查询对比、写穿和外部写入后追赶的开销"""
+    from journal import JournalProjector
+    from read_model import InventoryReadModel
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_read_model_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db = DatabaseManager(db_path)
+        model, load_ms = _timed(InventoryReadModel, db)
+        items = sum(model.get_status_counts().values())
+        print(f"加载 {items} 种物资 {load_ms:.1f}ms，内存 {model.memory_bytes() / 1024:.0f}KB "
+              f"（{model.memory_bytes() / max(items, 1):.1f} 字节/物资）")
+
+        item_count = db.execute_query("SELECT MAX(item_id) FROM items")[0][0]
+        rng = random.Random(seed)
+        probe = [rng.randint(1, item_count) for _ in range(1000)]
+        comparisons = (
+            ("状态计数", lambda: model.get_status_counts(),
+             lambda: collections.Counter(row.status for row in db.get_inventory_status())),
+            ("预警清单", lambda: model.get_alerts(),
+             lambda: (JournalProjector(db).catch_up(), db.get_stock_alerts())),
+            ("单个物资状态", lambda: [model.get_status(item_id) for item_id in probe],
+             lambda: [db.get_current_stock(item_id) for item_id in probe]),
+        )
+        JournalProjector(db).catch_up()
+        print(f"{'查询':<14}{'读模型us':>12}{'SQL us':>12}")
+        for name, from_model, from_sql in comparisons:
+            calls = len(probe) if name == "单个物资状态" else 1
+            model_us = min(_timed(from_model)[1] for _ in range(5)) * 1000 / calls
+            sql_us = min(_timed(from_sql)[1] for _ in range(3)) * 1000 / calls
+            print(f"{name:<14}{model_us:>12.1f}{sql_us:>12.1f}")
+
+        latencies = {"入库（含读模型写穿）": [], "外部写入后首次查询（含追赶）": []}
+        other = DatabaseManager(db_path)
+        for _ in range(operations):
+            item_id = rng.randint(1, item_count)
+            _, elapsed = _timed(db.stock_in, item_id, 1, 1.0)
+            latencies["入库（含读模型写穿）"].append(elapsed)
+            other.stock_in(item_id, 1, 1.0)
+            _, elapsed = _timed(model.get_status_counts)
+            latencies["外部写入后首次查询（含追赶）"].append(elapsed)
+        for name, values in latencies.items():
+            values.sort()
+            print(f"{name} {operations} 次 平均 {sum(values) / len(values):.3f}ms p95 {_percentile(values, 0.95):.3f}ms")
+        mismatches = sum(1 for row in db.get_inventory_status() if model.get_status(row.item_id) != row.status)
+        print(f"与 get_inventory_status 不一致的物资 {mismatches}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _dashboard_writer(db_path, item_count, rate, seconds, seed, connection):
+    """写入进程：按固定频率随机入库/出库，返回完成的操作数"""
+    db = DatabaseManager(db_path)
+    rng = random.Random(seed)
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        item_id = rng.randint(1, item_count)
+        if rng.random() < 0.6:
+            db.stock_in(item_id, rng.randint(1, 5), 1.0)
+        else:
+            db.stock_out(item_id, 1, 1.0)
+        done += 1
+        delay = start + done / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    connection.send(done)
+    connection.close()
+
+
+def bench_dashboard(preset="medium", rate=50, seconds=10.0, interval_ms=200, seed=42):
+    """实时看板：另一进程按固定频率出入库时，按界面刷新间隔轮询变化的耗时，并核对指标与 SQL 一致"""
+    from dashboard import DashboardFeed
+    from query_builder import STATUS_HIGH, STATUS_LOW
+    from read_model import InventoryReadModel
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_dashboard_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db = DatabaseManager(db_path)
+        model = InventoryReadModel(db)
+        feed, reload_ms = _timed(DashboardFeed, db, model)
+        print(f"初始加载 {reload_ms:.1f}ms，指标 {feed.get_kpis()}")
+
+        item_count = db.execute_query("SELECT MAX(item_id) FROM items")[0][0]
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        writer = multiprocessing.Process(target=_dashboard_writer,
+                                         args=(db_path, item_count, rate, seconds, seed, sender))
+        writer.start()
+        latencies = []
+        changed_rows = 0
+        while writer.is_alive():
+            update, elapsed = _timed(feed.poll)
+            latencies.append(elapsed)
+            if update is not None:
+                changed_rows += len(update['changed'])
+            time.sleep(interval_ms / 1000)
+        writer.join()
+        operations = receiver.recv()
+        feed.poll()
+
+        latencies.sort()
+        print(f"写入 {operations} 次（{operations / seconds:.0f} 次/秒），轮询 {len(latencies)} 次，"
+              f"修改表格行 {changed_rows}")
+        print(f"轮询 平均 {sum(latencies) / len(latencies):.3f}ms p95 {_percentile(latencies, 0.95):.3f}ms "
+              f"最大 {latencies[-1]:.3f}ms")
+        total_value = db.execute_query("SELECT COALESCE(SUM(total_cost), 0) FROM item_valuation")[0][0]
+        kpis = feed.get_kpis()
+        counts = collections.Counter(row.status for row in db.get_inventory_status())
+        print(f"库存总值 看板 {kpis['total_value']:.2f} SQL {total_value:.2f}；"
+              f"库存不足 {kpis['low_stock']}/{counts[STATUS_LOW]}，库存过高 {kpis['high_stock']}/{counts[STATUS_HIGH]}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_valuation(preset="medium", operations=1000, seed=42):
+    """库存估值：旧数据库建立期初成本的耗时、维护成本后的出入库耗时、单物资成本与汇总查询耗时，并核对成本状态"""
+    from valuation import InventoryValuation, VALUATION_METHODS
+
+    work_dir = tempfile.mkdtemp(prefix="inventory_valuation_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        db, init_ms = _timed(DatabaseManager, db_path)
+        items = db.execute_query("SELECT COUNT(*) FROM item_valuation")[0][0]
+        print(f"打开数据库（含建立 {items} 种物资的期初成本）{init_ms:.1f}ms")
+        valuation = InventoryValuation(db)
+
+        item_count = db.execute_query("SELECT MAX(item_id) FROM items")[0][0]
+        rng = random.Random(seed)
+        latencies = {"入库": [], "出库 (FIFO)": [], "单物资成本": []}
+        for _ in range(operations):
+            item_id = rng.randint(1, item_count)
+            _, elapsed = _timed(db.stock_in, item_id, rng.randint(1, 20), round(rng.uniform(1, 100), 2))
+            latencies["入库"].append(elapsed)
+            _, elapsed = _timed(db.stock_out, item_id, 1, 1.0, strategy="FIFO")
+            latencies["出库 (FIFO)"].append(elapsed)
+            _, elapsed = _timed(valuation.get_item_cost, item_id)
+            latencies["单物资成本"].append(elapsed)
+        for name, values in latencies.items():
+            values.sort()
+            print(f"{name} {operations} 次 平均 {sum(values) / len(values):.3f}ms p95 {_percentile(values, 0.95):.3f}ms")
+
+        print(f"{'估值方法':<16}{'总金额':>16}{'总额ms':>10}{'按类目ms':>10}{'按库位ms':>10}")
+        for method in VALUATION_METHODS:
+            total, total_ms = _timed(valuation.get_total_value, method)
+            _, category_ms = _timed(valuation.get_value_by_category, method)
+            _, location_ms = _timed(valuation.get_value_by_location, method)
+            print(f"{method:<16}{total:>16,.2f}{total_ms:>10.1f}{category_ms:>10.1f}{location_ms:>10.1f}")
+        result, verify_ms = _timed(valuation.verify)
+        print(f"核对成本状态 {verify_ms:.1f}ms：{result}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _populate_shards(db, item_count):
+    """按分片规则（编码哈希定分片、分片内交错 item_id）直接批量写入物资和每种物资一个批次，返回全部 item_id"""
+    db.add_category("基准测试")
+    codes_by_shard = [[] for _ in db.shards]
+    for n in range(item_count):
+        code = f"SH{n:07d}"
+        codes_by_shard[db.shard_index_for_code(code)].append(code)
+    item_ids = []
+    count = len(db.shards)
+    for index, (shard, codes) in enumerate(zip(db.shards, codes_by_shard)):
+        ids = [index + 1 + k * count for k in range(len(codes))]
+        conn = sqlite3.connect(shard.db_path)
+        conn.executemany('''
+            INSERT INTO items (item_id, item_code, item_name, category_id, unit, min_stock, max_stock)
+            VALUES (?, ?, ?, 1, '个', 10, 200)
+        ''', [(item_id, code, f"分片物资{code}") for item_id, code in zip(ids, codes)])
+        conn.executemany('''
+            INSERT INTO inventory (item_id, quantity, location, batch_number) VALUES (?, 100, ?, '')
+        ''', [(item_id, "主仓库" if item_id % 3 else "二号仓库") for item_id in ids])
+        conn.commit()
+        conn.close()
+        item_ids.extend(ids)
+    return item_ids
+
+
+def _sharding_writer(directory, shard_count, item_ids, operations, seed, connection):
+    """写入进程：随机物资交替入库/出库，返回 (耗时秒, 失败次数)"""
+    db = ShardedDatabaseManager.from_directory(directory, shard_count)
+    rng = random.Random(seed)
+    failures = 0
+    start = time.perf_counter()
+    for _ in range(operations):
+        item_id = rng.choice(item_ids)
+        if rng.random() < 0.5:
+            ok = db.stock_in(item_id, 1, 1.0)
+        else:
+            ok = db.stock_out(item_id, 1, 1.0)
+        failures += not ok
+    connection.send((time.perf_counter() - start, failures))
+    connection.close()
+    db.close()
+
+
+def bench_sharding(shard_counts=(1, 2, 4, 8), item_count=100000, writers=8, operations=200,
+                   page_size=100):
+    """分片扩展性：多进程并发写入吞吐，以及全量状态、首页搜索、ATTACH 汇总的查询耗时"""
+    print(f"{item_count} 种物资，{writers} 个写入进程 × {operations} 次出入库")
+    print(f"{'分片数':>6}{'写入ops/s':>12}{'失败':>6}{'全量状态ms':>12}{'首页搜索ms':>12}{'ATTACH汇总ms':>14}")
+    for shard_count in shard_counts:
+        work_dir = tempfile.mkdtemp(prefix="inventory_shards_")
+        try:
+            db = ShardedDatabaseManager.from_directory(work_dir, shard_count)
+            item_ids = _populate_shards(db, item_count)
+
+            processes = []
+            receivers = []
+            for worker in range(writers):
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                processes.append(multiprocessing.Process(target=_sharding_writer, args=(
+                    work_dir, shard_count, item_ids, operations, worker, sender)))
+                receivers.append(receiver)
+            for process in processes:
+                process.start()
+            results = [receiver.recv() for receiver in receivers]
+            for process in processes:
+                process.join()
+            # 各进程只计出入库循环的时间（不含启动和打开分片），取最慢的进程
+            elapsed = max(result[0] for result in results)
+            failures = sum(result[1] for result in results)
+
+            _, status_ms = _timed(db.get_inventory_status)
+            _, page_ms = _timed(db.search_inventory_status, sort_by="current_stock", limit=page_size)
+            _, totals_ms = _timed(db.get_location_totals)
+            print(f"{shard_count:>6}{writers * operations / elapsed:>12.0f}{failures:>6}"
+                  f"{status_ms:>12.1f}{page_ms:>12.1f}{totals_ms:>14.1f}")
+            db.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# 并发写入压力测试的配置：(名称, journal_mode, 最多重试次数)
+STRESS_CONFIGS = [
+    ("DELETE,不重试", "DELETE", 0),
+    ("WAL,不重试", "WAL", 0),
+    ("WAL+重试", "WAL", DEFAULT_MAX_RETRIES),
+]
+
+
+def _stress_writer(db_path, config, busy_timeout_ms, item_count, operations, seed, connection):
+    """写入进程：随机物资交替入库/出库，返回成功的出入库次数与数量以及锁竞争统计"""
+    _, journal_mode, max_retries = config
+    db = DatabaseManager(db_path, busy_timeout_ms=busy_timeout_ms, journal_mode=journal_mode)
+    # 打开数据库（各进程同时检查表结构）总是重试，只比较出入库阶段的配置
+    db.max_retries = max_retries
+    db.contention.reset()
+    rng = random.Random(seed)
+    result = {'in_count': 0, 'in_quantity': 0, 'out_count': 0, 'out_quantity': 0}
+    start = time.perf_counter()
+    # 失败的出入库会逐条打印错误，压测时丢弃
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for _ in range(operations):
+            item_id = rng.randint(1, item_count)
+            quantity = rng.randint(1, 5)
+            if rng.random() < 0.5:
+                if db.stock_in(item_id, quantity, 1.0, batch_number=f"S{seed}"):
+                    result['in_count'] += 1
+                    result['in_quantity'] += quantity
+            elif db.stock_out(item_id, quantity, 1.0):
+                result['out_count'] += 1
+                result['out_quantity'] += quantity
+    result['elapsed'] = time.perf_counter() - start
+    result['contention'] = db.get_contention_stats()
+    connection.send(result)
+    connection.close()
+
+
+def bench_stress(writers=16, operations=200, item_count=50, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS,
+                 initial_stock=1000):
+    """多进程并发写入同一数据库：吞吐、锁等待、重试，并核对没有丢失的出入库
+
+    调小 busy_timeout_ms 可模拟长事务（如批量导入）占用写锁超过等待时间的情况。
+    各进程统计自己成功的出入库；结束后流水行数、库存总量须与各进程成功次数完全一致。
+    出库因库存不足返回失败属于正常结果，不计入失败事务。
+    """
+    print(f"{writers} 个写入进程 × {operations} 次出入库，{item_count} 种物资，busy_timeout {busy_timeout_ms}ms")
+    print(f"{'配置':<16}{'ops/s':>8}{'重试':>6}{'失败事务':>8}{'平均等锁ms':>11}"
+          f"{'最长等锁ms':>11}{'丢失':>6}")
+    for config in STRESS_CONFIGS:
+        with _benchmark_db() as db_path:
+            db = DatabaseManager(db_path, journal_mode=config[1])
+            db.add_category("压测类目")
+            category_id = db.get_categories()[0]['category_id']
+            for item_id in range(1, item_count + 1):
+                db.add_item(f"STRESS{item_id:04d}", f"压测物资{item_id}", category_id)
+                db.stock_in(item_id, initial_stock, 1.0, batch_number="INIT")
+
+            processes = []
+            receivers = []
+            for worker in range(writers):
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                processes.append(multiprocessing.Process(target=_stress_writer, args=(
+                    db_path, config, busy_timeout_ms, item_count, operations, worker, sender)))
+                receivers.append(receiver)
+            for process in processes:
+                process.start()
+            results = [receiver.recv() for receiver in receivers]
+            for process in processes:
+                process.join()
+
+            elapsed = max(result['elapsed'] for result in results)
+            total = {key: sum(result[key] for result in results)
+                     for key in ('in_count', 'in_quantity', 'out_count', 'out_quantity')}
+            contention = [result['contention'] for result in results]
+            transactions = sum(c['transactions'] for c in contention)
+            lock_wait_ms = sum(c['lock_wait_ms'] for c in contention)
+
+            in_rows = db.execute_query("SELECT COUNT(*) FROM stock_in WHERE batch_number != 'INIT'")[0][0]
+            out_rows = db.execute_query("SELECT COUNT(*) FROM stock_out")[0][0]
+            stock = db.execute_query("SELECT COALESCE(SUM(quantity), 0) FROM inventory")[0][0]
+            journal_total = db.execute_query("SELECT COALESCE(SUM(quantity), 0) FROM movement_journal")[0][0]
+            expected_stock = item_count * initial_stock + total['in_quantity'] - total['out_quantity']
+            # 丢失：进程认为成功但未落库，或落库了但进程认为失败（两者都会使总量对不上）
+            lost = (abs(in_rows - total['in_count']) + abs(out_rows - total['out_count'])
+                    + abs(stock - expected_stock) + abs(journal_total - expected_stock))
+            print(f"{config[0]:<16}{writers * operations / elapsed:>8.0f}"
+                  f"{sum(c['retries'] for c in contention):>6}{sum(c['failures'] for c in contention):>8}"
+                  f"{lock_wait_ms / transactions if transactions else 0.0:>11.2f}"
+                  f"{max(c['max_lock_wait_ms'] for c in contention):>11.1f}{lost:>6}")
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+
+def _startup(db_path):
+    """程序启动（不含界面）：按 main() 的顺序补齐快照检查点、增量更新补货点、追赶流水日志投影，
+    再按主界面初始化打开数据库、预读常用表、加载读模型和看板数据
+    """
+    from dashboard import DashboardFeed
+    from journal import JournalProjector
+    from read_model import InventoryReadModel
+    from replenishment import ReplenishmentPlanner
+
+    DatabaseManager(db_path).create_periodic_snapshots()
+    ReplenishmentPlanner(DatabaseManager(db_path)).run()
+    JournalProjector(DatabaseManager(db_path)).refresh_alerts()
+    db = DatabaseManager(db_path)
+    db.prewarm()
+    return DashboardFeed(db, InventoryReadModel(db))
+
+
+# 端到端基准套件：(操作名, 默认执行次数, 函数(db, rng, context))
+SUITE_OPERATIONS = [
+    ("startup", 20, lambda db, rng, ctx: _startup(ctx["db_path"])),
+    ("stock_in", 200, lambda db, rng, ctx: db.stock_in(
+        rng.randint(1, ctx["item_count"]), rng.randint(1, 50), 10.0,
+        batch_number=f"BENCH{rng.randrange(10 ** 9)}")),
+    ("stock_out", 200, lambda db, rng, ctx: db.stock_out(
+        rng.randint(1, ctx["item_count"]), 1, 10.0)),
+    ("get_current_stock", 500, lambda db, rng, ctx: db.get_current_stock(
+        rng.randint(1, ctx["item_count"]))),
+    ("get_inventory_status", 5, lambda db, rng, ctx: db.get_inventory_status()),
+    ("search_items", 20, lambda db, rng, ctx: db.search_items(
+        str(rng.randint(1, 999)), rng.choice(ctx["categories"]))),
+    ("search_inventory_status", 20, lambda db, rng, ctx: db.search_inventory_status(
+        "", rng.choice(ctx["categories"]), rng.choice(["全部", "库存不足", "库存过高", "正常"]))),
+    ("get_stock_in_records", 5, lambda db, rng, ctx: db.get_stock_in_records()),
+    ("get_stock_out_records", 5, lambda db, rng, ctx: db.get_stock_out_records()),
+]
+
+
+def _percentile(sorted_values, fraction):
+    """已排序列表的分位数（最近秩法）"""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _peak_rss_mb():
+    """当前进程峰值常驻内存（MB），平台不支持时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _run_operation(source_path, operation, iterations, seed, connection):
+    """子进程中在数据库副本上执行单个操作，结果通过管道返回"""
+    name, _, func = next(op for op in SUITE_OPERATIONS if op[0] == operation)
+    work_dir = tempfile.mkdtemp(prefix="inventory_suite_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(source_path, db_path)
+        db = DatabaseManager(db_path)
+        tree = db.get_category_tree()
+        context = {
+            "db_path": db_path,
+            "item_count": db.execute_query("SELECT MAX(item_id) FROM items")[0][0] or 1,
+            "categories": ["全部"] + [tree.names[root_id] for root_id in tree.roots()],
+        }
+        rng = random.Random(seed)
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            latencies.append(_timed(func, db, rng, context)[1])
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        connection.send({
+            "iterations": iterations,
+            "throughput_ops": round(iterations / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(_percentile(latencies, 0.50), 3),
+            "p95_ms": round(_percentile(latencies, 0.95), 3),
+            "p99_ms": round(_percentile(latencies, 0.99), 3),
+            "max_ms": round(latencies[-1], 3),
+            "peak_rss_mb": _peak_rss_mb(),
+        })
+    finally:
+        connection.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_suite(presets=("tiny", "small"), operations=None, scale=1.0, seed=42):
+    """在各规模的生成数据库上运行基准套件，返回可序列化为 JSON 的结果
+
+    每个操作在独立子进程中对数据库副本执行，峰值内存互不干扰，写操作也不会污染缓存的数据库。
+    """
+    selected = [op for op in SUITE_OPERATIONS if operations is None or op[0] in operations]
+    results = {}
+    for preset in presets:
+        source_path = get_benchmark_db(preset, seed)
+        results[preset] = {}
+        for name, iterations, _ in selected:
+            iterations = max(1, int(iterations * scale))
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_operation,
+                                              args=(source_path, name, iterations, seed, sender))
+            process.start()
+            sender.close()
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = {"error": f"子进程异常退出 (exit code {process.exitcode})"}
+            process.join()
+            results[preset][name] = result
+            if "error" in result:
+                print(f"[{preset}] {name:<24} {result['error']}")
+            else:
+                print(f"[{preset}] {name:<24} {result['throughput_ops']:>10.1f} ops/s  "
+                      f"p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                      f"p99 {result['p99_ms']:>9.2f}ms  RSS {result['peak_rss_mb']}MB")
+
+    return {
+        "meta": {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+            "scale": scale,
+        },
+        "results": results,
+    }
+
+
+def compare_with_baseline(current, baseline, threshold=0.10):
+    """与基线比较 p95 延迟和吞吐量，返回回归列表 [(规模, 操作, 指标, 基线值, 当前值)]"""
+    regressions = []
+    for preset, operations in current["results"].items():
+        for name, result in operations.items():
+            base = baseline.get("results", {}).get(preset, {}).get(name)
+            if not base or "error" in base or "error" in result:
+                continue
+            if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+                regressions.append((preset, name, "p95_ms", base["p95_ms"], result["p95_ms"]))
+            if result["throughput_ops"] < base["throughput_ops"] * (1 - threshold):
+                regressions.append((preset, name, "throughput_ops", base["throughput_ops"],
+                                    result["throughput_ops"]))
+    return regressions
+
+
+def bench_instrumentation(preset="tiny", rounds=10, scale=0.2, seed=42, slow_ms=100.0):
+    """SQL 统计开销：同一数据库副本上逐次交替关闭/开启统计执行套件操作
+
+    写操作的耗时受磁盘同步影响波动很大，按操作取中位数再按执行次数加权，比直接比较总耗时稳定。
+    """
+    work_dir = tempfile.mkdtemp(prefix="inventory_stats_")
+    db_path = os.path.join(work_dir, "work.db")
+    try:
+        shutil.copyfile(get_benchmark_db(preset, seed), db_path)
+        stats = QueryStats(slow_ms)
+        plain_db = DatabaseManager(db_path)
+        instrumented_db = DatabaseManager(db_path, stats=stats)
+        tree = plain_db.get_category_tree()
+        context = {
+            "db_path": db_path,
+            "item_count": plain_db.execute_query("SELECT MAX(item_id) FROM items")[0][0] or 1,
+            "categories": ["全部"] + [tree.names[root_id] for root_id in tree.roots()],
+        }
+
+        weighted = {"off": 0.0, "on": 0.0}
+        print(f"{'操作':<26}{'关闭 p50 ms':>12}{'开启 p50 ms':>12}{'开销':>9}")
+        for name, iterations, func in SUITE_OPERATIONS:
+            count = max(1, int(iterations * scale)) * rounds
+            latencies = {"off": [], "on": []}
+            rng = random.Random(seed)
+            for index in range(count):
+                # 交替先后顺序，抵消缓存预热带来的偏差
+                order = [("off", plain_db), ("on", instrumented_db)]
+                if index % 2:
+                    order.reverse()
+                for label, db in order:
+                    latencies[label].append(_timed(func, db, rng, context)[1])
+            medians = {label: sorted(values)[len(values) // 2] for label, values in latencies.items()}
+            for label in weighted:
+                weighted[label] += medians[label] * count
+            print(f"{name:<26}{medians['off']:>12.3f}{medians['on']:>12.3f}"
+                  f"{(medians['on'] / medians['off'] - 1) * 100:>+8.2f}%")
+
+        overhead = (weighted["on"] / weighted["off"] - 1) * 100
+        summary = stats.to_dict()
+        print(f"加权开销: {overhead:+.2f}%")
+        print(f"记录语句 {len(summary['statements'])} 种，共执行 {summary['total_count']} 次，"
+              f"慢查询 {len(summary['slow_queries'])} 条")
+        return overhead
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="库存管理系统性能基准测试")
+    subparsers = parser.add_subparsers(dest="benchmark")
+
+    as_of_parser = subparsers.add_parser("stock-as-of", help="历史时点库存重建")
+    as_of_parser.add_argument("--ledger-rows", type=int, default=10000000)
+    as_of_parser.add_argument("--items", type=int, default=10000)
+    as_of_parser.add_argument("--days", type=int, default=730)
+    as_of_parser.add_argument("--interval-days", type=int, default=7)
+    as_of_parser.add_argument("--db", help="使用指定数据库文件（默认临时文件）")
+
+    allocation_parser = subparsers.add_parser("allocation", help="出库批次分配")
+    allocation_parser.add_argument("--batches", type=int, default=5000)
+    allocation_parser.add_argument("--items", type=int, default=3)
+    allocation_parser.add_argument("--operations", type=int, default=500)
+    allocation_parser.add_argument("--db", help="使用指定数据库文件（默认临时文件）")
+
+    search_parser = subparsers.add_parser("search", help="组合筛选查询")
+    search_parser.add_argument("--items", type=int, default=1000000)
+    search_parser.add_argument("--page-size", type=int, default=100)
+    search_parser.add_argument("--db", help="使用指定数据库文件（默认临时文件；已有数据时直接复用）")
+
+    sort_parser = subparsers.add_parser("sort", help="表头排序：各排序列的首页与键集翻页耗时")
+    sort_parser.add_argument("--items", type=int, default=1000000)
+    sort_parser.add_argument("--page-size", type=int, default=200)
+    sort_parser.add_argument("--db", help="使用指定数据库文件（默认临时文件；已有数据时直接复用）")
+
+    suite_parser = subparsers.add_parser("suite", help="端到端基准套件（JSON 结果，可与基线比较）")
+    suite_parser.add_argument("--presets", default="tiny,small",
+                              help=f"逗号分隔的数据规模，可选 {','.join(SIZE_PRESETS)}")
+    suite_parser.add_argument("--operations", help="逗号分隔的操作名，默认全部")
+    suite_parser.add_argument("--scale", type=float, default=1.0, help="各操作执行次数的倍率")
+    suite_parser.add_argument("--seed", type=int, default=42)
+    suite_parser.add_argument("--output", help="结果 JSON 文件")
+    suite_parser.add_argument("--baseline", help="基线 JSON 文件，存在回归时以退出码 1 结束")
+    suite_parser.add_argument("--threshold", type=float, default=0.10, help="回归阈值（比例）")
+
+    analytics_parser = subparsers.add_parser("analytics", help="库存分析（ABC、周转率、可用天数）")
+    analytics_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    analytics_parser.add_argument("--window-days", type=int, default=730)
+
+    purchase_parser = subparsers.add_parser("purchase", help="采购建议与草稿采购单生成")
+    purchase_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+
+    journal_parser = subparsers.add_parser("journal", help="流水日志投影追赶与重建")
+    journal_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    journal_parser.add_argument("--operations", type=int, default=1000, help="追加日志的出入库次数")
+
+    read_model_parser = subparsers.add_parser("read-model", help="进程内库存状态读模型与 SQL 查询对比")
+    read_model_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    read_model_parser.add_argument("--operations", type=int, default=1000, help="写穿/外部写入的出入库次数")
+
+    dashboard_parser = subparsers.add_parser("dashboard", help="实时看板：并发写入时的增量轮询耗时与指标核对")
+    dashboard_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    dashboard_parser.add_argument("--rate", type=int, default=50, help="写入进程每秒出入库次数")
+    dashboard_parser.add_argument("--seconds", type=float, default=10.0)
+    dashboard_parser.add_argument("--interval-ms", type=int, default=200, help="轮询间隔（与界面刷新间隔一致）")
+
+    valuation_parser = subparsers.add_parser("valuation", help="库存估值：期初成本、出入库维护成本的耗时与估值查询")
+    valuation_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    valuation_parser.add_argument("--operations", type=int, default=1000, help="入库/出库各执行的次数")
+
+    maintenance_parser = subparsers.add_parser("maintenance", help="在线备份、历史流水归档与空闲页清理")
+    maintenance_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    maintenance_parser.add_argument("--months", type=int, default=12, help="主库保留的月数")
+
+    sharding_parser = subparsers.add_parser("sharding", help="分片扩展性（1~8 个分片）")
+    sharding_parser.add_argument("--shards", default="1,2,4,8", help="逗号分隔的分片数")
+    sharding_parser.add_argument("--items", type=int, default=100000)
+    sharding_parser.add_argument("--writers", type=int, default=8, help="并发写入进程数")
+    sharding_parser.add_argument("--operations", type=int, default=200, help="每个写入进程的出入库次数")
+
+    stress_parser = subparsers.add_parser("stress", help="多进程并发写入同一数据库（锁竞争与丢失核对）")
+    stress_parser.add_argument("--writers", type=int, default=16, help="并发写入进程数")
+    stress_parser.add_argument("--operations", type=int, default=200, help="每个写入进程的出入库次数")
+    stress_parser.add_argument("--items", type=int, default=50, help="物资种数（越少冲突越集中）")
+    stress_parser.add_argument("--busy-timeout-ms", type=int, default=DEFAULT_BUSY_TIMEOUT_MS)
+
+    storage_parser = subparsers.add_parser("storage", help="存储配置（mmap、页缓存、常驻连接、预读）的冷热查询耗时")
+    storage_parser.add_argument("--preset", default="medium", choices=list(SIZE_PRESETS))
+    storage_parser.add_argument("--profiles", help="逗号分隔的配置名，默认全部")
+    storage_parser.add_argument("--rounds", type=int, default=5)
+
+    records_parser = subparsers.add_parser("records", help="结果行表示的内存与耗时")
+    records_parser.add_argument("--rows", type=int, default=1000000)
+
+    stats_parser = subparsers.add_parser("instrumentation", help="SQL 统计开销")
+    stats_parser.add_argument("--preset", default="tiny", choices=list(SIZE_PRESETS))
+    stats_parser.add_argument("--rounds", type=int, default=10)
+    stats_parser.add_argument("--scale", type=float, default=0.2, help="每轮套件操作次数的倍率")
+    stats_parser.add_argument("--slow-ms", type=float, default=100.0)
+
+    args = parser.parse_args()
+    if args.benchmark == "stock-as-of":
+        bench_stock_as_of(args.ledger_rows, args.items, args.days, args.interval_days, db_path=args.db)
+    elif args.benchmark == "allocation":
+        bench_allocation(args.batches, args.items, args.operations, db_path=args.db)
+    elif args.benchmark == "search":
+        bench_search(args.items, args.page_size, db_path=args.db)
+    elif args.benchmark == "sort":
+        bench_sort(args.items, args.page_size, db_path=args.db)
+    elif args.benchmark == "analytics":
+        bench_analytics(args.preset, args.window_days)
+    elif args.benchmark == "purchase":
+        bench_purchase(args.preset)
+    elif args.benchmark == "journal":
+        bench_journal(args.preset, args.operations)
+    elif args.benchmark == "read-model":
+        bench_read_model(args.preset, args.operations)
+    elif args.benchmark == "dashboard":
+        bench_dashboard(args.preset, args.rate, args.seconds, args.interval_ms)
+    elif args.benchmark == "valuation":
+        bench_valuation(args.preset, args.operations)
+    elif args.benchmark == "maintenance":
+        bench_maintenance(args.preset, args.months)
+    elif args.benchmark == "sharding":
+        bench_sharding([int(count) for count in args.shards.split(",")], args.items,
+                       args.writers, args.operations)
+    elif args.benchmark == "stress":
+        bench_stress(args.writers, args.operations, args.items, args.busy_timeout_ms)
+    elif args.benchmark == "storage":
+        bench_storage(args.preset, args.profiles.split(",") if args.profiles else None, args.rounds)
+    elif args.benchmark == "records":
+        bench_records(args.rows)
+    elif args.benchmark == "instrumentation":
+        bench_instrumentation(args.preset, args.rounds, args.scale, slow_ms=args.slow_ms)
+    elif args.benchmark == "suite":
+        operations = args.operations.split(",") if args.operations else None
+        report = run_suite(args.presets.split(","), operations, args.scale, args.seed)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        else:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(report, baseline, args.threshold)
+            for preset, name, metric, base_value, value in regressions:
+                print(f"性能回归 [{preset}] {name} {metric}: 基线 {base_value} -> 当前 {value}")
+            if regressions:
+                sys.exit(1)
+            print(f"未发现超过 {args.threshold:.0%} 的性能回归")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时库存看板数据
+以进程内读模型为变化来源（本进程写穿 + PRAGMA data_version 发现其他进程的提交），
+每次轮询只返回库存或状态变化过的物资和增量更新的指标，界面据此只修改变化的行
+"""
+
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Optional
+
+from database import DatabaseManager, TIMESTAMP_FORMAT
+from query_builder import STATUS_HIGH, STATUS_LOW
+from read_model import InventoryReadModel
+
+# 每次按 IN 列表读取的物资数（低于 SQLite 默认的参数个数上限）
+VALUE_QUERY_BATCH = 500
+
+
+class DashboardFeed:
+    """看板轮询数据源（指标：库存总值、库存不足/过高物资数、今日出入库笔数）
+
+    库存总值按移动加权平均成本计算（item_valuation 随出入库在同一事务中维护），
+    轮询时只重新读取变化物资的库存金额。
+
+    Args:
+        db: 数据库管理器
+        read_model: 进程内读模型（看板消费其变化集合，同一读模型只能供一个看板使用）
+    """
+
+    def __init__(self, db: DatabaseManager, read_model: InventoryReadModel):
+        self.db = db
+        self.model = read_model
+        self.reload()
+
+    def reload(self):
+        """重新读取各物资库存金额并重算库存总值和今日出入库笔数"""
+        self.model.take_changes()
+        self._value = array('d', bytes(8 * (self.model.max_item_id + 1)))
+        self._read_values(self.db.execute_query("SELECT item_id, total_cost FROM item_valuation"))
+        self.total_value = sum(self._value)
+        self._count_movements_today(reset=True)
+
+    def _read_values(self, rows):
+        """按 item_id 下标记下库存金额（按需扩充数组），返回金额变化合计"""
+        delta = 0.0
+        for item_id, total_cost in rows:
+            if item_id >= len(self._value):
+                self._value.frombytes(bytes(8 * (item_id + 1 - len(self._value))))
+            delta += total_cost - self._value[item_id]
+            self._value[item_id] = total_cost
+        return delta
+
+    def _refresh_values(self, item_ids):
+        """重新读取变化物资的库存金额（没有成本行的物资库存金额为 0）"""
+        for start in range(0, len(item_ids), VALUE_QUERY_BATCH):
+            batch = item_ids[start:start + VALUE_QUERY_BATCH]
+            rows = dict.fromkeys(batch, 0.0)
+            rows.update(self.db.execute_query(
+                f"SELECT item_id, total_cost FROM item_valuation WHERE item_id IN ({','.join('?' * len(batch))})",
+                batch))
+            self.total_value += self._read_values(rows.items())
+
+    def _count_movements_today(self, reset: bool = False):
+        """今日出入库笔数：按主键只统计上次之后的新记录，跨日时重新统计"""
+        now = datetime.now()
+        # 操作时间为 UTC（CURRENT_TIMESTAMP），本地零点换算为 UTC
+        day_start = datetime.utcnow() - (now - now.replace(hour=0, minute=0, second=0, microsecond=0))
+        day = now.date()
+        if reset or day != self._day:
+            self._day = day
+            self.movements_today = 0
+            self._last_ids = {}
+            since = day_start.strftime(TIMESTAMP_FORMAT)
+            for table, key in (('stock_in', 'stock_in_id'), ('stock_out', 'stock_out_id')):
+                count, last_id = self.db.execute_query(
+                    f"SELECT COUNT(*), MAX({key}) FROM {table} WHERE operation_time >= ?", (since,))[0]
+                self.movements_today += count
+                self._last_ids[table] = last_id or self.db.execute_query(
+                    f"SELECT COALESCE(MAX({key}), 0) FROM {table}")[0][0]
+            return
+        for table, key in (('stock_in', 'stock_in_id'), ('stock_out', 'stock_out_id')):
+            count, last_id = self.db.execute_query(
+                f"SELECT COUNT(*), MAX({key}) FROM {table} WHERE {key} > ?", (self._last_ids[table],))[0]
+            if count:
+                self.movements_today += count
+                self._last_ids[table] = last_id
+
+    def get_kpis(self) -> Dict:
+        counts = self.model.get_status_counts()
+        return {
+            'total_value': round(self.total_value, 2),
+            'low_stock': counts[STATUS_LOW],
+            'high_stock': counts[STATUS_HIGH],
+            'movements_today': self.movements_today,
+        }
+
+    def poll(self) -> Optional[Dict]:
+        """取上次轮询之后的变化；没有变化时返回 None（只比较一次 data_version）
+
+        Returns:
+            {'changed': 变化物资的 ItemStatusRecord 列表, 'kpis': 指标, 'seconds': 耗时}
+        """
+        started = time.perf_counter()
+        changed = self.model.take_changes()
+        if not changed and self._day == datetime.now().date():
+            return None
+        rows = self.model.get_items(changed)
+        self._refresh_values([row.item_id for row in rows])
+        self._count_movements_today()
+        return {
+            'changed': rows,
+            'kpis': self.get_kpis(),
+            'seconds': round(time.perf_counter() - started, 6),
+        }
@@ -1,19 +1,395 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import query_stats
+from query_builder import ItemFilter, STATUS_VALUES, build_query
+from query_stats import InstrumentedConnection, QueryStats
+from records import Record, record_type
+
+# 时间戳统一使用与 CURRENT_TIMESTAMP 相同的文本格式，保证字符串比较即时间比较
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 默认库位：未指定库位的入库和历史库存行都归入该库位
+DEFAULT_LOCATION = '主仓库'
+
+# 并发写入：连接等待写锁的超时（busy_timeout，毫秒），超时后回滚并按抖动指数退避重试整个事务
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.05  # 第 n 次重试前等待 RETRY_BASE_DELAY * 2^n 秒的 50%~100%
+RETRY_MAX_DELAY = 2.0
+
+# 可归档的流水表 -> 主键（maintenance.archive_ledgers 按操作时间迁入归档库，出库批次分配随出库记录迁移）
+ARCHIVED_LEDGERS = {'stock_in': 'stock_in_id', 'stock_out': 'stock_out_id', 'stock_transfers': 'transfer_id'}
+ARCHIVE_SUFFIX = "_archive.db"
+# 主库中的流水为热分区；归档库按年份分区（stock_in_2024、stock_out_allocations_2024 ...），
+# 分区的时间范围登记在归档库的 ledger_partitions，按时间范围查询时只读取有交集的分区
+LEDGER_PARTITION_KEY_SQL = "substr(operation_time, 1, 4)"
+# 出入库记录可排序列（均有索引，支持键集分页）
+LEDGER_SORT_COLUMNS = {
+    'stock_in': ('stock_in_id', 'operation_time'),
+    'stock_out': ('stock_out_id', 'operation_time'),
+}
+
+# 库存流水日志事件类型（数量为库存变化量，出库为负数）
+EVENT_OPENING = 'opening'  # 启用流水日志前已有的批次库存
+EVENT_STOCK_IN = 'stock_in'
+EVENT_STOCK_OUT = 'stock_out'
+EVENT_TRANSFER_OUT = 'transfer_out'
+EVENT_TRANSFER_IN = 'transfer_in'
+EVENT_TYPES = (EVENT_OPENING, EVENT_STOCK_IN, EVENT_STOCK_OUT, EVENT_TRANSFER_OUT, EVENT_TRANSFER_IN)
+
+# 出库批次分配策略：FEFO 先到期先出，FIFO 先入先出
+ALLOCATION_STRATEGIES = ("FEFO", "FIFO")
+# 分配时每次从批次查询中读取的行数
+ALLOCATION_FETCH_SIZE = 16
+
+# 采购单状态：草稿和已下单的采购单数量计入在途量
+PO_STATUS_DRAFT = '草稿'
+PO_STATUS_ORDERED = '已下单'
+PO_STATUS_RECEIVED = '已收货'
+PO_STATUS_CANCELLED = '已作废'
+PO_STATUSES = (PO_STATUS_DRAFT, PO_STATUS_ORDERED, PO_STATUS_RECEIVED, PO_STATUS_CANCELLED)
+PO_OPEN_STATUSES = (PO_STATUS_DRAFT, PO_STATUS_ORDERED)
+
+# 查询结果行类型（按字段名访问，兼容原来的字典写法）
+# 用户
+UserRecord = record_type('UserRecord', ('user_id', 'username', 'full_name', 'role', 'created_at'))
+# 类目
+CategoryRecord = record_type('CategoryRecord', (
+    'category_id', 'category_name', 'description', 'parent_category', 'created_at',
+))
+# 物资信息
+ItemRecord = record_type('ItemRecord', (
+    'item_id', 'item_code', 'item_name', 'category_name', 'specification', 'unit', 'supplier',
+    'purchase_price', 'selling_price', 'min_stock', 'max_stock', 'created_at',
+))
+# 库存状态（reorder_point 为实际使用的补货预警线：已计算补货点时取补货点，否则取最低库存）
+InventoryStatusRecord = record_type('InventoryStatusRecord', (
+    'item_id', 'item_code', 'item_name', 'category_name', 'unit', 'min_stock', 'max_stock',
+    'current_stock', 'status', 'reorder_point',
+))
+# 按库位透视的库存状态（location_stock 为 {库位: 数量}）
+LocationStatusRecord = record_type('LocationStatusRecord', InventoryStatusRecord._fields + ('location_stock',))
+# 库位库存余额
+LocationBalanceRecord = record_type('LocationBalanceRecord', (
+    'item_id', 'item_code', 'item_name', 'unit', 'location', 'quantity', 'batch_count',
+))
+# 库存调拨记录
+StockTransferRecord = record_type('StockTransferRecord', (
+    'transfer_id', 'item_name', 'quantity', 'unit', 'from_location', 'to_location',
+    'operation_time', 'operator', 'notes',
+))
+# 入库记录
+StockInRecord = record_type('StockInRecord', (
+    'stock_in_id', 'item_name', 'quantity', 'unit', 'unit_price', 'total_amount', 'supplier',
+    'batch_number', 'operation_time', 'operator',
+))
+# 出库记录
+StockOutRecord = record_type('StockOutRecord', (
+    'stock_out_id', 'item_name', 'quantity', 'unit', 'unit_price', 'total_amount', 'recipient',
+    'purpose', 'operation_time', 'operator', 'batches',
+))
+# 出库批次分配
+AllocationRecord = record_type('AllocationRecord', (
+    'allocation_id', 'inventory_id', 'item_id', 'batch_number', 'expiry_date', 'quantity',
+))
+# 采购单
+PurchaseOrderRecord = record_type('PurchaseOrderRecord', (
+    'po_id', 'supplier', 'status', 'line_count', 'total_amount', 'created_at', 'created_by',
+))
+# 采购单明细
+PurchaseOrderLineRecord = record_type('PurchaseOrderLineRecord', (
+    'line_id', 'po_id', 'item_id', 'item_code', 'item_name', 'unit', 'quantity', 'unit_price', 'amount',
+))
+# 库存流水日志事件
+JournalEventRecord = record_type('JournalEventRecord', (
+    'event_id', 'event_type', 'item_id', 'inventory_id', 'location', 'batch_number',
+    'production_date', 'expiry_date', 'quantity', 'ref_id', 'created_at',
+))
+# 近效期批次
+ExpiringBatchRecord = record_type('ExpiringBatchRecord', (
+    'inventory_id', 'item_id', 'item_code', 'item_name', 'unit', 'batch_number', 'quantity',
+    'expiry_date',
+))
+
+class CategoryTree:
+    """物资类目树（内存缓存），由一次查询的 (category_id, category_name, parent_category_id) 构建"""
+    
+    def __init__(self, rows: List[Tuple[int, str, Optional[int]]]):
+        self.names = {}  # category_id -> category_name
+        self.parents = {}  # category_id -> parent_category_id
+        self.children = {}  # category_id -> [子类目ID]
+        self.ids_by_name = {}  # category_name -> category_id
+        self._subtree_cache = {}
+        
+        for category_id, category_name, parent_category_id in rows:
+            self.names[category_id] = category_name
+            self.parents[category_id] = parent_category_id
+            self.ids_by_name[category_name] = category_id
+            self.children.setdefault(parent_category_id, []).append(category_id)
+    
+    def roots(self) -> List[int]:
+        """顶级类目（无父类目或父类目不存在）"""
+        return [category_id for category_id, parent_id in self.parents.items()
+                if parent_id is None or parent_id not in self.names]
+    
+    def subtree_ids(self, category_id: int) -> List[int]:
+        """返回类目自身及全部子孙类目的ID"""
+        if category_id not in self._subtree_cache:
+            result = []
+            visited = set()
+            stack = [category_id]
+            while stack:
+                current = stack.pop()
+                if current in visited or current not in self.names:
+                    continue  # 防止错误数据形成环
+                visited.add(current)
+                result.append(current)
+                stack.extend(reversed(self.children.get(current, [])))
+            self._subtree_cache[category_id] = result
+        return self._subtree_cache[category_id]
+    
+    def path(self, category_id: int) -> List[str]:
+        """从顶级类目到该类目的名称路径"""
+        names = []
+        visited = set()
+        while category_id in self.names and category_id not in visited:
+            visited.add(category_id)
+            names.append(self.names[category_id])
+            category_id = self.parents[category_id]
+        return list(reversed(names))
+
+
+def _is_busy_error(error: Exception) -> bool:
+    """是否为其他连接占用锁导致的错误（database is locked / database is busy）"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+class StorageProfile:
+    """存储参数（每个连接打开时设置）
+
+    Args:
+        mmap_size: 内存映射读取的最大字节数，0 表示不使用（读页直接映射文件，省去复制到页缓存）
+        cache_size_kb: 每个连接的页缓存上限（KB）
+        temp_store_memory: 排序、临时表放在内存中
+        page_size: 新建数据库的页大小，None 为 SQLite 默认（已有数据库不变）
+        persistent_reads: 查询复用每个线程的常驻连接，页缓存跨查询保留
+        prewarm_tables: prewarm() 预读到页缓存的表（连同其索引）
+    """
+
+    def __init__(self, mmap_size: int = 0, cache_size_kb: int = 2000, temp_store_memory: bool = False,
+                 page_size: Optional[int] = None, persistent_reads: bool = False,
+                 prewarm_tables: Sequence[str] = ()):
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.temp_store_memory = temp_store_memory
+        self.page_size = page_size
+        self.persistent_reads = persistent_reads
+        self.prewarm_tables = tuple(prewarm_tables)
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+
+# 存储配置：default 为 SQLite 默认参数、每次查询新建连接（旧行为）；
+# balanced 适合日常使用；large 适合数十万物资、上 GB 的数据库
+STORAGE_PROFILES = {
+    'default': StorageProfile(),
+    'balanced': StorageProfile(mmap_size=256 * 1024 ** 2, cache_size_kb=64 * 1024, temp_store_memory=True,
+                               persistent_reads=True,
+                               prewarm_tables=('categories', 'items', 'item_replenishment', 'inventory')),
+    'large': StorageProfile(mmap_size=4 * 1024 ** 3, cache_size_kb=512 * 1024, temp_store_memory=True,
+                            page_size=8192, persistent_reads=True,
+                            prewarm_tables=('categories', 'items', 'item_replenishment', 'inventory',
+                                            'item_balances', 'stock_alerts')),
+}
+DEFAULT_STORAGE_PROFILE = 'balanced'
+
+
+class ContentionStats:
+    """写事务锁竞争统计
+
+    lock_wait 为 BEGIN IMMEDIATE 等待写锁的时间（busy_timeout 内的等待），
+    backoff 为拿不到锁回滚后退避等待的时间；failures 为重试次数用尽仍失败的事务数。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.transactions = 0
+            self.retries = 0
+            self.failures = 0
+            self.lock_wait = 0.0
+            self.max_lock_wait = 0.0
+            self.backoff = 0.0
+
+    def record_lock_wait(self, seconds: float):
+        with self._lock:
+            self.transactions += 1
+            self.lock_wait += seconds
+            if seconds > self.max_lock_wait:
+                self.max_lock_wait = seconds
+
+    def record_retry(self, delay: float):
+        with self._lock:
+            self.retries += 1
+            self.backoff += delay
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'transactions': self.transactions,
+                'retries': self.retries,
+                'failures': self.failures,
+                'lock_wait_ms': round(self.lock_wait * 1000, 3),
+                'avg_lock_wait_ms': round(self.lock_wait * 1000 / self.transactions, 3) if self.transactions else 0.0,
+                'max_lock_wait_ms': round(self.max_lock_wait * 1000, 3),
+                'backoff_ms': round(self.backoff * 1000, 3),
+            }
+
 
 class DatabaseManager:
     """库存管理系统数据库管理器"""
     
-    def __init__(self, db_path: str = "inventory.db"):
+    def __init__(self, db_path: str = "inventory.db", stats: Optional[QueryStats] = None,
+                 busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS, max_retries: int = DEFAULT_MAX_RETRIES,
+                 journal_mode: Optional[str] = "WAL",
+                 storage_profile: Union[str, StorageProfile] = DEFAULT_STORAGE_PROFILE):
+        """
+        Args:
+            stats: SQL 执行统计，None 时使用 query_stats.enable() 开启的进程级统计（未开启则不统计）
+            busy_timeout_ms: 写锁被其他连接占用时每次等待的最长时间（毫秒）
+            max_retries: 等待超时后写事务的最多重试次数
+            journal_mode: 日志模式，默认 WAL（读写互不阻塞，多个进程可同时读写）；None 表示不修改
+            storage_profile: 存储配置（STORAGE_PROFILES 中的名称或 StorageProfile）
+        """
         self.db_path = db_path
-        self._init_database()
+        self.stats = stats
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_retries = max_retries
+        self.journal_mode = journal_mode.upper() if journal_mode else None
+        # 归档库：与主库同目录，如 inventory.db -> inventory_archive.db
+        self.archive_path = os.path.splitext(db_path)[0] + ARCHIVE_SUFFIX
+        if isinstance(storage_profile, str):
+            storage_profile = STORAGE_PROFILES[storage_profile]
+        self.storage_profile = storage_profile
+        self.contention = ContentionStats()
+        self._category_tree = None
+        # 每个线程一个常驻读连接（sqlite3 连接不能跨线程使用）
+        self._local = threading.local()
+        # 出入库、调拨提交后调用的监听器（进程内读模型写穿）
+        self._movement_listeners = []
+        # 多个进程同时启动时建表和迁移也会争用写锁
+        self._retry_on_busy(self._init_database)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接；开启统计时使用记录耗时的连接"""
+        timeout = self.busy_timeout_ms / 1000.0
+        stats = self.stats or query_stats.get_active_stats()
+        if stats is None:
+            conn = sqlite3.connect(self.db_path, timeout=timeout)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=timeout, factory=InstrumentedConnection)
+            conn.stats = stats
+        if self.journal_mode == "WAL":
+            # WAL 下 NORMAL 只在检查点时同步磁盘，断电最多丢失最近提交的事务，不会损坏数据库
+            conn.execute("PRAGMA synchronous = NORMAL")
+        profile = self.storage_profile
+        if profile.mmap_size:
+            conn.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(profile.cache_size_kb)}")
+        if profile.temp_store_memory:
+            conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+    
+    def _read_connection(self) -> sqlite3.Connection:
+        """当前线程的常驻读连接（统计开关变化后重新打开，使新连接按当前统计设置记录）"""
+        stats = self.stats or query_stats.get_active_stats()
+        cached = getattr(self._local, 'connection', None)
+        if cached is not None and cached[1] is stats:
+            return cached[0]
+        if cached is not None:
+            cached[0].close()
+        conn = self._connect()
+        self._local.connection = (conn, stats)
+        return conn
+    
+    def close(self):
+        """关闭当前线程的常驻读连接（其他线程的连接随线程结束回收）"""
+        cached = getattr(self._local, 'connection', None)
+        if cached is not None:
+            cached[0].close()
+            self._local.connection = None
+    
+    def prewarm(self, tables: Optional[Sequence[str]] = None) -> Dict:
+        """把常用表及其索引整体读入常驻读连接的页缓存（和操作系统文件缓存），首次查询不再等磁盘
+        
+        Returns:
+            {'tables': 预读的表数, 'indexes': 预读的索引数, 'seconds'}
+        """
+        started = time.perf_counter()
+        tables = self.storage_profile.prewarm_tables if tables is None else tables
+        conn = self._read_connection() if self.storage_profile.persistent_reads else self._connect()
+        warmed_tables = warmed_indexes = 0
+        try:
+            for table in tables:
+                indexes = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,))]
+                if not indexes and not conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                    continue
+                # COUNT(*) 逐页遍历 B 树：NOT INDEXED 读表本身，INDEXED BY 读每个索引
+                conn.execute(f"SELECT COUNT(*) FROM {table} NOT INDEXED").fetchall()
+                warmed_tables += 1
+                for index in indexes:
+                    conn.execute(f"SELECT COUNT(*) FROM {table} INDEXED BY {index}").fetchall()
+                    warmed_indexes += 1
+        finally:
+            if not self.storage_profile.persistent_reads:
+                conn.close()
+        return {
+            'tables': warmed_tables,
+            'indexes': warmed_indexes,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+    
+    def _set_journal_mode(self, cursor: sqlite3.Cursor):
+        """设置日志模式（WAL 记录在数据库文件中，只需设置一次）
+
+        切换模式需要独占数据库；其他进程正在使用旧模式时保持原模式，下次启动再切换。
+        """
+        if not self.journal_mode:
+            return
+        try:
+            cursor.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        except sqlite3.OperationalError as e:
+            if not _is_busy_error(e):
+                raise
     
     def _init_database(self):
         """初始化数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        if self.storage_profile.page_size:
+            # 页大小只对新建的数据库生效，须在其他设置读取数据库头之前设置
+            cursor.execute(f"PRAGMA page_size = {int(self.storage_profile.page_size)}")
+        # 新建的数据库启用增量清理（已有表的数据库须整库 VACUUM 一次才能切换，见 maintenance.py）
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._set_journal_mode(cursor)
         
         # 创建用户表
         cursor.execute('''
@@ -65,10 +441,11 @@ class DatabaseManager:
                 inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 item_id INTEGER NOT NULL,
                 quantity INTEGER NOT NULL DEFAULT 0,
-                location TEXT,
+                location TEXT DEFAULT '主仓库',
                 batch_number TEXT,
                 production_date DATE,
                 expiry_date DATE,
+                unit_cost REAL,
                 status TEXT DEFAULT '正常',
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -114,15 +491,371 @@ class DatabaseManager:
             )
         ''')
         
+        # 创建出库批次分配表（出库记录与所消耗批次的追溯关系）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_out_allocations (
+                allocation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stock_out_id INTEGER NOT NULL,
+                inventory_id INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                batch_number TEXT,
+                expiry_date DATE,
+                quantity INTEGER NOT NULL,
+                unit_cost REAL,
+                FOREIGN KEY (stock_out_id) REFERENCES stock_out (stock_out_id),
+                FOREIGN KEY (item_id) REFERENCES items (item_id)
+            )
+        ''')
+        
+        # 创建库存快照表（定期检查点，用于历史时点库存重建）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                snapshot_time DATETIME NOT NULL UNIQUE,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshot_items (
+                snapshot_id INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (snapshot_id, item_id),
+                FOREIGN KEY (snapshot_id) REFERENCES stock_snapshots (snapshot_id),
+                FOREIGN KEY (item_id) REFERENCES items (item_id)
+            )
+        ''')
+        
+        # 创建供应商交货期表（补货点计算使用，未登记的供应商使用默认交货期）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS supplier_lead_times (
+                supplier TEXT PRIMARY KEY,
+                lead_time_days REAL NOT NULL,
+                lead_time_std_days REAL NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 创建物资补货参数表（由历史出库需求计算的安全库存和补货点）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS item_replenishment (
+                item_id INTEGER PRIMARY KEY,
+                avg_daily_demand REAL NOT NULL,
+                demand_std REAL NOT NULL,
+                lead_time_days REAL NOT NULL,
+                safety_stock INTEGER NOT NULL,
+                reorder_point INTEGER NOT NULL,
+                computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (item_id) REFERENCES items (item_id)
+            )
+        ''')
+        
+        # 创建后台任务水位表（记录增量任务已处理到的流水ID）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_watermarks (
+                job_name TEXT PRIMARY KEY,
+                last_stock_in_id INTEGER NOT NULL DEFAULT 0,
+                last_stock_out_id INTEGER NOT NULL DEFAULT 0,
+                last_run DATETIME
+            )
+        ''')
+        
+        # 创建库存调拨记录表（调拨只改变库位，不改变总库存，不计入出入库流水）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_transfers (
+                transfer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                from_location TEXT NOT NULL,
+                to_location TEXT NOT NULL,
+                operator_id INTEGER,
+                operation_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                notes TEXT,
+                FOREIGN KEY (item_id) REFERENCES items (item_id),
+                FOREIGN KEY (operator_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # 出入库记录的库位（旧数据库补充列）
+        self._ensure_column(cursor, 'stock_in', 'location', 'TEXT')
+        self._ensure_column(cursor, 'stock_out', 'location', 'TEXT')
+        # 批次成本：每个批次库存行带有成本（合并入库时加权平均），出库分配记录消耗的批次成本（旧数据库补充列）
+        self._ensure_column(cursor, 'inventory', 'unit_cost', 'REAL')
+        self._ensure_column(cursor, 'stock_out_allocations', 'unit_cost', 'REAL')
+        # 旧数据库中未记录库位的库存行归入默认库位
+        cursor.execute('''
+            UPDATE inventory SET location = ? WHERE location IS NULL
+        ''', (DEFAULT_LOCATION,))
+        
+        # 创建采购单表（草稿由采购建议生成，未收货/未作废的采购单数量计入在途量）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS purchase_orders (
+                po_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                supplier TEXT,
+                status TEXT NOT NULL DEFAULT '草稿',
+                line_count INTEGER NOT NULL DEFAULT 0,
+                total_amount REAL NOT NULL DEFAULT 0,
+                created_by INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (created_by) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # 创建采购单明细表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS purchase_order_lines (
+                line_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                po_id INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                unit_price REAL NOT NULL DEFAULT 0,
+                amount REAL NOT NULL DEFAULT 0,
+                FOREIGN KEY (po_id) REFERENCES purchase_orders (po_id),
+                FOREIGN KEY (item_id) REFERENCES items (item_id)
+            )
+        ''')
+        
+        # 创建库存流水日志（只追加，库存变化的唯一事实来源）
+        # 每个事件对应一个批次库存行（inventory_id）的变化，批次属性取该库存行的值，
+        # 按 inventory_id 汇总即可重建 inventory 表；ref_id 为入库/出库/调拨记录ID，
+        # unit_cost 为事件发生后该批次的成本
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS movement_journal (
+                event_id INTEGER PRIMARY KEY,
+                event_type TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                inventory_id INTEGER NOT NULL,
+                location TEXT NOT NULL,
+                batch_number TEXT,
+                production_date DATE,
+                expiry_date DATE,
+                quantity INTEGER NOT NULL,
+                ref_id INTEGER,
+                unit_cost REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._ensure_column(cursor, 'movement_journal', 'unit_cost', 'REAL')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_movement_journal_item
+            ON movement_journal (item_id, event_id)
+        ''')
+        
+        # 流水日志投影（由 journal.JournalProjector 按检查点增量更新）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS projection_checkpoints (
+                projection TEXT PRIMARY KEY,
+                last_event_id INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS item_balances (
+                item_id INTEGER PRIMARY KEY,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                last_event_id INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_alerts (
+                item_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                reorder_point REAL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 移动加权平均成本（出入库时在同一事务中更新，见 _apply_moving_average）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS item_valuation (
+                item_id INTEGER PRIMARY KEY,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                total_cost REAL NOT NULL DEFAULT 0,
+                average_cost REAL NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 先进先出成本层：每笔入库一行（入库数量、剩余数量、入库单价），出库按 layer_id 顺序消耗
+        # （见 _consume_cost_layers），与批次分配在同一事务中完成
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cost_layers (
+                layer_id INTEGER PRIMARY KEY,
+                item_id INTEGER NOT NULL,
+                stock_in_id INTEGER,
+                quantity INTEGER NOT NULL,
+                remaining INTEGER NOT NULL,
+                unit_cost REAL NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # 只索引未消耗完的成本层（覆盖剩余数量和单价，出库消耗和估值汇总无需回表）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cost_layers_open
+            ON cost_layers (item_id, layer_id, remaining, unit_cost) WHERE remaining > 0
+        ''')
+        
+        # 批次库存索引：按 (物资, 库位) 汇总库位库存、定位入库批次，按有效期/生产日期顺序分配出库批次
+        cursor.execute('DROP INDEX IF EXISTS idx_inventory_item_batch')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inventory_item_location
+            ON inventory (item_id, location, batch_number)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inventory_item_expiry
+            ON inventory (item_id, expiry_date, production_date)
+        ''')
+        # 有效期范围索引（附带 updated_at，增量扫描变更批次时无需回表）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inventory_expiry
+            ON inventory (expiry_date, updated_at)
+        ''')
+        # 物资按类目筛选（类目子树 IN 查询）和按供应商筛选
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_items_category
+            ON items (category_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_items_supplier
+            ON items (supplier)
+        ''')
+        # 按物资名称排序的键集分页（隐含 item_id）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_items_name
+            ON items (item_name)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_allocations_stock_out
+            ON stock_out_allocations (stock_out_id)
+        ''')
+        # 采购单按状态筛选；在途量按物资汇总（覆盖 quantity，无需回表）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_purchase_orders_status
+            ON purchase_orders (status)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_purchase_order_lines_po
+            ON purchase_order_lines (po_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_purchase_order_lines_item
+            ON purchase_order_lines (item_id, po_id, quantity)
+        ''')
+        
+        # 出入库流水的时间索引（覆盖 item_id 和 quantity，回放增量时无需回表）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_in_time
+            ON stock_in (operation_time, item_id, quantity)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_in_item_time
+            ON stock_in (item_id, operation_time, quantity)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_out_time
+            ON stock_out (operation_time, item_id, quantity)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_out_item_time
+            ON stock_out (item_id, operation_time, quantity)
+        ''')
+        
+        self._seed_valuation(cursor)
+        self._seed_cost_layers(cursor)
+        self._seed_journal(cursor)
+        
         conn.commit()
         conn.close()
         
         # 插入默认管理员用户
         self._create_default_admin()
     
+    @staticmethod
+    def _seed_journal(cursor: sqlite3.Cursor):
+        """流水日志为空而已有批次库存时（旧数据库、批量生成的数据），把现有批次记为期初事件"""
+        cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM movement_journal), EXISTS (SELECT 1 FROM inventory)
+        ''')
+        has_events, has_inventory = cursor.fetchone()
+        if has_events or not has_inventory:
+            return
+        cursor.execute('''
+            INSERT INTO movement_journal (event_type, item_id, inventory_id, location, batch_number,
+                                          production_date, expiry_date, quantity, unit_cost)
+            SELECT ?, item_id, inventory_id, location, batch_number, production_date, expiry_date, quantity,
+                   unit_cost
+            FROM inventory
+            WHERE quantity != 0
+            ORDER BY inventory_id
+        ''', (EVENT_OPENING,))
+    
+    @staticmethod
+    def _seed_valuation(cursor: sqlite3.Cursor):
+        """还没有成本数据而已有批次库存时（旧数据库、批量生成的数据）建立期初成本
+        
+        批次成本取该批次最近一次入库的单价，没有入库记录时取物资进价；移动平均成本按批次成本汇总。
+        """
+        cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM item_valuation), EXISTS (SELECT 1 FROM inventory)
+        ''')
+        has_valuation, has_inventory = cursor.fetchone()
+        if has_valuation or not has_inventory:
+            return
+        cursor.execute('''
+            UPDATE inventory SET unit_cost = COALESCE(
+                (SELECT s.unit_price FROM stock_in s
+                 WHERE s.item_id = inventory.item_id AND s.batch_number = inventory.batch_number
+                 ORDER BY s.operation_time DESC LIMIT 1),
+                (SELECT i.purchase_price FROM items i WHERE i.item_id = inventory.item_id),
+                0)
+            WHERE unit_cost IS NULL
+        ''')
+        # 加列之前记下的流水事件同样补上批次成本，由流水重建批次库存时成本不丢失
+        cursor.execute('''
+            UPDATE movement_journal SET unit_cost = (
+                SELECT inv.unit_cost FROM inventory inv WHERE inv.inventory_id = movement_journal.inventory_id)
+            WHERE unit_cost IS NULL
+        ''')
+        cursor.execute('''
+            INSERT INTO item_valuation (item_id, quantity, total_cost, average_cost)
+            SELECT item_id, SUM(quantity), SUM(quantity * unit_cost), SUM(quantity * unit_cost) / SUM(quantity)
+            FROM inventory
+            GROUP BY item_id
+            HAVING SUM(quantity) > 0
+        ''')
+    
+    @staticmethod
+    def _seed_cost_layers(cursor: sqlite3.Cursor):
+        """还没有先进先出成本层而已有批次库存时，每个批次库存行记为一个期初成本层（按 inventory_id 先后）
+        
+        须在 _seed_valuation 补齐批次成本之后调用。
+        """
+        cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM cost_layers), EXISTS (SELECT 1 FROM inventory)
+        ''')
+        has_layers, has_inventory = cursor.fetchone()
+        if has_layers or not has_inventory:
+            return
+        cursor.execute('''
+            INSERT INTO cost_layers (item_id, quantity, remaining, unit_cost, created_at)
+            SELECT item_id, quantity, quantity, COALESCE(unit_cost, 0), COALESCE(created_at, CURRENT_TIMESTAMP)
+            FROM inventory
+            WHERE quantity > 0
+            ORDER BY inventory_id
+        ''')
+    
+    @staticmethod
+    def _ensure_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+        """旧数据库缺少列时补充（CREATE TABLE IF NOT EXISTS 不会修改已有表）"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
     def _create_default_admin(self):
         """创建默认管理员用户"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # 检查是否已存在管理员用户
@@ -136,22 +869,97 @@ class DatabaseManager:
         conn.commit()
         conn.close()
     
-    def execute_query(self, query: str, params: Tuple = ()):
-        """执行查询并返回结果"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchall()
-        conn.close()
-        return result
+    def execute_query(self, query: str, params: Tuple = (), attach_archive: bool = False):
+        """执行查询并返回结果（attach_archive 为 True 时把归档库附加为 archive）
+        
+        存储配置开启常驻读连接时在当前线程的常驻连接上执行（附加归档库的查询仍用临时连接）。
+        """
+        if self.storage_profile.persistent_reads and not attach_archive:
+            cursor = self._read_connection().cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        conn = self._connect()
+        try:
+            if attach_archive:
+                conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            conn.close()
     
     def execute_update(self, query: str, params: Tuple = ()):
-        """执行更新操作"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        conn.close()
+        """执行更新操作（单条语句的写事务，锁竞争时同 run_in_transaction 重试）"""
+        self.run_in_transaction(lambda cursor: cursor.execute(query, params))
+    
+    def run_in_transaction(self, work: Callable[[sqlite3.Cursor], Any], attach_archive: bool = False) -> Any:
+        """在单个写事务中执行 work(cursor)，成功提交、异常回滚，返回 work 的结果
+
+        写锁被占用时 BEGIN IMMEDIATE 先按 busy_timeout 等待；仍拿不到锁则回滚，
+        按抖动指数退避后重新执行整个事务，最多重试 max_retries 次。
+        work 可能被执行多次，只能通过 cursor 读写数据，不能修改外部状态。
+        attach_archive 为 True 时在事务开始前把归档库附加为 archive。
+        """
+        return self._retry_on_busy(lambda: self._run_transaction_once(work, attach_archive))
+    
+    def _retry_on_busy(self, func: Callable[[], Any]) -> Any:
+        """执行 func()，锁竞争失败时按抖动指数退避重试"""
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except sqlite3.OperationalError as e:
+                if not _is_busy_error(e):
+                    raise
+                if attempt >= self.max_retries:
+                    self.contention.record_failure()
+                    raise
+            # 在 except 之外等待：异常回溯释放后，失败尝试中未关闭的连接随之关闭，不在退避期间占着锁
+            # 随机抖动避免多个等待者同时醒来再次冲突
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+            self.contention.record_retry(delay)
+            time.sleep(delay)
+            attempt += 1
+    
+    def _run_transaction_once(self, work: Callable[[sqlite3.Cursor], Any], attach_archive: bool = False) -> Any:
+        conn = self._connect()
+        try:
+            if attach_archive:
+                conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            self.contention.record_lock_wait(time.perf_counter() - started)
+            result = work(conn.cursor())
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def add_movement_listener(self, listener: Callable[[], None]):
+        """注册监听器：本管理器的出入库、调拨事务提交后调用 listener()"""
+        self._movement_listeners.append(listener)
+    
+    def remove_movement_listener(self, listener: Callable[[], None]):
+        if listener in self._movement_listeners:
+            self._movement_listeners.remove(listener)
+    
+    def _notify_movement(self):
+        """通知监听器（事务已提交，监听器出错不影响本次出入库的结果）"""
+        for listener in self._movement_listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"出入库监听器出错: {e}")
+    
+    def get_contention_stats(self) -> Dict:
+        """写事务锁竞争统计（本管理器发起的事务）"""
+        return self.contention.to_dict()
     
     # 用户管理相关方法
     def add_user(self, username: str, password: str, full_name: str, role: str) -> bool:
@@ -165,19 +973,13 @@ class DatabaseManager:
         except sqlite3.IntegrityError:
             return False
     
-    def get_users(self) -> List[Dict]:
+    def get_users(self) -> List[Record]:
         """获取所有用户"""
         result = self.execute_query('''
             SELECT user_id, username, full_name, role, created_at
             FROM users ORDER BY user_id
         ''')
-        return [{
-            'user_id': row[0],
-            'username': row[1],
-            'full_name': row[2],
-            'role': row[3],
-            'created_at': row[4]
-        } for row in result]
+        return UserRecord.from_rows(result)
     
     # 物资类目管理相关方法
     def add_category(self, category_name: str, description: str = "", parent_category_id: int = None) -> bool:
@@ -187,11 +989,29 @@ class DatabaseManager:
                 INSERT INTO categories (category_name, description, parent_category_id)
                 VALUES (?, ?, ?)
             ''', (category_name, description, parent_category_id))
+            self._category_tree = None  # 类目变化后重建缓存
             return True
         except sqlite3.IntegrityError:
             return False
     
-    def get_categories(self) -> List[Dict]:
+    def get_category_tree(self) -> CategoryTree:
+        """获取类目树缓存（首次调用或类目变化后用一次查询重建）"""
+        if self._category_tree is None:
+            result = self.execute_query('''
+                SELECT category_id, category_name, parent_category_id FROM categories
+            ''')
+            self._category_tree = CategoryTree(result)
+        return self._category_tree
+    
+    def get_category_subtree_ids(self, category_name: str) -> List[int]:
+        """按类目名称返回该类目及全部子孙类目的ID，名称不存在时返回空列表"""
+        tree = self.get_category_tree()
+        category_id = tree.ids_by_name.get(category_name)
+        if category_id is None:
+            return []
+        return tree.subtree_ids(category_id)
+    
+    def get_categories(self) -> List[Record]:
         """获取所有类目"""
         result = self.execute_query('''
             SELECT c.category_id, c.category_name, c.description, 
@@ -200,33 +1020,89 @@ class DatabaseManager:
             LEFT JOIN categories p ON c.parent_category_id = p.category_id
             ORDER BY c.category_id
         ''')
-        return [{
-            'category_id': row[0],
-            'category_name': row[1],
-            'description': row[2],
-            'parent_category': row[3],
-            'created_at': row[4]
-        } for row in result]
+        return CategoryRecord.from_rows(result)
     
     # 物资基本信息管理相关方法
     def add_item(self, item_code: str, item_name: str, category_id: int, 
                  specification: str = "", unit: str = "个", supplier: str = "",
                  purchase_price: float = 0.0, selling_price: float = 0.0,
-                 min_stock: int = 0, max_stock: int = 1000) -> bool:
-        """添加物资基本信息"""
+                 min_stock: int = 0, max_stock: int = 1000,
+                 item_id: Optional[int] = None) -> bool:
+        """添加物资基本信息（item_id 为 None 时自动分配，分片部署时由分片管理器指定）"""
         try:
             self.execute_update('''
-                INSERT INTO items (item_code, item_name, category_id, specification, 
+                INSERT INTO items (item_id, item_code, item_name, category_id, specification, 
                                  unit, supplier, purchase_price, selling_price, 
                                  min_stock, max_stock)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (item_code, item_name, category_id, specification, unit, 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (item_id, item_code, item_name, category_id, specification, unit, 
                   supplier, purchase_price, selling_price, min_stock, max_stock))
             return True
         except sqlite3.IntegrityError:
             return False
     
-    def get_items(self) -> List[Dict]:
+    def set_supplier_lead_time(self, supplier: str, lead_time_days: float,
+                               lead_time_std_days: float = 0.0) -> bool:
+        """登记供应商交货期（天）及其标准差，补货点计算使用"""
+        if lead_time_days < 0 or lead_time_std_days < 0:
+            return False
+        self.execute_update('''
+            INSERT INTO supplier_lead_times (supplier, lead_time_days, lead_time_std_days, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(supplier) DO UPDATE SET
+                lead_time_days = excluded.lead_time_days,
+                lead_time_std_days = excluded.lead_time_std_days,
+                updated_at = excluded.updated_at
+        ''', (supplier, lead_time_days, lead_time_std_days))
+        return True
+    
+    def get_supplier_lead_times(self) -> Dict[str, Tuple[float, float]]:
+        """返回 {供应商: (交货期天数, 交货期标准差)}"""
+        result = self.execute_query('''
+            SELECT supplier, lead_time_days, lead_time_std_days FROM supplier_lead_times
+        ''')
+        return {row[0]: (row[1], row[2]) for row in result}
+    
+    def get_purchase_orders(self, status: Optional[str] = None) -> List[Record]:
+        """获取采购单（按单号倒序），status 为 None 时返回全部"""
+        result = self.execute_query('''
+            SELECT p.po_id, COALESCE(p.supplier, '未指定供应商'), p.status, p.line_count,
+                   p.total_amount, p.created_at, u.full_name
+            FROM purchase_orders p
+            LEFT JOIN users u ON p.created_by = u.user_id
+            WHERE ? IS NULL OR p.status = ?
+            ORDER BY p.po_id DESC
+        ''', (status, status))
+        return PurchaseOrderRecord.from_rows(result)
+    
+    def get_purchase_order_lines(self, po_id: int) -> List[Record]:
+        """获取采购单明细"""
+        result = self.execute_query('''
+            SELECT l.line_id, l.po_id, l.item_id, i.item_code, i.item_name, i.unit,
+                   l.quantity, l.unit_price, l.amount
+            FROM purchase_order_lines l
+            JOIN items i ON l.item_id = i.item_id
+            WHERE l.po_id = ?
+            ORDER BY l.line_id
+        ''', (po_id,))
+        return PurchaseOrderLineRecord.from_rows(result)
+    
+    def set_purchase_order_status(self, po_id: int, status: str) -> bool:
+        """修改采购单状态；已收货/已作废的采购单不能再修改"""
+        if status not in PO_STATUSES:
+            return False
+        placeholders = ", ".join("?" * len(PO_OPEN_STATUSES))
+        
+        def work(cursor):
+            cursor.execute(f'''
+                UPDATE purchase_orders SET status = ?
+                WHERE po_id = ? AND status IN ({placeholders})
+            ''', (status, po_id) + PO_OPEN_STATUSES)
+            return cursor.rowcount > 0
+        
+        return self.run_in_transaction(work)
+    
+    def get_items(self) -> List[Record]:
         """获取所有物资信息"""
         result = self.execute_query('''
             SELECT i.item_id, i.item_code, i.item_name, c.category_name, 
@@ -236,309 +1112,845 @@ class DatabaseManager:
             JOIN categories c ON i.category_id = c.category_id
             ORDER BY i.item_id
         ''')
-        return [{
-            'item_id': row[0],
-            'item_code': row[1],
-            'item_name': row[2],
-            'category_name': row[3],
-            'specification': row[4],
-            'unit': row[5],
-            'supplier': row[6],
-            'purchase_price': row[7],
-            'selling_price': row[8],
-            'min_stock': row[9],
-            'max_stock': row[10],
-            'created_at': row[11]
-        } for row in result]
-
-    def search_items(self, keyword: str = "", category_filter: str = "全部", supplier_filter: str = "全部") -> List[Dict]:
-        """按物资代码、名称、类目、供应商搜索物资"""
-        query = '''
-            SELECT i.item_id, i.item_code, i.item_name, c.category_name, 
-                   i.specification, i.unit, i.supplier, i.purchase_price, 
-                   i.selling_price, i.min_stock, i.max_stock, i.created_at
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            WHERE 1=1
-        '''
-        params = []
-        
-        if keyword:
-            query += " AND (i.item_code LIKE ? OR i.item_name LIKE ?)"
-            params.extend([f'%{keyword}%', f'%{keyword}%'])
-        
+        return ItemRecord.from_rows(result)
+
+    def _resolve_item_filter(self, keyword: str = "", category_filter: str = "全部",
+                             supplier_filter: str = "全部", status_filter: str = "全部") -> ItemFilter:
+        """将界面上的名称条件解析为键值条件（类目名称展开为子树类目ID）"""
+        category_ids = None
         if category_filter != "全部":
-            query += " AND c.category_name = ?"
-            params.append(category_filter)
-        
-        if supplier_filter != "全部":
-            query += " AND i.supplier = ?"
-            params.append(supplier_filter)
+            category_ids = self.get_category_subtree_ids(category_filter)
         
-        query += " ORDER BY i.item_id"
+        return ItemFilter(
+            keyword=keyword,
+            category_ids=category_ids,
+            supplier=supplier_filter if supplier_filter != "全部" else None,
+            status=status_filter if status_filter in STATUS_VALUES else None
+        )
+    
+    def search_items(self, keyword: str = "", category_filter: str = "全部", supplier_filter: str = "全部",
+                     sort_by: str = "item_id", descending: bool = False,
+                     after: Tuple = None, limit: int = None) -> List[Record]:
+        """按物资代码、名称、类目、供应商搜索物资
         
+        Args:
+            sort_by: 排序列（见 query_builder.ITEM_SORT_COLUMNS）
+            after: 键集分页，上一页最后一行的 (排序列值, item_id)
+            limit: 每页行数，None 表示返回全部
+        """
+        item_filter = self._resolve_item_filter(keyword, category_filter, supplier_filter)
+        query, params = build_query('items', item_filter, sort_by, descending, after, limit)
         result = self.execute_query(query, params)
-        return [{
-            'item_id': row[0],
-            'item_code': row[1],
-            'item_name': row[2],
-            'category_name': row[3],
-            'specification': row[4],
-            'unit': row[5],
-            'supplier': row[6],
-            'purchase_price': row[7],
-            'selling_price': row[8],
-            'min_stock': row[9],
-            'max_stock': row[10],
-            'created_at': row[11]
-        } for row in result]
-
-    def search_inventory_status(self, keyword: str = "", category_filter: str = "全部", status_filter: str = "全部") -> List[Dict]:
-        """按物资代码、名称、类目、状态搜索库存状态"""
-        query = '''
-            SELECT i.item_id, i.item_code, i.item_name, c.category_name, 
-                   i.unit, i.min_stock, i.max_stock,
-                   COALESCE(SUM(inv.quantity), 0) as current_stock,
-                   CASE 
-                       WHEN COALESCE(SUM(inv.quantity), 0) <= i.min_stock THEN '库存不足'
-                       WHEN COALESCE(SUM(inv.quantity), 0) >= i.max_stock THEN '库存过高'
-                       ELSE '正常'
-                   END as status
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            LEFT JOIN inventory inv ON i.item_id = inv.item_id
-            WHERE 1=1
-        '''
-        params = []
-        
-        if keyword:
-            query += " AND (i.item_code LIKE ? OR i.item_name LIKE ?)"
-            params.extend([f'%{keyword}%', f'%{keyword}%'])
-        
-        if category_filter != "全部":
-            query += " AND c.category_name = ?"
-            params.append(category_filter)
-        
-        query += " GROUP BY i.item_id"
-        
-        # 如果指定了状态筛选，需要在HAVING子句中处理
-        if status_filter != "全部":
-            if status_filter == "库存不足":
-                query += " HAVING current_stock <= i.min_stock"
-            elif status_filter == "库存过高":
-                query += " HAVING current_stock >= i.max_stock"
-            elif status_filter == "正常":
-                query += " HAVING current_stock > i.min_stock AND current_stock < i.max_stock"
-        
-        query += " ORDER BY i.item_id"
+        return ItemRecord.from_rows(result)
+
+    def search_inventory_status(self, keyword: str = "", category_filter: str = "全部", status_filter: str = "全部",
+                                sort_by: str = "item_id", descending: bool = False,
+                                after: Tuple = None, limit: int = None) -> List[Record]:
+        """按物资代码、名称、类目、状态搜索库存状态
         
+        状态条件按物资逐行判断，不再对全部物资聚合后用 HAVING 过滤；
+        分页参数同 search_items（排序列见 query_builder.STATUS_SORT_COLUMNS）。
+        """
+        item_filter = self._resolve_item_filter(keyword, category_filter, status_filter=status_filter)
+        query, params = build_query('status', item_filter, sort_by, descending, after, limit)
         result = self.execute_query(query, params)
         
-        return [{
-            'item_id': row[0],
-            'item_code': row[1],
-            'item_name': row[2],
-            'category_name': row[3],
-            'unit': row[4],
-            'min_stock': row[5],
-            'max_stock': row[6],
-            'current_stock': row[7],
-            'status': row[8]
-        } for row in result]
+        return InventoryStatusRecord.from_rows(result)
     
     # 库存管理相关方法
     def stock_in(self, item_id: int, quantity: int, unit_price: float, 
                  supplier: str = "", batch_number: str = "", 
                  production_date: str = None, expiry_date: str = None,
-                 operator_id: int = 1, notes: str = "") -> bool:
-        """物资入库"""
+                 operator_id: int = 1, notes: str = "",
+                 location: str = DEFAULT_LOCATION) -> bool:
+        """物资入库（入到 location 库位）"""
+        if quantity <= 0:
+            return False
+        
         try:
             total_amount = quantity * unit_price
+            # 空字符串日期按未填写处理，保证批次分配时排序一致
+            production_date = production_date or None
+            expiry_date = expiry_date or None
+            location = location or DEFAULT_LOCATION
             
-            # 添加入库记录
-            self.execute_update('''
-                INSERT INTO stock_in (item_id, quantity, unit_price, total_amount,
-                                    supplier, batch_number, production_date, expiry_date,
-                                    operator_id, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (item_id, quantity, unit_price, total_amount, supplier, 
-                  batch_number, production_date, expiry_date, operator_id, notes))
-            
-            # 更新库存
-            self._update_inventory(item_id, quantity, batch_number, 
-                                 production_date, expiry_date)
+            def work(cursor):
+                # 添加入库记录
+                cursor.execute('''
+                    INSERT INTO stock_in (item_id, quantity, unit_price, total_amount,
+                                        supplier, batch_number, production_date, expiry_date,
+                                        operator_id, notes, location)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (item_id, quantity, unit_price, total_amount, supplier, 
+                      batch_number, production_date, expiry_date, operator_id, notes, location))
+                stock_in_id = cursor.lastrowid
+                
+                # 更新库存
+                self._update_inventory(cursor, item_id, quantity, batch_number, 
+                                       production_date, expiry_date, location,
+                                       EVENT_STOCK_IN, stock_in_id, unit_price)
+                self._apply_moving_average(cursor, item_id, quantity, unit_price)
+                cursor.execute('''
+                    INSERT INTO cost_layers (item_id, stock_in_id, quantity, remaining, unit_cost)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (item_id, stock_in_id, quantity, quantity, unit_price))
             
-            return True
+            self.run_in_transaction(work)
         except Exception as e:
             print(f"入库失败: {e}")
             return False
+        self._notify_movement()
+        return True
     
     def stock_out(self, item_id: int, quantity: int, unit_price: float,
                   recipient: str = "", purpose: str = "", 
-                  operator_id: int = 1, notes: str = "") -> bool:
-        """物资出库"""
+                  operator_id: int = 1, notes: str = "",
+                  strategy: str = "FEFO", location: Optional[str] = None) -> bool:
+        """物资出库
+        
+        按 strategy 从批次库存中分配出库数量：FEFO 先到期先出，FIFO 先入先出。
+        location 为 None 时从全部库位分配，否则只从该库位分配。
+        检查库存、写出库记录、扣减批次在同一事务中完成。
+        """
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise ValueError(f"不支持的出库策略: {strategy}")
+        if quantity <= 0:
+            return False
+        
         try:
-            # 检查库存是否足够
-            current_stock = self.get_current_stock(item_id)
-            if current_stock < quantity:
-                return False
-            
             total_amount = quantity * unit_price
             
-            # 添加出库记录
-            self.execute_update('''
-                INSERT INTO stock_out (item_id, quantity, unit_price, total_amount,
-                                     recipient, purpose, operator_id, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (item_id, quantity, unit_price, total_amount, 
-                  recipient, purpose, operator_id, notes))
-            
-            # 更新库存
-            self._update_inventory(item_id, -quantity)
+            def work(cursor):
+                # 检查库存是否足够
+                if self._stock_level(cursor, item_id, location) < quantity:
+                    return False
+                
+                # 添加出库记录
+                cursor.execute('''
+                    INSERT INTO stock_out (item_id, quantity, unit_price, total_amount,
+                                         recipient, purpose, operator_id, notes, location)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (item_id, quantity, unit_price, total_amount, 
+                      recipient, purpose, operator_id, notes, location))
+                stock_out_id = cursor.lastrowid
+                
+                # 分配并扣减批次库存
+                allocations = self._allocate_batches(cursor, item_id, quantity, strategy, location,
+                                                     EVENT_STOCK_OUT, stock_out_id)
+                cursor.executemany('''
+                    INSERT INTO stock_out_allocations (stock_out_id, inventory_id, item_id,
+                                                       batch_number, expiry_date, quantity, unit_cost)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [(stock_out_id, inventory_id, item_id, batch_number, expiry_date, allocated, unit_cost)
+                      for inventory_id, batch_number, expiry_date, allocated, _, unit_cost in allocations])
+                self._apply_moving_average(cursor, item_id, -quantity)
+                self._consume_cost_layers(cursor, item_id, quantity)
+                return True
             
-            return True
+            success = self.run_in_transaction(work)
         except Exception as e:
             print(f"出库失败: {e}")
             return False
+        if success:
+            self._notify_movement()
+        return success
     
-    def _update_inventory(self, item_id: int, quantity: int, 
-                         batch_number: str = "", production_date: str = None,
-                         expiry_date: str = None):
-        """更新库存"""
-        # 检查是否已存在该批次库存
-        if batch_number:
-            result = self.execute_query('''
-                SELECT inventory_id, quantity FROM inventory 
-                WHERE item_id = ? AND batch_number = ?
-            ''', (item_id, batch_number))
-            
-            if result:
-                # 更新现有批次库存
-                inventory_id, current_quantity = result[0]
-                new_quantity = current_quantity + quantity
+    def transfer_stock(self, item_id: int, quantity: int, from_location: str, to_location: str,
+                       operator_id: int = 1, notes: str = "", strategy: str = "FEFO") -> bool:
+        """库存调拨：按 strategy 从 from_location 分配批次，原批次号、日期不变地转入 to_location
+        
+        扣减、转入和调拨记录在同一事务中完成，总库存不变。
+        """
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise ValueError(f"不支持的出库策略: {strategy}")
+        if quantity <= 0 or not from_location or not to_location or from_location == to_location:
+            return False
+        
+        try:
+            def work(cursor):
+                if self._stock_level(cursor, item_id, from_location) < quantity:
+                    return False
                 
-                if new_quantity > 0:
-                    self.execute_update('''
-                        UPDATE inventory SET quantity = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE inventory_id = ?
-                    ''', (new_quantity, inventory_id))
-                else:
-                    self.execute_update('DELETE FROM inventory WHERE inventory_id = ?', (inventory_id,))
-            else:
-                # 添加新批次库存
-                self.execute_update('''
-                    INSERT INTO inventory (item_id, quantity, batch_number, 
-                                         production_date, expiry_date)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (item_id, quantity, batch_number, production_date, expiry_date))
-        else:
-            # 无批次管理，直接更新总库存
-            result = self.execute_query('''
-                SELECT inventory_id, quantity FROM inventory 
-                WHERE item_id = ? AND batch_number = ''
+                cursor.execute('''
+                    INSERT INTO stock_transfers (item_id, quantity, from_location, to_location,
+                                                 operator_id, notes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (item_id, quantity, from_location, to_location, operator_id, notes))
+                transfer_id = cursor.lastrowid
+                
+                allocations = self._allocate_batches(cursor, item_id, quantity, strategy, from_location,
+                                                     EVENT_TRANSFER_OUT, transfer_id)
+                # 转入的批次带原批次成本，移动平均成本不变
+                for _, batch_number, expiry_date, allocated, production_date, unit_cost in allocations:
+                    self._update_inventory(cursor, item_id, allocated, batch_number,
+                                           production_date, expiry_date, to_location,
+                                           EVENT_TRANSFER_IN, transfer_id, unit_cost)
+                return True
+            
+            success = self.run_in_transaction(work)
+        except Exception as e:
+            print(f"调拨失败: {e}")
+            return False
+        if success:
+            self._notify_movement()
+        return success
+    
+    @staticmethod
+    def _stock_level(cursor: sqlite3.Cursor, item_id: int, location: Optional[str] = None) -> int:
+        """物资库存（location 为 None 时为全部库位合计）"""
+        if location is None:
+            cursor.execute('''
+                SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE item_id = ?
             ''', (item_id,))
+        else:
+            cursor.execute('''
+                SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE item_id = ? AND location = ?
+            ''', (item_id, location))
+        return cursor.fetchone()[0]
+    
+    @staticmethod
+    def _iter_allocation_candidates(cursor: sqlite3.Cursor, item_id: int, strategy: str,
+                                    location: Optional[str] = None):
+        """按分配顺序逐批返回有库存的批次
+        (inventory_id, quantity, batch_number, expiry_date, production_date, location, unit_cost)
+        
+        查询按需分页读取，只访问实际被消耗的批次附近的行；指定 location 时只返回该库位的批次。
+        """
+        columns = "inventory_id, quantity, batch_number, expiry_date, production_date, location, unit_cost"
+        location_condition = "" if location is None else " AND location = ?"
+        if strategy == "FEFO":
+            # 有效期的批次按 (expiry_date, production_date) 走索引顺序，无有效期的排在最后
+            queries = [
+                f'''
+                SELECT {columns} FROM inventory
+                WHERE item_id = ? AND expiry_date IS NOT NULL AND quantity > 0{location_condition}
+                ORDER BY expiry_date, production_date, inventory_id
+                ''',
+                f'''
+                SELECT {columns} FROM inventory
+                WHERE item_id = ? AND expiry_date IS NULL AND quantity > 0{location_condition}
+                ORDER BY production_date, inventory_id
+                ''',
+            ]
+        else:
+            # 先入先出：批次库存行按入库先后（inventory_id）消耗
+            queries = [
+                f'''
+                SELECT {columns} FROM inventory
+                WHERE item_id = ? AND quantity > 0{location_condition}
+                ORDER BY inventory_id
+                ''',
+            ]
+        
+        params = (item_id,) if location is None else (item_id, location)
+        for query in queries:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(ALLOCATION_FETCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+    
+    def _allocate_batches(self, cursor: sqlite3.Cursor, item_id: int, quantity: int,
+                          strategy: str = "FEFO", location: Optional[str] = None,
+                          event_type: str = EVENT_STOCK_OUT, ref_id: Optional[int] = None
+                          ) -> List[Tuple[int, str, Optional[str], int, Optional[str], Optional[float]]]:
+        """按策略消耗批次库存，返回分配明细
+        [(inventory_id, batch_number, expiry_date, 数量, production_date, 批次成本)]
+        
+        须在 run_in_transaction 的事务中调用；库存不足时抛出 ValueError 使事务回滚。
+        每个被消耗的批次记一条 event_type 流水日志事件。
+        """
+        allocations = []
+        events = []
+        remaining = quantity
+        for inventory_id, available, batch_number, expiry_date, production_date, batch_location, unit_cost in \
+                self._iter_allocation_candidates(cursor, item_id, strategy, location):
+            allocated = min(available, remaining)
+            allocations.append((inventory_id, batch_number, expiry_date, allocated, available,
+                                production_date, unit_cost))
+            events.append((event_type, item_id, inventory_id, batch_location, batch_number,
+                           production_date, expiry_date, -allocated, ref_id, unit_cost))
+            remaining -= allocated
+            if remaining == 0:
+                break
+        
+        if remaining > 0:
+            raise ValueError(f"物资 {item_id} 可分配批次库存不足，缺少 {remaining}")
+        
+        # 只更新被消耗的批次：扣完的删除，部分消耗的减少数量
+        cursor.executemany('DELETE FROM inventory WHERE inventory_id = ?',
+                           [(row[0],) for row in allocations if row[3] == row[4]])
+        cursor.executemany('''
+            UPDATE inventory SET quantity = quantity - ?, updated_at = CURRENT_TIMESTAMP
+            WHERE inventory_id = ?
+        ''', [(row[3], row[0]) for row in allocations if row[3] < row[4]])
+        self._append_journal(cursor, events)
+        
+        return [row[:4] + row[5:] for row in allocations]
+    
+    def _update_inventory(self, cursor: sqlite3.Cursor, item_id: int, quantity: int, 
+                         batch_number: str = "", production_date: str = None,
+                         expiry_date: str = None, location: str = DEFAULT_LOCATION,
+                         event_type: str = EVENT_STOCK_IN, ref_id: Optional[int] = None,
+                         unit_cost: Optional[float] = None):
+        """入库时增加库位的批次库存（无批次号的入库计入 batch_number = '' 的行），并记流水日志事件
+        
+        unit_cost 为本次转入数量的成本；同一批次库存行再次转入时批次成本按数量加权。
+        """
+        cursor.execute('''
+            SELECT inventory_id, quantity, production_date, expiry_date, unit_cost FROM inventory 
+            WHERE item_id = ? AND location = ? AND batch_number = ?
+        ''', (item_id, location, batch_number))
+        result = cursor.fetchone()
+        
+        if result:
+            # 更新现有批次库存（批次日期沿用已有的库存行）
+            inventory_id, current_quantity, production_date, expiry_date, current_cost = result
+            new_quantity = current_quantity + quantity
+            if current_cost is None or unit_cost is None or quantity <= 0 or new_quantity <= 0:
+                unit_cost = current_cost if current_cost is not None else unit_cost
+            else:
+                unit_cost = (current_quantity * current_cost + quantity * unit_cost) / new_quantity
             
-            if result:
-                inventory_id, current_quantity = result[0]
-                new_quantity = current_quantity + quantity
-                
-                if new_quantity > 0:
-                    self.execute_update('''
-                        UPDATE inventory SET quantity = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE inventory_id = ?
-                    ''', (new_quantity, inventory_id))
-                else:
-                    self.execute_update('DELETE FROM inventory WHERE inventory_id = ?', (inventory_id,))
+            if new_quantity > 0:
+                cursor.execute('''
+                    UPDATE inventory SET quantity = ?, unit_cost = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE inventory_id = ?
+                ''', (new_quantity, unit_cost, inventory_id))
             else:
-                self.execute_update('''
-                    INSERT INTO inventory (item_id, quantity)
-                    VALUES (?, ?)
-                ''', (item_id, quantity))
+                cursor.execute('DELETE FROM inventory WHERE inventory_id = ?', (inventory_id,))
+        else:
+            # 添加新批次库存
+            cursor.execute('''
+                INSERT INTO inventory (item_id, quantity, location, batch_number, 
+                                     production_date, expiry_date, unit_cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (item_id, quantity, location, batch_number, production_date, expiry_date, unit_cost))
+            inventory_id = cursor.lastrowid
+        
+        self._append_journal(cursor, [(event_type, item_id, inventory_id, location, batch_number,
+                                       production_date, expiry_date, quantity, ref_id, unit_cost)])
     
-    def get_current_stock(self, item_id: int) -> int:
-        """获取当前库存数量"""
-        result = self.execute_query('''
-            SELECT SUM(quantity) FROM inventory WHERE item_id = ?
+    @staticmethod
+    def _apply_moving_average(cursor: sqlite3.Cursor, item_id: int, quantity: int,
+                              unit_cost: Optional[float] = None):
+        """更新物资的移动加权平均成本（须在出入库事务中调用）
+        
+        入库（unit_cost 为入库单价）按数量加权重算平均成本；
+        出库（quantity 为负数）按当前平均成本减少库存金额，平均成本不变，库存出清时金额归零。
+        """
+        if unit_cost is not None:
+            cursor.execute('''
+                INSERT INTO item_valuation (item_id, quantity, total_cost, average_cost)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(item_id) DO UPDATE SET
+                    average_cost = CASE WHEN quantity + excluded.quantity > 0
+                                        THEN (total_cost + excluded.total_cost) / (quantity + excluded.quantity)
+                                        ELSE average_cost END,
+                    quantity = quantity + excluded.quantity,
+                    total_cost = total_cost + excluded.total_cost,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (item_id, quantity, quantity * unit_cost, unit_cost))
+            return
+        cursor.execute('''
+            UPDATE item_valuation SET
+                total_cost = CASE WHEN quantity + ? > 0 THEN total_cost + ? * average_cost ELSE 0 END,
+                quantity = quantity + ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE item_id = ?
+        ''', (quantity, quantity, quantity, item_id))
+    
+    @staticmethod
+    def _consume_cost_layers(cursor: sqlite3.Cursor, item_id: int, quantity: int) -> float:
+        """按入库先后消耗物资的先进先出成本层，返回消耗的成本（须在出库事务中调用）
+        
+        成本层按物资计（与出库从哪个库位、哪个批次分配无关）；
+        未建立成本层的库存（如直接写入批次库存的测试数据）不计成本。
+        """
+        cursor.execute('''
+            SELECT layer_id, remaining, unit_cost FROM cost_layers
+            WHERE item_id = ? AND remaining > 0
+            ORDER BY layer_id
         ''', (item_id,))
+        updates = []
+        cost = 0.0
+        remaining = quantity
+        while remaining > 0:
+            rows = cursor.fetchmany(ALLOCATION_FETCH_SIZE)
+            if not rows:
+                break
+            for layer_id, available, unit_cost in rows:
+                consumed = min(available, remaining)
+                updates.append((consumed, layer_id))
+                cost += consumed * unit_cost
+                remaining -= consumed
+                if remaining == 0:
+                    break
+        cursor.executemany("UPDATE cost_layers SET remaining = remaining - ? WHERE layer_id = ?", updates)
+        return cost
+    
+    @staticmethod
+    def _append_journal(cursor: sqlite3.Cursor, events: List[Tuple]):
+        """追加流水日志事件
+        [(event_type, item_id, inventory_id, location, batch_number, production_date, expiry_date, 数量, ref_id,
+          批次成本)]
+        """
+        cursor.executemany('''
+            INSERT INTO movement_journal (event_type, item_id, inventory_id, location, batch_number,
+                                          production_date, expiry_date, quantity, ref_id, unit_cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', events)
+    
+    def get_stock_out_allocations(self, stock_out_id: int) -> List[Record]:
+        """获取出库记录对应的批次分配明细"""
+        result = self.execute_query('''
+            SELECT allocation_id, inventory_id, item_id, batch_number, expiry_date, quantity
+            FROM stock_out_allocations
+            WHERE stock_out_id = ?
+            ORDER BY allocation_id
+        ''', (stock_out_id,))
+        
+        return AllocationRecord.from_rows(result)
+    
+    def get_expiring_batches(self, within_days: int = 30, after_date: str = None,
+                             updated_since: str = None) -> List[Record]:
+        """获取有效期在今天之后 within_days 天内（含已过期）且仍有库存的批次
+        
+        Args:
+            within_days: 预警天数
+            after_date: 只返回有效期晚于该日期的批次（用于只扫描新进入预警窗口的区间）
+            updated_since: 只返回该时间之后有变动的批次（与 CURRENT_TIMESTAMP 同格式）
+        """
+        horizon = (datetime.now().date() + timedelta(days=within_days)).isoformat()
+        query = '''
+            SELECT inv.inventory_id, inv.item_id, i.item_code, i.item_name, i.unit,
+                   inv.batch_number, inv.quantity, inv.expiry_date
+            FROM inventory inv
+            JOIN items i ON inv.item_id = i.item_id
+            WHERE inv.expiry_date <= ? AND inv.quantity > 0
+        '''
+        params = [horizon]
+        
+        if after_date:
+            query += " AND inv.expiry_date > ?"
+            params.append(after_date)
+        
+        if updated_since:
+            query += " AND inv.updated_at >= ?"
+            params.append(updated_since)
+        
+        query += " ORDER BY inv.expiry_date"
+        
+        result = self.execute_query(query, params)
+        return ExpiringBatchRecord.from_rows(result)
+    
+    def get_database_time(self) -> str:
+        """获取数据库当前时间（与 CURRENT_TIMESTAMP 默认值同源，用于增量检查的时间水位）"""
+        return self.execute_query("SELECT CURRENT_TIMESTAMP")[0][0]
+    
+    def get_movement_version(self) -> Tuple[int, int, int, int, int]:
+        """流水版本 (最大入库ID, 最大出库ID, 最大物资ID, 最大流水日志事件ID, 已归档的入库/出库行数)，用于缓存失效
+        
+        任何库存变化（含调拨）都会追加流水日志事件，事件ID只增不减；
+        入库/出库ID在归档迁出最新的记录后可能变小，使用方发现任一分量变小时应全量重算；
+        归档行数变化表示有流水从主库迁入归档分区。
+        """
+        archived = sum(row_count for ledger, _, _, _, row_count in self.get_ledger_partitions()
+                       if ledger in ('stock_in', 'stock_out'))
+        return tuple(self.execute_query('''
+            SELECT (SELECT COALESCE(MAX(stock_in_id), 0) FROM stock_in),
+                   (SELECT COALESCE(MAX(stock_out_id), 0) FROM stock_out),
+                   (SELECT COALESCE(MAX(item_id), 0) FROM items),
+                   (SELECT COALESCE(MAX(event_id), 0) FROM movement_journal)
+        ''')[0]) + (archived,)
+    
+    def get_current_stock(self, item_id: int, location: Optional[str] = None) -> int:
+        """获取当前库存数量（location 为 None 时为全部库位合计）"""
+        if location is None:
+            result = self.execute_query('''
+                SELECT SUM(quantity) FROM inventory WHERE item_id = ?
+            ''', (item_id,))
+        else:
+            result = self.execute_query('''
+                SELECT SUM(quantity) FROM inventory WHERE item_id = ? AND location = ?
+            ''', (item_id, location))
         
         return result[0][0] or 0
     
-    def get_inventory_status(self) -> List[Dict]:
-        """获取库存状态"""
-        result = self.execute_query('''
+    def get_inventory_status(self, location: Optional[str] = None,
+                             by_location: bool = False) -> List[Record]:
+        """获取库存状态
+        
+        Args:
+            location: 只统计该库位的库存，None 表示全部库位合计
+            by_location: 按库位透视，结果附加 location_stock {库位: 数量}
+        """
+        params = () if location is None else (location,)
+        if by_location:
+            # 先按 (物资, 库位) 汇总（走 item_id, location 索引），再按物资合计并收集各库位数量
+            location_filter = "" if location is None else "WHERE location = ?"
+            stock_join = f'''LEFT JOIN (
+                SELECT item_id, location, SUM(quantity) AS quantity FROM inventory
+                {location_filter}
+                GROUP BY item_id, location
+            ) inv ON i.item_id = inv.item_id'''
+            pivot_column = ", json_group_object(inv.location, inv.quantity) FILTER (WHERE inv.location IS NOT NULL)"
+        else:
+            location_filter = "" if location is None else "AND inv.location = ?"
+            stock_join = f"LEFT JOIN inventory inv ON i.item_id = inv.item_id {location_filter}"
+            pivot_column = ""
+        
+        result = self.execute_query(f'''
             SELECT i.item_id, i.item_code, i.item_name, c.category_name, 
                    i.unit, i.min_stock, i.max_stock,
                    COALESCE(SUM(inv.quantity), 0) as current_stock,
                    CASE 
-                       WHEN COALESCE(SUM(inv.quantity), 0) <= i.min_stock THEN '库存不足'
+                       WHEN COALESCE(SUM(inv.quantity), 0) <= COALESCE(r.reorder_point, i.min_stock) THEN '库存不足'
                        WHEN COALESCE(SUM(inv.quantity), 0) >= i.max_stock THEN '库存过高'
                        ELSE '正常'
-                   END as status
+                   END as status,
+                   COALESCE(r.reorder_point, i.min_stock) as reorder_point{pivot_column}
             FROM items i
             JOIN categories c ON i.category_id = c.category_id
-            LEFT JOIN inventory inv ON i.item_id = inv.item_id
+            LEFT JOIN item_replenishment r ON i.item_id = r.item_id
+            {stock_join}
             GROUP BY i.item_id
             ORDER BY i.item_id
+        ''', params)
+        
+        if by_location:
+            return LocationStatusRecord.from_rows(row[:-1] + (json.loads(row[-1]),) for row in result)
+        return InventoryStatusRecord.from_rows(result)
+    
+    def get_locations(self) -> List[str]:
+        """获取全部有库存记录的库位（默认库位总在首位）"""
+        result = self.execute_query('''
+            SELECT DISTINCT location FROM inventory WHERE location IS NOT NULL
         ''')
+        locations = sorted(row[0] for row in result if row[0] != DEFAULT_LOCATION)
+        return [DEFAULT_LOCATION] + locations
+    
+    def get_location_balances(self, item_id: Optional[int] = None) -> List[Record]:
+        """获取各库位库存余额（按物资、库位汇总批次库存）"""
+        result = self.execute_query('''
+            SELECT inv.item_id, i.item_code, i.item_name, i.unit, inv.location,
+                   SUM(inv.quantity) AS quantity, COUNT(*) AS batch_count
+            FROM inventory inv
+            JOIN items i ON inv.item_id = i.item_id
+            WHERE ? IS NULL OR inv.item_id = ?
+            GROUP BY inv.item_id, inv.location
+            ORDER BY inv.item_id, inv.location
+        ''', (item_id, item_id))
+        return LocationBalanceRecord.from_rows(result)
+    
+    def get_item_journal(self, item_id: int, limit: int = 500) -> List[Record]:
+        """物资最近的流水日志事件（含已扣完删除的批次的完整历史），按事件ID倒序"""
+        result = self.execute_query('''
+            SELECT event_id, event_type, item_id, inventory_id, location, batch_number,
+                   production_date, expiry_date, quantity, ref_id, created_at
+            FROM movement_journal
+            WHERE item_id = ?
+            ORDER BY event_id DESC
+            LIMIT ?
+        ''', (item_id, limit))
+        return JournalEventRecord.from_rows(result)
+    
+    def get_stock_alerts(self, status: Optional[str] = None) -> List[Record]:
+        """库存预警投影中的物资（库存不足/库存过高），字段同 get_inventory_status
         
-        return [{
-            'item_id': row[0],
-            'item_code': row[1],
-            'item_name': row[2],
-            'category_name': row[3],
-            'unit': row[4],
-            'min_stock': row[5],
-            'max_stock': row[6],
-            'current_stock': row[7],
-            'status': row[8]
-        } for row in result]
-    
-    def get_stock_in_records(self) -> List[Dict]:
-        """获取入库记录"""
+        读取前先用 journal.JournalProjector.catch_up() 追上流水日志。
+        """
         result = self.execute_query('''
+            SELECT i.item_id, i.item_code, i.item_name, c.category_name, i.unit,
+                   i.min_stock, i.max_stock, a.quantity, a.status, a.reorder_point
+            FROM stock_alerts a
+            JOIN items i ON a.item_id = i.item_id
+            JOIN categories c ON i.category_id = c.category_id
+            WHERE ? IS NULL OR a.status = ?
+            ORDER BY a.item_id
+        ''', (status, status))
+        return InventoryStatusRecord.from_rows(result)
+    
+    def get_stock_transfers(self, include_archive: bool = False, start: Union[str, datetime, None] = None,
+                            end: Union[str, datetime, None] = None) -> List[Record]:
+        """获取库存调拨记录（参数同 get_stock_in_records）"""
+        partitions, condition, params = self._ledger_scope('stock_transfers', include_archive, start, end)
+        source = self._ledger_source(
+            'stock_transfers', "transfer_id, item_id, quantity, from_location, to_location, "
+                               "operation_time, operator_id, notes", partitions, condition)
+        result = self.execute_query(f'''
+            SELECT t.transfer_id, i.item_name, t.quantity, i.unit, t.from_location, t.to_location,
+                   t.operation_time, u.full_name as operator, t.notes
+            FROM {source} t
+            JOIN items i ON t.item_id = i.item_id
+            LEFT JOIN users u ON t.operator_id = u.user_id
+            ORDER BY t.operation_time DESC, t.transfer_id DESC
+        ''', params, attach_archive=bool(partitions))
+        return StockTransferRecord.from_rows(result)
+    
+    def has_archive(self) -> bool:
+        """是否已有归档库（归档过历史流水）"""
+        return os.path.exists(self.archive_path)
+    
+    def get_ledger_partitions(self, table: Optional[str] = None) -> List[tuple]:
+        """归档分区登记：[(流水表, 分区键, 最早操作时间, 最晚操作时间, 行数)]"""
+        if not self.has_archive():
+            return []
+        return self.execute_query('''
+            SELECT ledger, partition_key, min_time, max_time, row_count
+            FROM archive.ledger_partitions
+            WHERE ? IS NULL OR ledger = ?
+            ORDER BY ledger, partition_key
+        ''', (table, table), attach_archive=True)
+    
+    def _ledger_scope(self, table: str, include_archive: bool, start: Union[str, datetime, None],
+                      end: Union[str, datetime, None]) -> Tuple[List[str], str, Tuple]:
+        """确定流水查询读取的归档分区和时间条件，返回 (分区键列表, 每个分区的 WHERE 子句, 每个分区的参数)
+        
+        不限时间时只读热分区（主库），include_archive 为 True 时加上全部归档分区；
+        指定时间范围时读取热分区和时间范围有交集的归档分区。
+        """
+        if start is None and end is None:
+            if not include_archive:
+                return [], "", ()
+            return [key for _, key, *_ in self.get_ledger_partitions(table)], "", ()
+        
+        conditions = []
+        params = []
+        if start is not None:
+            if isinstance(start, str) and len(start) == 10:  # 仅日期，从当天开始
+                start = f"{start} 00:00:00"
+            conditions.append("operation_time >= ?")
+            params.append(self._normalize_timestamp(start))
+        if end is not None:
+            conditions.append("operation_time <= ?")
+            params.append(self._normalize_timestamp(end))
+        low = params[0] if start is not None else ''
+        high = params[-1] if end is not None else '9999'
+        partitions = [key for _, key, min_time, max_time, _ in self.get_ledger_partitions(table)
+                      if max_time >= low and min_time <= high]
+        return partitions, " WHERE " + " AND ".join(conditions), tuple(params)
+    
+    @staticmethod
+    def _ledger_source(table: str, columns: str, partitions: Sequence[str], condition: str = "") -> str:
+        """流水表的查询来源：热分区与指定归档分区的 UNION ALL（条件写进每个分区，各自走操作时间索引）"""
+        if not partitions and not condition:
+            return table
+        branches = [f"SELECT {columns} FROM main.{table}{condition}"]
+        branches.extend(f"SELECT {columns} FROM archive.{table}_{key}{condition}" for key in partitions)
+        return "(" + "\n UNION ALL ".join(branches) + ")"
+    
+    @staticmethod
+    def _ledger_page(table: str, condition: str, params: Tuple, sort_by: str, descending: bool,
+                     after: Optional[Tuple], limit: Optional[int]) -> Tuple[str, Tuple, str, Tuple]:
+        """流水记录的排序与键集分页，返回 (每个分区的 WHERE 子句, 每个分区的参数, ORDER BY ... LIMIT ?, LIMIT 参数)
+        
+        键集条件写进每个分区，各分区按操作时间索引或主键只读到上一页之后。
+        """
+        if sort_by not in LEDGER_SORT_COLUMNS[table]:
+            raise ValueError(f"不支持的排序列: {sort_by}")
+        key = ARCHIVED_LEDGERS[table]
+        direction = "DESC" if descending else "ASC"
+        if after is not None:
+            condition += (" AND " if condition else " WHERE ") + \
+                f"({sort_by}, {key}) {'<' if descending else '>'} (?, ?)"
+            params = params + tuple(after)
+        order = f"s.{sort_by} {direction}" if sort_by == key else f"s.{sort_by} {direction}, s.{key} {direction}"
+        return condition, params, f"ORDER BY {order}\n            LIMIT ?", (limit if limit is not None else -1,)
+    
+    def get_stock_in_records(self, include_archive: bool = False, start: Union[str, datetime, None] = None,
+                             end: Union[str, datetime, None] = None, sort_by: str = "operation_time",
+                             descending: bool = True, after: Tuple = None, limit: int = None) -> List[Record]:
+        """获取入库记录
+        
+        Args:
+            include_archive: 不限时间时是否包含已归档的历史记录（默认只查热分区）
+            start, end: 操作时间范围（含两端，仅日期表示当天开始/结束），指定后只读取有交集的归档分区
+            sort_by: 排序列（见 LEDGER_SORT_COLUMNS）
+            after: 键集分页，上一页最后一行的 (排序列值, 记录ID)
+            limit: 每页行数，None 表示返回全部
+        """
+        partitions, condition, params = self._ledger_scope('stock_in', include_archive, start, end)
+        condition, params, order, limit_params = self._ledger_page(
+            'stock_in', condition, params, sort_by, descending, after, limit)
+        source = self._ledger_source(
+            'stock_in', "stock_in_id, item_id, quantity, unit_price, total_amount, supplier, "
+                        "batch_number, operation_time, operator_id", partitions, condition)
+        result = self.execute_query(f'''
             SELECT s.stock_in_id, i.item_name, s.quantity, i.unit, s.unit_price, 
                    s.total_amount, s.supplier, s.batch_number, s.operation_time,
                    u.full_name as operator
-            FROM stock_in s
+            FROM {source} s
             JOIN items i ON s.item_id = i.item_id
             JOIN users u ON s.operator_id = u.user_id
-            ORDER BY s.operation_time DESC
-        ''')
-        
-        return [{
-            'stock_in_id': row[0],
-            'item_name': row[1],
-            'quantity': row[2],
-            'unit': row[3],
-            'unit_price': row[4],
-            'total_amount': row[5],
-            'supplier': row[6],
-            'batch_number': row[7],
-            'operation_time': row[8],
-            'operator': row[9]
-        } for row in result]
-    
-    def get_stock_out_records(self) -> List[Dict]:
-        """获取出库记录"""
-        result = self.execute_query('''
+            {order}
+        ''', params * (len(partitions) + 1) + limit_params, attach_archive=bool(partitions))
+        
+        return StockInRecord.from_rows(result)
+    
+    def get_stock_out_records(self, include_archive: bool = False, start: Union[str, datetime, None] = None,
+                              end: Union[str, datetime, None] = None, sort_by: str = "operation_time",
+                              descending: bool = True, after: Tuple = None, limit: int = None) -> List[Record]:
+        """获取出库记录（参数同 get_stock_in_records，批次分配与出库记录在同一分区）"""
+        partitions, condition, params = self._ledger_scope('stock_out', include_archive, start, end)
+        condition, params, order, limit_params = self._ledger_page(
+            'stock_out', condition, params, sort_by, descending, after, limit)
+        source = self._ledger_source(
+            'stock_out', "stock_out_id, item_id, quantity, unit_price, total_amount, recipient, "
+                         "purpose, operation_time, operator_id", partitions, condition)
+        allocations = self._ledger_source(
+            'stock_out_allocations', "stock_out_id, batch_number, quantity", partitions)
+        result = self.execute_query(f'''
             SELECT s.stock_out_id, i.item_name, s.quantity, i.unit, s.unit_price, 
                    s.total_amount, s.recipient, s.purpose, s.operation_time,
-                   u.full_name as operator
-            FROM stock_out s
+                   u.full_name as operator,
+                   (SELECT GROUP_CONCAT(COALESCE(NULLIF(a.batch_number, ''), '无批次') || '×' || a.quantity, ', ')
+                    FROM {allocations} a
+                    WHERE a.stock_out_id = s.stock_out_id) as batches
+            FROM {source} s
             JOIN items i ON s.item_id = i.item_id
             JOIN users u ON s.operator_id = u.user_id
-            ORDER BY s.operation_time DESC
-        ''')
-        
-        return [{
-            'stock_out_id': row[0],
-            'item_name': row[1],
-            'quantity': row[2],
-            'unit': row[3],
-            'unit_price': row[4],
-            'total_amount': row[5],
-            'recipient': row[6],
-            'purpose': row[7],
-            'operation_time': row[8],
-            'operator': row[9]
-        } for row in result]
\ No newline at end of file
+            {order}
+        ''', params * (len(partitions) + 1) + limit_params, attach_archive=bool(partitions))
+        
+        return StockOutRecord.from_rows(result)
+    
+    # 历史时点库存重建相关方法
+    @staticmethod
+    def _normalize_timestamp(timestamp: Union[str, datetime, None]) -> str:
+        """将时间参数统一为 'YYYY-MM-DD HH:MM:SS' 文本，None 表示当前时间（UTC，与 CURRENT_TIMESTAMP 一致）"""
+        if timestamp is None:
+            return datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        if isinstance(timestamp, datetime):
+            return timestamp.strftime(TIMESTAMP_FORMAT)
+        if len(timestamp) == 10:  # 仅日期，表示当天结束时的库存
+            return f"{timestamp} 23:59:59"
+        return timestamp
+    
+    @staticmethod
+    def _find_snapshot(cursor: sqlite3.Cursor, timestamp: str) -> Tuple[Optional[int], str]:
+        """查找不晚于指定时间的最近快照，返回 (snapshot_id, snapshot_time)"""
+        cursor.execute('''
+            SELECT snapshot_id, snapshot_time FROM stock_snapshots
+            WHERE snapshot_time <= ?
+            ORDER BY snapshot_time DESC LIMIT 1
+        ''', (timestamp,))
+        row = cursor.fetchone()
+        # 没有快照时从流水起点回放，'' 小于任何时间文本
+        return (row[0], row[1]) if row else (None, '')
+    
+    @classmethod
+    def _replay_stock_as_of(cls, cursor: sqlite3.Cursor, timestamp: str,
+                            item_id: int = None, archived: bool = False) -> Dict[int, int]:
+        """从最近快照出发，只回放 (快照时间, timestamp] 区间内的出入库流水
+        
+        archived 为 True 时 cursor 的连接已附加归档库，区间内已归档的流水从与区间有交集的归档分区读取。
+        """
+        snapshot_id, snapshot_time = cls._find_snapshot(cursor, timestamp)
+        stock = {}
+        item_clause = " AND item_id = ?" if item_id is not None else ""
+        item_params = (item_id,) if item_id is not None else ()
+        
+        if snapshot_id is not None:
+            cursor.execute('''
+                SELECT item_id, quantity FROM stock_snapshot_items
+                WHERE snapshot_id = ?''' + item_clause, (snapshot_id,) + item_params)
+            stock.update(cursor.fetchall())
+        
+        condition = f" WHERE operation_time > ? AND operation_time <= ?{item_clause}"
+        params = (snapshot_time, timestamp) + item_params
+        for table, sign in (('stock_in', 1), ('stock_out', -1)):
+            partitions = []
+            if archived:
+                cursor.execute('''
+                    SELECT partition_key FROM archive.ledger_partitions
+                    WHERE ledger = ? AND max_time > ? AND min_time <= ?
+                    ORDER BY partition_key
+                ''', (table, snapshot_time, timestamp))
+                partitions = [row[0] for row in cursor.fetchall()]
+            source = cls._ledger_source(table, "item_id, quantity", partitions, condition)
+            cursor.execute(f'''
+                SELECT item_id, SUM(quantity) FROM {source}
+                GROUP BY item_id
+            ''', params * (len(partitions) + 1))
+            for row_item_id, quantity in cursor.fetchall():
+                stock[row_item_id] = stock.get(row_item_id, 0) + sign * quantity
+        
+        return stock
+    
+    def get_stock_as_of(self, timestamp: Union[str, datetime, None] = None,
+                        item_id: int = None) -> Union[int, Dict[int, int]]:
+        """获取指定时间点的库存
+        
+        Args:
+            timestamp: 时间点（文本或 datetime，仅日期表示当天结束时），None 表示当前
+            item_id: 物资ID；为 None 时返回全部物资 {item_id: 数量}
+        """
+        timestamp = self._normalize_timestamp(timestamp)
+        archived = self.has_archive()
+        conn = self._connect()
+        try:
+            if archived:
+                conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            stock = self._replay_stock_as_of(conn.cursor(), timestamp, item_id, archived)
+        finally:
+            conn.close()
+        
+        if item_id is not None:
+            return stock.get(item_id, 0)
+        return {key: value for key, value in stock.items() if value}
+    
+    def create_stock_snapshot(self, snapshot_time: Union[str, datetime, None] = None) -> Optional[int]:
+        """创建库存快照检查点，返回 snapshot_id（该时间点已有快照时返回 None）"""
+        snapshot_time = self._normalize_timestamp(snapshot_time)
+        archived = self.has_archive()
+        
+        def work(cursor):
+            cursor.execute("SELECT 1 FROM stock_snapshots WHERE snapshot_time = ?", (snapshot_time,))
+            if cursor.fetchone():
+                return None
+            stock = self._replay_stock_as_of(cursor, snapshot_time, archived=archived)
+            cursor.execute("INSERT INTO stock_snapshots (snapshot_time) VALUES (?)", (snapshot_time,))
+            snapshot_id = cursor.lastrowid
+            cursor.executemany('''
+                INSERT INTO stock_snapshot_items (snapshot_id, item_id, quantity)
+                VALUES (?, ?, ?)
+            ''', [(snapshot_id, key, value) for key, value in stock.items() if value])
+            return snapshot_id
+        
+        return self.run_in_transaction(work, attach_archive=archived)
+    
+    def create_periodic_snapshots(self, interval_days: int = 7) -> int:
+        """按固定间隔补齐快照检查点，使任意时点重建最多回放 interval_days 天的流水
+        
+        Returns:
+            新创建的快照数量
+        """
+        result = self.execute_query('''
+            SELECT MAX(snapshot_time) FROM stock_snapshots
+        ''')
+        last_snapshot = result[0][0]
+        
+        if last_snapshot:
+            next_time = datetime.strptime(last_snapshot, TIMESTAMP_FORMAT) + timedelta(days=interval_days)
+        else:
+            result = self.execute_query('''
+                SELECT MIN(t) FROM (
+                    SELECT MIN(operation_time) AS t FROM stock_in
+                    UNION ALL
+                    SELECT MIN(operation_time) FROM stock_out
+                )
+            ''')
+            if not result[0][0]:
+                return 0
+            first_time = datetime.strptime(result[0][0][:10], "%Y-%m-%d")
+            next_time = first_time + timedelta(days=interval_days)
+        
+        created = 0
+        now = datetime.utcnow()
+        while next_time <= now:
+            if self.create_stock_snapshot(next_time) is not None:
+                created += 1
+            next_time += timedelta(days=interval_days)
+        return created
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近效期批次监控
+增量维护有效期在预警窗口内的批次列表，供界面定时器和无界面模式共用
+"""
+
+import json
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from database import DatabaseManager
+
+
+class ExpiryMonitor:
+    """近效期批次监控器
+
+    首次检查扫描整个预警窗口；之后每次只扫描两部分：
+    1. 日期推移后新进入窗口的有效期区间；
+    2. 上次检查之后有入库/出库变动的批次。
+    已被出库扣完（删除）的批次会从结果中移除。
+    """
+
+    def __init__(self, db: DatabaseManager, within_days: int = 30):
+        self.db = db
+        self.within_days = within_days
+        self._batches = {}  # inventory_id -> 批次信息
+        self._horizon = None  # 上次检查时的窗口截止日期
+        self._last_check = None  # 上次检查时的数据库时间
+
+    def reset(self):
+        """清空缓存，下次检查重新全量扫描"""
+        self._batches = {}
+        self._horizon = None
+        self._last_check = None
+
+    def check(self) -> List[Dict]:
+        """检查近效期批次，返回按有效期排序的列表（包含已过期批次）"""
+        check_time = self.db.get_database_time()
+        horizon = (date.today() + timedelta(days=self.within_days)).isoformat()
+
+        if self._horizon is None:
+            rows = self.db.get_expiring_batches(self.within_days)
+        else:
+            rows = []
+            if horizon > self._horizon:
+                rows += self.db.get_expiring_batches(self.within_days, after_date=self._horizon)
+            rows += self.db.get_expiring_batches(self.within_days, updated_since=self._last_check)
+            self._prune_removed()
+
+        for row in rows:
+            self._batches[row['inventory_id']] = row
+
+        self._horizon = horizon
+        self._last_check = check_time
+        return self.get_batches()
+
+    def _prune_removed(self):
+        """移除已出库扣完（库存行已删除）的批次"""
+        if not self._batches:
+            return
+        result = self.db.execute_query('''
+            SELECT inventory_id FROM inventory
+            WHERE inventory_id IN (SELECT value FROM json_each(?)) AND quantity > 0
+        ''', (json.dumps(list(self._batches)),))
+        remaining = {row[0] for row in result}
+        for inventory_id in list(self._batches):
+            if inventory_id not in remaining:
+                del self._batches[inventory_id]
+
+    def get_batches(self) -> List[Dict]:
+        """返回当前缓存的近效期批次，附带剩余天数 days_left（负数表示已过期）"""
+        today = date.today()
+        batches = []
+        for batch in sorted(self._batches.values(), key=lambda b: (b['expiry_date'], b['inventory_id'])):
+            expiry = datetime.strptime(batch['expiry_date'][:10], "%Y-%m-%d").date()
+            batches.append(dict(batch, days_left=(expiry - today).days))
+        return batches
+
+    def get_summary(self):
+        """返回 (已过期批次数, 即将过期批次数)"""
+        expired = sum(1 for batch in self.get_batches() if batch['days_left'] < 0)
+        return expired, len(self._batches) - expired
+
+
+def run_headless(db: DatabaseManager, within_days: int = 30, interval_seconds: int = 300,
+                 iterations: int = None):
+    """无界面模式：定时检查近效期批次并输出到控制台
+
+    Args:
+        iterations: 检查次数，None 表示一直运行
+    """
+    monitor = ExpiryMonitor(db, within_days)
+    count = 0
+    while iterations is None or count < iterations:
+        batches = monitor.check()
+        expired, expiring = monitor.get_summary()
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+              f"近效期预警: 已过期 {expired} 批 | {within_days} 天内到期 {expiring} 批")
+        for batch in batches:
+            state = "已过期" if batch['days_left'] < 0 else f"剩余 {batch['days_left']} 天"
+            print(f"   • {batch['item_name']} 批次 {batch['batch_number'] or '无批次'} "
+                  f"{batch['quantity']}{batch['unit']} 有效期至 {batch['expiry_date']} ({state})")
+        count += 1
+        if iterations is None or count < iterations:
+            time.sleep(interval_seconds)
@@ -1,20 +1,58 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import tkinter.font as tkfont
-from database import DatabaseManager
+from database import (DatabaseManager, DEFAULT_LOCATION, DEFAULT_STORAGE_PROFILE, PO_STATUSES,
+                      PO_STATUS_CANCELLED, PO_STATUS_ORDERED, PO_STATUS_RECEIVED)
+from expiry_monitor import ExpiryMonitor
+from analytics import InventoryAnalytics
+from replenishment import PurchasePlanner
+from journal import JournalProjector
+from query_builder import STATUS_HIGH, STATUS_LOW, sort_key
+from read_model import InventoryReadModel
+from dashboard import DashboardFeed
+from valuation import InventoryValuation, METHOD_BATCH_COST, METHOD_FIFO, METHOD_MOVING_AVERAGE
+from tree_loader import TreeviewLoader, TreeviewSorter
 from datetime import datetime
 
+# 出库批次分配策略（界面显示名称, 数据库策略）
+STOCK_OUT_STRATEGIES = [
+    ("先到期先出 (FEFO)", "FEFO"),
+    ("先进先出 (FIFO)", "FIFO"),
+]
+
+# 出库/筛选时表示不限库位的选项
+ALL_LOCATIONS = "全部库位"
+
+# 近效期定时检查间隔（毫秒）
+EXPIRY_CHECK_INTERVAL_MS = 5 * 60 * 1000
+# 库存状态界面自动刷新间隔，以及每次最多修改的表格行数（其余行留到下一次）
+LIVE_REFRESH_INTERVAL_MS = 200
+LIVE_PATCH_LIMIT = 500
+
+# 库存分析可选的统计窗口（天）和表格显示行数
+ANALYTICS_WINDOWS = ["90", "180", "365", "730"]
+ANALYTICS_ROW_LIMIT = 500
+
+# 库存估值方法（界面显示名称, 估值方法）和汇总维度
+VALUATION_METHOD_OPTIONS = [
+    ("移动加权平均", METHOD_MOVING_AVERAGE),
+    ("先进先出 (FIFO)", METHOD_FIFO),
+    ("批次成本（个别计价）", METHOD_BATCH_COST),
+]
+VALUATION_GROUPS = ["按类目", "按库位"]
+
 class InventoryManagementSystem:
     """库存管理系统主界面"""
     
-    def __init__(self, root):
+    def __init__(self, root, expiry_days=30, profiler=None, storage_profile=DEFAULT_STORAGE_PROFILE):
         self.root = root
         self.root.title("库存管理系统")
         self.root.geometry("1200x700")
         self.root.configure(bg='#f0f0f0')
         
-        # 初始化数据库
-        self.db = DatabaseManager()
+        # 初始化数据库，常用表预读到页缓存，首次打开各界面不等磁盘
+        self.db = DatabaseManager(storage_profile=storage_profile)
+        self.db.prewarm()
         
         # 当前登录用户
         self.current_user = {
@@ -28,14 +66,50 @@ class InventoryManagementSystem:
         self.last_alert_check = None
         self.alert_notification_shown = False
         
+        # 近效期监控（增量检查，结果并入预警统计）
+        self.expiry_monitor = ExpiryMonitor(self.db, expiry_days)
+        self.expiring_batches = []
+        
+        # 库存分析（结果缓存，有新流水时增量更新）
+        self.analytics = InventoryAnalytics(self.db)
+        
+        # 库存估值（成本随出入库在同一事务中维护，查询只读取维护好的成本）
+        self.valuation = InventoryValuation(self.db)
+        
+        # 采购建议（按供应商生成草稿采购单）
+        self.purchase_planner = PurchasePlanner(self.db)
+        
+        # 库存预警投影（读取前追赶流水日志，只读取预警物资）
+        self.projector = JournalProjector(self.db)
+        
+        # 进程内库存状态读模型（预警计数直接在内存中统计）
+        self.read_model = InventoryReadModel(self.db)
+        
+        # 看板数据（轮询读模型的变化集合，库存状态界面只修改变化的行）
+        self.dashboard = DashboardFeed(self.db, self.read_model)
+        self._live_job = None
+        self._live_pending = {}
+        
+        # 正在分批加载的表格和可排序的表格（按表格路径名），离开界面时取消
+        self._tree_loaders = {}
+        self._tree_sorters = {}
+        
         # 设置样式
         self.setup_styles()
         
+        # 性能分析器需在创建界面前挂接，导航按钮绑定的才是计时后的方法
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.attach(self)
+        
         # 创建主界面
         self.create_main_interface()
         
         # 启动时检查库存预警
         self.check_stock_alerts()
+        
+        # 定时检查近效期批次
+        self.root.after(EXPIRY_CHECK_INTERVAL_MS, self.scheduled_expiry_check)
     
     def setup_styles(self):
         """设置界面样式"""
@@ -52,8 +126,9 @@ class InventoryManagementSystem:
             manual_check: 是否为手动检查（True表示用户点击按钮）
         """
         try:
-            # 获取库存状态数据
-            inventory_data = self.db.get_inventory_status()
+            # 获取预警物资（预警投影先追上最新出入库）
+            self.projector.catch_up()
+            inventory_data = self.db.get_stock_alerts()
             
             # 统计预警信息
             low_stock_items = []
@@ -65,11 +140,15 @@ class InventoryManagementSystem:
                 elif item['status'] == '库存过高':
                     high_stock_items.append(item)
             
+            # 近效期批次（增量检查）
+            self.expiring_batches = self.expiry_monitor.check()
+            
             # 显示预警通知的条件：
             # 1. 有预警信息且未显示过通知（自动检查）
             # 2. 有预警信息且是手动检查（用户点击按钮）
-            if (low_stock_items or high_stock_items) and (not self.alert_notification_shown or manual_check):
-                self.show_alert_notification(low_stock_items, high_stock_items)
+            has_alerts = low_stock_items or high_stock_items or self.expiring_batches
+            if has_alerts and (not self.alert_notification_shown or manual_check):
+                self.show_alert_notification(low_stock_items, high_stock_items, self.expiring_batches)
                 self.alert_notification_shown = True
             
             # 更新最后检查时间
@@ -81,6 +160,24 @@ class InventoryManagementSystem:
         except Exception as e:
             print(f"检查库存预警时出错: {e}")
     
+    def scheduled_expiry_check(self):
+        """定时检查近效期批次并刷新预警统计（不弹出通知）"""
+        try:
+            self.expiring_batches = self.expiry_monitor.check()
+            self.update_alert_summary()
+        except Exception as e:
+            print(f"检查近效期批次时出错: {e}")
+        finally:
+            self.root.after(EXPIRY_CHECK_INTERVAL_MS, self.scheduled_expiry_check)
+    
+    def format_alert_text(self, low_stock_count, high_stock_count):
+        """生成预警统计文本和颜色"""
+        expiring_count = len(self.expiring_batches)
+        alert_text = (f"库存预警: 库存不足 {low_stock_count} 种 | 库存过高 {high_stock_count} 种"
+                      f" | 近效期 {expiring_count} 批")
+        has_alerts = low_stock_count > 0 or high_stock_count > 0 or expiring_count > 0
+        return alert_text, '#e74c3c' if has_alerts else '#27ae60'
+    
     def update_alert_summary(self):
         """更新预警统计标签"""
         try:
@@ -92,14 +189,13 @@ class InventoryManagementSystem:
                 if isinstance(widget, tk.Frame):
                     for child in widget.winfo_children():
                         if isinstance(child, tk.Label) and "库存预警" in child.cget("text"):
-                            alert_text = f"库存预警: 库存不足 {low_stock_count} 种 | 库存过高 {high_stock_count} 种"
-                            child.configure(text=alert_text, 
-                                          fg='#e74c3c' if low_stock_count > 0 or high_stock_count > 0 else '#27ae60')
+                            alert_text, alert_color = self.format_alert_text(low_stock_count, high_stock_count)
+                            child.configure(text=alert_text, fg=alert_color)
                             break
         except Exception as e:
             print(f"更新预警统计标签时出错: {e}")
     
-    def show_alert_notification(self, low_stock_items, high_stock_items):
+    def show_alert_notification(self, low_stock_items, high_stock_items, expiring_batches=()):
         """显示库存预警通知"""
         # 构建预警消息
         alert_message = "库存预警通知：\n\n"
@@ -107,7 +203,7 @@ class InventoryManagementSystem:
         if low_stock_items:
             alert_message += f"⚠️ 库存不足物资 ({len(low_stock_items)}种):\n"
             for item in low_stock_items[:5]:  # 最多显示5种
-                alert_message += f"   • {item['item_name']} (当前: {item['current_stock']}{item['unit']}, 最低: {item['min_stock']}{item['unit']})\n"
+                alert_message += f"   • {item['item_name']} (当前: {item['current_stock']}{item['unit']}, 补货点: {item['reorder_point']}{item['unit']})\n"
             if len(low_stock_items) > 5:
                 alert_message += f"   ... 还有 {len(low_stock_items) - 5} 种物资库存不足\n"
             alert_message += "\n"
@@ -118,25 +214,29 @@ class InventoryManagementSystem:
                 alert_message += f"   • {item['item_name']} (当前: {item['current_stock']}{item['unit']}, 最高: {item['max_stock']}{item['unit']})\n"
             if len(high_stock_items) > 5:
                 alert_message += f"   ... 还有 {len(high_stock_items) - 5} 种物资库存过高\n"
+            alert_message += "\n"
+        
+        if expiring_batches:
+            alert_message += f"⏰ 近效期批次 ({len(expiring_batches)}批):\n"
+            for batch in expiring_batches[:5]:  # 最多显示5批
+                state = "已过期" if batch['days_left'] < 0 else f"剩余{batch['days_left']}天"
+                alert_message += f"   • {batch['item_name']} 批次{batch['batch_number'] or '无'} (有效期至: {batch['expiry_date']}, {state})\n"
+            if len(expiring_batches) > 5:
+                alert_message += f"   ... 还有 {len(expiring_batches) - 5} 批即将过期\n"
         
-        # 显示通知对话框
-        messagebox.showwarning("库存预警", alert_message)
+        # 显示通知对话框；有低库存物资时可直接为全部低库存物资生成草稿采购单
+        if low_stock_items:
+            alert_message += f"\n是否为全部 {len(low_stock_items)} 种低库存物资按供应商生成草稿采购单？"
+            if messagebox.askyesno("库存预警", alert_message, icon='warning'):
+                self.generate_purchase_orders()
+        else:
+            messagebox.showwarning("库存预警", alert_message)
     
     def get_alert_summary(self):
         """获取预警摘要信息"""
         try:
-            inventory_data = self.db.get_inventory_status()
-            
-            low_stock_count = 0
-            high_stock_count = 0
-            
-            for item in inventory_data:
-                if item['status'] == '库存不足':
-                    low_stock_count += 1
-                elif item['status'] == '库存过高':
-                    high_stock_count += 1
-            
-            return low_stock_count, high_stock_count
+            counts = self.read_model.get_status_counts()
+            return counts[STATUS_LOW], counts[STATUS_HIGH]
         except Exception as e:
             print(f"获取预警摘要时出错: {e}")
             return 0, 0
@@ -186,6 +286,10 @@ class InventoryManagementSystem:
             ("物资出库", self.show_stock_out),
             ("入库记录", self.show_stock_in_records),
             ("出库记录", self.show_stock_out_records),
+            ("库存调拨", self.show_stock_transfer),
+            ("库存分析", self.show_inventory_analytics),
+            ("库存估值", self.show_inventory_valuation),
+            ("采购建议", self.show_purchase_orders),
             ("用户管理", self.show_user_management)
         ]
         
@@ -206,9 +310,44 @@ class InventoryManagementSystem:
     
     def clear_content(self):
         """清空内容区域"""
+        # 停止库存状态界面的自动刷新
+        if self._live_job is not None:
+            self.root.after_cancel(self._live_job)
+            self._live_job = None
+        self._live_pending = {}
+        # 停止未完成的表格加载
+        for loader in self._tree_loaders.values():
+            loader.cancel()
+        for sorter in self._tree_sorters.values():
+            sorter.cancel()
+        self._tree_loaders = {}
+        self._tree_sorters = {}
         for widget in self.content_frame.winfo_children():
             widget.destroy()
     
+    def load_tree(self, tree, rows, row_values, row_options=None):
+        """分批向表格插入行（首批立即显示，其余在空闲时插入），同一表格上未完成的加载先取消"""
+        self._cancel_tree_load(tree)
+        # 表格换成了未排序的完整结果
+        sorter = self._tree_sorters.get(str(tree))
+        if sorter is not None:
+            sorter.reset()
+        loader = TreeviewLoader(tree, rows, row_values, row_options)
+        self._tree_loaders[str(tree)] = loader
+        return loader.start()
+    
+    def _cancel_tree_load(self, tree):
+        loader = self._tree_loaders.pop(str(tree), None)
+        if loader is not None:
+            loader.cancel()
+    
+    def add_tree_sorting(self, tree, columns, fetch_page, page_key, row_values, row_options=None):
+        """表头点击排序（数据库按索引列 ORDER BY，键集分页），排序前取消表格上未完成的分批加载"""
+        sorter = TreeviewSorter(tree, columns, fetch_page, page_key, row_values, row_options,
+                                on_sort=lambda: self._cancel_tree_load(tree))
+        self._tree_sorters[str(tree)] = sorter
+        return sorter
+    
     def show_inventory_status(self):
         """显示库存状态"""
         self.clear_content()
@@ -225,10 +364,9 @@ class InventoryManagementSystem:
         low_stock_count, high_stock_count = self.get_alert_summary()
         
         # 预警统计标签
-        alert_text = f"库存预警: 库存不足 {low_stock_count} 种 | 库存过高 {high_stock_count} 种"
+        alert_text, alert_color = self.format_alert_text(low_stock_count, high_stock_count)
         alert_label = tk.Label(alert_frame, text=alert_text, 
-                              font=('微软雅黑', 11), bg='#f0f0f0',
-                              fg='#e74c3c' if low_stock_count > 0 or high_stock_count > 0 else '#27ae60')
+                              font=('微软雅黑', 11), bg='#f0f0f0', fg=alert_color)
         alert_label.pack(side='left', padx=(0, 20))
         
         # 检查预警按钮
@@ -236,6 +374,27 @@ class InventoryManagementSystem:
                                    command=lambda: self.check_stock_alerts(manual_check=True),
                                    font=('微软雅黑', 10), bg='#f39c12', fg='white')
         check_alert_btn.pack(side='left')
+        self.inventory_alert_label = alert_label
+        
+        # 自动刷新开关
+        self.live_refresh_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(alert_frame, text="自动刷新", variable=self.live_refresh_var,
+                      bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left', padx=(20, 0))
+        
+        # 指标卡片
+        kpi_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        kpi_frame.pack(fill='x', pady=(0, 10))
+        self.kpi_labels = {}
+        for key, text, color in (('total_value', '库存总值', '#2c3e50'),
+                                 ('low_stock', '库存不足', '#e74c3c'),
+                                 ('high_stock', '库存过高', '#f39c12'),
+                                 ('movements_today', '今日出入库', '#3498db')):
+            tile = tk.Frame(kpi_frame, bg='white', padx=15, pady=8)
+            tile.pack(side='left', padx=(0, 10))
+            tk.Label(tile, text=text, font=('微软雅黑', 10), bg='white', fg='#7f8c8d').pack(anchor='w')
+            value_label = tk.Label(tile, text='-', font=('微软雅黑', 16, 'bold'), bg='white', fg=color)
+            value_label.pack(anchor='w')
+            self.kpi_labels[key] = value_label
         
         # 添加搜索框
         search_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
@@ -283,6 +442,10 @@ class InventoryManagementSystem:
                              font=('微软雅黑', 10), bg='#95a5a6', fg='white')
         clear_btn.pack(side='left', padx=5)
         
+        location_btn = tk.Button(button_frame, text="库位分布", command=self.show_location_distribution,
+                                font=('微软雅黑', 10), bg='#8e44ad', fg='white')
+        location_btn.pack(side='left', padx=5)
+        
         # 创建表格框架（包含水平和垂直滚动条）
         table_container = tk.Frame(self.content_frame, bg='white')
         table_container.pack(fill='both', expand=True)
@@ -297,7 +460,7 @@ class InventoryManagementSystem:
         
         # 创建表格
         columns = ('item_code', 'item_name', 'category', 'unit', 'min_stock', 
-                  'max_stock', 'current_stock', 'status')
+                  'max_stock', 'reorder_point', 'current_stock', 'status')
         tree = ttk.Treeview(table_container, columns=columns, show='headings', height=20,
                            xscrollcommand=h_scrollbar.set, yscrollcommand=v_scrollbar.set)
         
@@ -308,6 +471,7 @@ class InventoryManagementSystem:
         tree.heading('unit', text='单位')
         tree.heading('min_stock', text='最低库存')
         tree.heading('max_stock', text='最高库存')
+        tree.heading('reorder_point', text='补货点')
         tree.heading('current_stock', text='当前库存')
         tree.heading('status', text='状态')
         
@@ -318,23 +482,24 @@ class InventoryManagementSystem:
         tree.column('unit', width=60)
         tree.column('min_stock', width=80)
         tree.column('max_stock', width=80)
+        tree.column('reorder_point', width=80)
         tree.column('current_stock', width=80)
         tree.column('status', width=80)
         
         # 获取库存数据
         inventory_data = self.db.get_inventory_status()
         
-        # 添加数据到表格
-        for item in inventory_data:
-            status_color = '#e74c3c' if item['status'] == '库存不足' else (
-                '#f39c12' if item['status'] == '库存过高' else '#27ae60'
-            )
-            
-            tree.insert('', 'end', values=(
-                item['item_code'], item['item_name'], item['category_name'],
-                item['unit'], item['min_stock'], item['max_stock'],
-                item['current_stock'], item['status']
-            ), tags=(status_color,))
+        # 分批添加数据到表格（行ID为物资ID，自动刷新时按ID修改变化的行）
+        self.load_tree(tree, inventory_data, self._inventory_row_values, self._inventory_row_options)
+        self.inventory_tree = tree
+        
+        # 点击表头按当前筛选条件排序
+        self.add_tree_sorting(
+            tree, {'item_code': 'item_code', 'item_name': 'item_name'},
+            lambda sort_by, descending, after, limit: self.db.search_inventory_status(
+                self.search_var.get().strip(), self.category_filter_var.get(), self.status_filter_var.get(),
+                sort_by, descending, after, limit),
+            sort_key, self._inventory_row_values, self._inventory_row_options)
         
         # 设置标签样式
         tree.tag_configure('#e74c3c', foreground='#e74c3c')
@@ -349,8 +514,8 @@ class InventoryManagementSystem:
         
         # 统计信息
         total_items = len(inventory_data)
-        low_stock = len([i for i in inventory_data if i['status'] == '库存不足'])
-        high_stock = len([i for i in inventory_data if i['status'] == '库存过高'])
+        low_stock = len([i for i in inventory_data if i.status == '库存不足'])
+        high_stock = len([i for i in inventory_data if i.status == '库存过高'])
         
         stats_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
         stats_frame.pack(fill='x', pady=10)
@@ -359,6 +524,71 @@ class InventoryManagementSystem:
         stats_label = tk.Label(stats_frame, text=stats_text, 
                               font=('微软雅黑', 12), bg='#f0f0f0')
         stats_label.pack(anchor='w')
+        
+        # 表格已是最新数据，丢弃之前积累的变化后开始自动刷新
+        self.dashboard.poll()
+        self._update_kpi_tiles(self.dashboard.get_kpis())
+        self._live_job = self.root.after(LIVE_REFRESH_INTERVAL_MS, self._live_refresh)
+    
+    @staticmethod
+    def _inventory_row_values(item):
+        return (item.item_code, item.item_name, item.category_name,
+                item.unit, item.min_stock, item.max_stock, item.reorder_point,
+                item.current_stock, item.status)
+    
+    def _inventory_row_options(self, item):
+        return {'iid': str(item.item_id), 'tags': (self._status_color(item.status),)}
+    
+    @staticmethod
+    def _status_color(status):
+        """库存状态对应的表格行颜色标签"""
+        if status == STATUS_LOW:
+            return '#e74c3c'
+        if status == STATUS_HIGH:
+            return '#f39c12'
+        return '#27ae60'
+    
+    def _update_kpi_tiles(self, kpis):
+        """更新指标卡片和预警统计标签"""
+        self.kpi_labels['total_value'].configure(text=f"¥{kpis['total_value']:,.2f}")
+        self.kpi_labels['low_stock'].configure(text=str(kpis['low_stock']))
+        self.kpi_labels['high_stock'].configure(text=str(kpis['high_stock']))
+        self.kpi_labels['movements_today'].configure(text=str(kpis['movements_today']))
+        alert_text, alert_color = self.format_alert_text(kpis['low_stock'], kpis['high_stock'])
+        self.inventory_alert_label.configure(text=alert_text, fg=alert_color)
+    
+    def _live_refresh(self):
+        """库存状态界面定时刷新：只修改库存或状态变化过的行，一次最多 LIVE_PATCH_LIMIT 行"""
+        self._live_job = None
+        if self.live_refresh_var.get():
+            try:
+                update = self.dashboard.poll()
+                if update is not None:
+                    for row in update['changed']:
+                        self._live_pending[row.item_id] = row
+                    self._update_kpi_tiles(update['kpis'])
+                self._patch_inventory_rows()
+            except Exception as e:
+                print(f"刷新库存状态时出错: {e}")
+        self._live_job = self.root.after(LIVE_REFRESH_INTERVAL_MS, self._live_refresh)
+    
+    def _patch_inventory_rows(self):
+        """按物资ID修改表格中变化的行（不在当前搜索结果中的物资跳过）"""
+        tree = self.inventory_tree
+        # 表格还在分批加载时先不修改（加载的是轮询前的数据，变化留到加载完成后）
+        loader = self._tree_loaders.get(str(tree))
+        if loader is not None and loader.active:
+            return
+        for item_id in list(self._live_pending)[:LIVE_PATCH_LIMIT]:
+            row = self._live_pending.pop(item_id)
+            iid = str(item_id)
+            if not tree.exists(iid):
+                continue
+            values = list(tree.item(iid, 'values'))
+            reorder_point = row.reorder_point
+            values[5:9] = [row.max_stock, int(reorder_point) if reorder_point == int(reorder_point) else reorder_point,
+                           row.current_stock, row.status]
+            tree.item(iid, values=values, tags=(self._status_color(row.status),))
     
     def show_category_management(self):
         """显示物资类目管理"""
@@ -403,9 +633,9 @@ class InventoryManagementSystem:
         categories = self.db.get_categories()
         for category in categories:
             tree.insert('', 'end', values=(
-                category['category_id'], category['category_name'],
-                category['description'] or '', category['parent_category'] or '',
-                category['created_at']
+                category.category_id, category.category_name,
+                category.description or '', category.parent_category or '',
+                category.created_at
             ))
         
         # 配置滚动条
@@ -508,14 +738,15 @@ class InventoryManagementSystem:
         
         # 获取物资数据
         items = self.db.get_items()
-        for item in items:
-            self.item_tree.insert('', 'end', values=(
-                item['item_id'], item['item_code'], item['item_name'],
-                item['category_name'], item['specification'] or '',
-                item['unit'], item['supplier'] or '',
-                f"¥{item['purchase_price']:.2f}" if item['purchase_price'] else '',
-                f"¥{item['selling_price']:.2f}" if item['selling_price'] else ''
-            ))
+        self.load_tree(self.item_tree, items, self._item_row_values)
+        
+        # 点击表头按当前筛选条件排序
+        self.add_tree_sorting(
+            self.item_tree, {'item_id': 'item_id', 'item_code': 'item_code', 'item_name': 'item_name'},
+            lambda sort_by, descending, after, limit: self.db.search_items(
+                self.item_search_var.get().strip(), self.item_category_filter_var.get(),
+                self.supplier_filter_var.get(), sort_by, descending, after, limit),
+            sort_key, self._item_row_values)
         
         # 配置滚动条
         h_scrollbar.config(command=self.item_tree.xview)
@@ -567,10 +798,31 @@ class InventoryManagementSystem:
         batch_entry = tk.Entry(form_frame, textvariable=self.batch_var, width=30)
         batch_entry.grid(row=4, column=1, sticky='w', pady=5, padx=5)
         
+        # 生产日期
+        tk.Label(form_frame, text="生产日期:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=5, column=0, sticky='w', pady=5)
+        self.production_date_var = tk.StringVar()
+        production_date_entry = tk.Entry(form_frame, textvariable=self.production_date_var, width=30)
+        production_date_entry.grid(row=5, column=1, sticky='w', pady=5, padx=5)
+        
+        # 有效期至
+        tk.Label(form_frame, text="有效期至:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=6, column=0, sticky='w', pady=5)
+        self.expiry_date_var = tk.StringVar()
+        expiry_date_entry = tk.Entry(form_frame, textvariable=self.expiry_date_var, width=30)
+        expiry_date_entry.grid(row=6, column=1, sticky='w', pady=5, padx=5)
+        tk.Label(form_frame, text="格式: YYYY-MM-DD，可留空", bg='#f0f0f0', fg='#7f8c8d',
+                 font=('微软雅黑', 9)).grid(row=6, column=2, sticky='w', pady=5)
+        
+        # 库位（可选择已有库位或输入新库位）
+        tk.Label(form_frame, text="库位:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=7, column=0, sticky='w', pady=5)
+        self.location_var = tk.StringVar(value=DEFAULT_LOCATION)
+        location_combo = ttk.Combobox(form_frame, textvariable=self.location_var,
+                                      values=self.db.get_locations(), width=27)
+        location_combo.grid(row=7, column=1, sticky='w', pady=5, padx=5)
+        
         # 入库按钮
         submit_btn = tk.Button(form_frame, text="确认入库", command=self.submit_stock_in,
                               font=('微软雅黑', 12), bg='#3498db', fg='white', width=15)
-        submit_btn.grid(row=5, column=0, columnspan=2, pady=20)
+        submit_btn.grid(row=8, column=0, columnspan=2, pady=20)
     
     def show_stock_out(self):
         """显示物资出库界面"""
@@ -616,18 +868,69 @@ class InventoryManagementSystem:
         purpose_entry = tk.Entry(form_frame, textvariable=self.purpose_var, width=30)
         purpose_entry.grid(row=4, column=1, sticky='w', pady=5, padx=5)
         
+        # 批次分配策略
+        tk.Label(form_frame, text="出库策略:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=5, column=0, sticky='w', pady=5)
+        self.strategy_var = tk.StringVar(value=STOCK_OUT_STRATEGIES[0][0])
+        strategy_combo = ttk.Combobox(form_frame, textvariable=self.strategy_var,
+                                      values=[label for label, _ in STOCK_OUT_STRATEGIES],
+                                      state='readonly', width=27)
+        strategy_combo.grid(row=5, column=1, sticky='w', pady=5, padx=5)
+        
+        # 出库库位（全部库位时按策略跨库位分配批次）
+        tk.Label(form_frame, text="库位:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=6, column=0, sticky='w', pady=5)
+        self.out_location_var = tk.StringVar(value=ALL_LOCATIONS)
+        location_combo = ttk.Combobox(form_frame, textvariable=self.out_location_var,
+                                      values=[ALL_LOCATIONS] + self.db.get_locations(),
+                                      state='readonly', width=27)
+        location_combo.grid(row=6, column=1, sticky='w', pady=5, padx=5)
+        
         # 出库按钮
         submit_btn = tk.Button(form_frame, text="确认出库", command=self.submit_stock_out,
                               font=('微软雅黑', 12), bg='#e74c3c', fg='white', width=15)
-        submit_btn.grid(row=5, column=0, columnspan=2, pady=20)
+        submit_btn.grid(row=7, column=0, columnspan=2, pady=20)
     
-    def show_stock_in_records(self):
-        """显示入库记录"""
+    def add_records_filter(self, show_records, include_archive, start, end):
+        """记录页面的时间范围筛选与归档切换（不限时间时只显示近期的热分区记录）"""
+        filter_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        filter_frame.pack(anchor='w', pady=(0, 10))
+        
+        tk.Label(filter_frame, text="操作日期:", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left')
+        start_var = tk.StringVar(value=start or '')
+        tk.Entry(filter_frame, textvariable=start_var, width=12).pack(side='left', padx=5)
+        tk.Label(filter_frame, text="至", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left')
+        end_var = tk.StringVar(value=end or '')
+        tk.Entry(filter_frame, textvariable=end_var, width=12).pack(side='left', padx=5)
+        
+        def apply_filter():
+            dates = [var.get().strip() or None for var in (start_var, end_var)]
+            for date_text in dates:
+                if date_text:
+                    try:
+                        datetime.strptime(date_text, "%Y-%m-%d")
+                    except ValueError:
+                        messagebox.showerror("错误", "日期格式应为 YYYY-MM-DD")
+                        return
+            show_records(include_archive, *dates)
+        
+        tk.Button(filter_frame, text="查询", command=apply_filter,
+                  font=('微软雅黑', 10), bg='#3498db', fg='white').pack(side='left', padx=5)
+        tk.Label(filter_frame, text="按日期查询时自动包含归档记录", bg='#f0f0f0', fg='#7f8c8d',
+                 font=('微软雅黑', 9)).pack(side='left', padx=5)
+        
+        # 归档过历史流水后才显示
+        if self.db.has_archive() and not (start or end):
+            text = "仅显示近期记录" if include_archive else "包含归档记录"
+            tk.Button(filter_frame, text=text, command=lambda: show_records(not include_archive),
+                      font=('微软雅黑', 10), bg='#95a5a6', fg='white').pack(side='left', padx=5)
+    
+    def show_stock_in_records(self, include_archive=False, start=None, end=None):
+        """显示入库记录（默认只显示热分区，include_archive 为 True 或指定日期范围时包含归档记录）"""
         self.clear_content()
         
         title_label = tk.Label(self.content_frame, text="入库记录", 
                               font=('微软雅黑', 18, 'bold'), bg='#f0f0f0')
         title_label.pack(anchor='w', pady=(0, 20))
+        self.add_records_filter(self.show_stock_in_records, include_archive, start, end)
         
         # 创建表格容器（包含水平和垂直滚动条）
         table_container = tk.Frame(self.content_frame, bg='white')
@@ -659,15 +962,22 @@ class InventoryManagementSystem:
         tree.heading('operator', text='操作员')
         
         # 获取入库记录
-        records = self.db.get_stock_in_records()
-        for record in records:
-            tree.insert('', 'end', values=(
-                record['stock_in_id'], record['item_name'], record['quantity'],
-                record['unit'], f"¥{record['unit_price']:.2f}",
-                f"¥{record['total_amount']:.2f}", record['supplier'] or '',
-                record['batch_number'] or '', record['operation_time'],
-                record['operator']
-            ))
+        def record_values(record):
+            return (record.stock_in_id, record.item_name, record.quantity,
+                    record.unit, f"¥{record.unit_price:.2f}",
+                    f"¥{record.total_amount:.2f}", record.supplier or '',
+                    record.batch_number or '', record.operation_time,
+                    record.operator)
+        
+        records = self.db.get_stock_in_records(include_archive, start, end)
+        self.load_tree(tree, records, record_values)
+        
+        # 点击表头在同一范围内按 ID 或操作时间排序
+        self.add_tree_sorting(
+            tree, {'stock_in_id': 'stock_in_id', 'operation_time': 'operation_time'},
+            lambda sort_by, descending, after, limit: self.db.get_stock_in_records(
+                include_archive, start, end, sort_by, descending, after, limit),
+            lambda record, sort_by: (record[sort_by], record.stock_in_id), record_values)
         
         # 配置滚动条
         h_scrollbar.config(command=tree.xview)
@@ -675,13 +985,14 @@ class InventoryManagementSystem:
         
         tree.pack(side='left', fill='both', expand=True)
     
-    def show_stock_out_records(self):
-        """显示出库记录"""
+    def show_stock_out_records(self, include_archive=False, start=None, end=None):
+        """显示出库记录（默认只显示热分区，include_archive 为 True 或指定日期范围时包含归档记录）"""
         self.clear_content()
         
         title_label = tk.Label(self.content_frame, text="出库记录", 
                               font=('微软雅黑', 18, 'bold'), bg='#f0f0f0')
         title_label.pack(anchor='w', pady=(0, 20))
+        self.add_records_filter(self.show_stock_out_records, include_archive, start, end)
         
         # 创建表格容器（包含水平和垂直滚动条）
         table_container = tk.Frame(self.content_frame, bg='white')
@@ -697,7 +1008,7 @@ class InventoryManagementSystem:
         
         # 创建表格
         columns = ('stock_out_id', 'item_name', 'quantity', 'unit', 'unit_price', 
-                  'total_amount', 'recipient', 'purpose', 'operation_time', 'operator')
+                  'total_amount', 'recipient', 'purpose', 'batches', 'operation_time', 'operator')
         tree = ttk.Treeview(table_container, columns=columns, show='headings', height=15,
                            xscrollcommand=h_scrollbar.set, yscrollcommand=v_scrollbar.set)
         
@@ -709,19 +1020,27 @@ class InventoryManagementSystem:
         tree.heading('total_amount', text='总金额')
         tree.heading('recipient', text='领用人')
         tree.heading('purpose', text='用途')
+        tree.heading('batches', text='出库批次')
         tree.heading('operation_time', text='操作时间')
         tree.heading('operator', text='操作员')
         
         # 获取出库记录
-        records = self.db.get_stock_out_records()
-        for record in records:
-            tree.insert('', 'end', values=(
-                record['stock_out_id'], record['item_name'], record['quantity'],
-                record['unit'], f"¥{record['unit_price']:.2f}",
-                f"¥{record['total_amount']:.2f}", record['recipient'] or '',
-                record['purpose'] or '', record['operation_time'],
-                record['operator']
-            ))
+        def record_values(record):
+            return (record.stock_out_id, record.item_name, record.quantity,
+                    record.unit, f"¥{record.unit_price:.2f}",
+                    f"¥{record.total_amount:.2f}", record.recipient or '',
+                    record.purpose or '', record.batches or '', record.operation_time,
+                    record.operator)
+        
+        records = self.db.get_stock_out_records(include_archive, start, end)
+        self.load_tree(tree, records, record_values)
+        
+        # 点击表头在同一范围内按 ID 或操作时间排序
+        self.add_tree_sorting(
+            tree, {'stock_out_id': 'stock_out_id', 'operation_time': 'operation_time'},
+            lambda sort_by, descending, after, limit: self.db.get_stock_out_records(
+                include_archive, start, end, sort_by, descending, after, limit),
+            lambda record, sort_by: (record[sort_by], record.stock_out_id), record_values)
         
         # 配置滚动条
         h_scrollbar.config(command=tree.xview)
@@ -729,6 +1048,459 @@ class InventoryManagementSystem:
         
         tree.pack(side='left', fill='both', expand=True)
     
+    def show_stock_transfer(self):
+        """显示库存调拨界面（调拨表单和调拨记录）"""
+        self.clear_content()
+        
+        title_label = tk.Label(self.content_frame, text="库存调拨", 
+                              font=('微软雅黑', 18, 'bold'), bg='#f0f0f0')
+        title_label.pack(anchor='w', pady=(0, 20))
+        
+        form_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        form_frame.pack(fill='x', pady=10)
+        
+        locations = self.db.get_locations()
+        
+        tk.Label(form_frame, text="选择物资:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=0, column=0, sticky='w', pady=5)
+        self.transfer_item_var = tk.StringVar()
+        items = self.db.get_items()
+        item_names = [f"{item.item_code} - {item.item_name}" for item in items]
+        item_combo = ttk.Combobox(form_frame, textvariable=self.transfer_item_var, values=item_names, width=30)
+        item_combo.grid(row=0, column=1, sticky='w', pady=5, padx=5)
+        
+        tk.Label(form_frame, text="调拨数量:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=1, column=0, sticky='w', pady=5)
+        self.transfer_quantity_var = tk.StringVar()
+        quantity_entry = tk.Entry(form_frame, textvariable=self.transfer_quantity_var, width=30)
+        quantity_entry.grid(row=1, column=1, sticky='w', pady=5, padx=5)
+        
+        tk.Label(form_frame, text="调出库位:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=2, column=0, sticky='w', pady=5)
+        self.transfer_from_var = tk.StringVar(value=DEFAULT_LOCATION)
+        from_combo = ttk.Combobox(form_frame, textvariable=self.transfer_from_var, values=locations,
+                                  state='readonly', width=27)
+        from_combo.grid(row=2, column=1, sticky='w', pady=5, padx=5)
+        
+        # 调入库位可选择已有库位或输入新库位
+        tk.Label(form_frame, text="调入库位:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=3, column=0, sticky='w', pady=5)
+        self.transfer_to_var = tk.StringVar()
+        to_combo = ttk.Combobox(form_frame, textvariable=self.transfer_to_var, values=locations, width=27)
+        to_combo.grid(row=3, column=1, sticky='w', pady=5, padx=5)
+        
+        tk.Label(form_frame, text="出库策略:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=4, column=0, sticky='w', pady=5)
+        self.transfer_strategy_var = tk.StringVar(value=STOCK_OUT_STRATEGIES[0][0])
+        strategy_combo = ttk.Combobox(form_frame, textvariable=self.transfer_strategy_var,
+                                      values=[label for label, _ in STOCK_OUT_STRATEGIES],
+                                      state='readonly', width=27)
+        strategy_combo.grid(row=4, column=1, sticky='w', pady=5, padx=5)
+        
+        tk.Label(form_frame, text="备注:", bg='#f0f0f0', font=('微软雅黑', 10)).grid(row=5, column=0, sticky='w', pady=5)
+        self.transfer_notes_var = tk.StringVar()
+        notes_entry = tk.Entry(form_frame, textvariable=self.transfer_notes_var, width=30)
+        notes_entry.grid(row=5, column=1, sticky='w', pady=5, padx=5)
+        
+        submit_btn = tk.Button(form_frame, text="确认调拨", command=self.submit_stock_transfer,
+                              font=('微软雅黑', 12), bg='#8e44ad', fg='white', width=15)
+        submit_btn.grid(row=6, column=0, columnspan=2, pady=20)
+        
+        # 调拨记录
+        table_container = tk.Frame(self.content_frame, bg='white')
+        table_container.pack(fill='both', expand=True)
+        v_scrollbar = ttk.Scrollbar(table_container, orient='vertical')
+        v_scrollbar.pack(side='right', fill='y')
+        
+        columns = ('transfer_id', 'item_name', 'quantity', 'unit', 'from_location', 'to_location',
+                   'operation_time', 'operator', 'notes')
+        self.transfer_tree = ttk.Treeview(table_container, columns=columns, show='headings', height=10,
+                                          yscrollcommand=v_scrollbar.set)
+        self.transfer_tree.heading('transfer_id', text='ID')
+        self.transfer_tree.heading('item_name', text='物资名称')
+        self.transfer_tree.heading('quantity', text='数量')
+        self.transfer_tree.heading('unit', text='单位')
+        self.transfer_tree.heading('from_location', text='调出库位')
+        self.transfer_tree.heading('to_location', text='调入库位')
+        self.transfer_tree.heading('operation_time', text='操作时间')
+        self.transfer_tree.heading('operator', text='操作员')
+        self.transfer_tree.heading('notes', text='备注')
+        for column in columns:
+            self.transfer_tree.column(column, width=90)
+        self.transfer_tree.column('operation_time', width=150)
+        v_scrollbar.config(command=self.transfer_tree.yview)
+        self.transfer_tree.pack(side='left', fill='both', expand=True)
+        
+        self._update_transfer_table()
+    
+    def _update_transfer_table(self):
+        """刷新调拨记录表格"""
+        self.transfer_tree.delete(*self.transfer_tree.get_children())
+        self.load_tree(self.transfer_tree, self.db.get_stock_transfers(), lambda record: (
+            record.transfer_id, record.item_name, record.quantity, record.unit,
+            record.from_location, record.to_location, record.operation_time,
+            record.operator, record.notes or ''
+        ))
+    
+    def submit_stock_transfer(self):
+        """提交库存调拨"""
+        item_selection = self.transfer_item_var.get()
+        quantity = self.transfer_quantity_var.get()
+        from_location = self.transfer_from_var.get()
+        to_location = self.transfer_to_var.get().strip()
+        strategy = dict(STOCK_OUT_STRATEGIES).get(self.transfer_strategy_var.get(), "FEFO")
+        
+        if not item_selection:
+            messagebox.showerror("错误", "请选择物资")
+            return
+        try:
+            quantity = int(quantity)
+        except ValueError:
+            messagebox.showerror("错误", "调拨数量必须是整数")
+            return
+        if quantity <= 0:
+            messagebox.showerror("错误", "调拨数量必须大于0")
+            return
+        if not to_location or to_location == from_location:
+            messagebox.showerror("错误", "请选择与调出库位不同的调入库位")
+            return
+        
+        item_code = item_selection.split(' - ')[0]
+        item_id = next((item.item_id for item in self.db.get_items() if item.item_code == item_code), None)
+        if not item_id:
+            messagebox.showerror("错误", "未找到选择的物资")
+            return
+        
+        available = self.db.get_current_stock(item_id, from_location)
+        if available < quantity:
+            messagebox.showerror("错误", f"调出库位库存不足，当前库存：{available}")
+            return
+        
+        if self.db.transfer_stock(item_id, quantity, from_location, to_location,
+                                  operator_id=self.current_user['user_id'],
+                                  notes=self.transfer_notes_var.get(), strategy=strategy):
+            messagebox.showinfo("成功", f"已从 {from_location} 调拨 {quantity} 到 {to_location}")
+            self.transfer_quantity_var.set("")
+            self.transfer_notes_var.set("")
+            self._update_transfer_table()
+        else:
+            messagebox.showerror("错误", "调拨操作失败")
+    
+    def show_inventory_analytics(self):
+        """显示库存分析（ABC 分类、周转率、可用天数）"""
+        self.clear_content()
+        
+        title_label = tk.Label(self.content_frame, text="库存分析", 
+                              font=('微软雅黑', 18, 'bold'), bg='#f0f0f0')
+        title_label.pack(anchor='w', pady=(0, 10))
+        
+        # 筛选条件
+        filter_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        filter_frame.pack(fill='x', pady=(0, 10))
+        
+        tk.Label(filter_frame, text="统计窗口(天):", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left', padx=(0, 5))
+        self.analytics_window_var = tk.StringVar(value="365")
+        window_combo = ttk.Combobox(filter_frame, textvariable=self.analytics_window_var, 
+                                   values=ANALYTICS_WINDOWS, width=8, font=('微软雅黑', 9), state='readonly')
+        window_combo.pack(side='left', padx=5)
+        
+        tk.Label(filter_frame, text="ABC分类:", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left', padx=(20, 5))
+        self.analytics_class_var = tk.StringVar(value="全部")
+        class_combo = ttk.Combobox(filter_frame, textvariable=self.analytics_class_var, 
+                                  values=["全部", "A", "B", "C"], width=8, font=('微软雅黑', 9), state='readonly')
+        class_combo.pack(side='left', padx=5)
+        
+        search_btn = tk.Button(filter_frame, text="查询", command=self.search_inventory_analytics,
+                              font=('微软雅黑', 10), bg='#3498db', fg='white')
+        search_btn.pack(side='left', padx=(20, 5))
+        
+        # 汇总信息
+        self.analytics_summary_label = tk.Label(self.content_frame, text="", justify='left',
+                                                font=('微软雅黑', 11), bg='#f0f0f0')
+        self.analytics_summary_label.pack(anchor='w', pady=(0, 10))
+        
+        # 创建表格容器（包含水平和垂直滚动条）
+        table_container = tk.Frame(self.content_frame, bg='white')
+        table_container.pack(fill='both', expand=True)
+        
+        h_scrollbar = ttk.Scrollbar(table_container, orient='horizontal')
+        h_scrollbar.pack(side='bottom', fill='x')
+        
+        v_scrollbar = ttk.Scrollbar(table_container, orient='vertical')
+        v_scrollbar.pack(side='right', fill='y')
+        
+        columns = ('item_code', 'item_name', 'abc_class', 'usage', 'consumption_value',
+                  'avg_daily_usage', 'current_stock', 'turnover', 'days_of_cover')
+        self.analytics_tree = ttk.Treeview(table_container, columns=columns, show='headings', height=15,
+                                           xscrollcommand=h_scrollbar.set, yscrollcommand=v_scrollbar.set)
+        
+        self.analytics_tree.heading('item_code', text='物资编码')
+        self.analytics_tree.heading('item_name', text='物资名称')
+        self.analytics_tree.heading('abc_class', text='ABC分类')
+        self.analytics_tree.heading('usage', text='消耗量')
+        self.analytics_tree.heading('consumption_value', text='消耗金额')
+        self.analytics_tree.heading('avg_daily_usage', text='日均用量')
+        self.analytics_tree.heading('current_stock', text='当前库存')
+        self.analytics_tree.heading('turnover', text='年周转率')
+        self.analytics_tree.heading('days_of_cover', text='可用天数')
+        
+        for column in columns:
+            self.analytics_tree.column(column, width=90)
+        self.analytics_tree.column('item_name', width=150)
+        
+        self.analytics_tree.tag_configure('A', foreground='#e74c3c')
+        self.analytics_tree.tag_configure('B', foreground='#f39c12')
+        
+        h_scrollbar.config(command=self.analytics_tree.xview)
+        v_scrollbar.config(command=self.analytics_tree.yview)
+        
+        self.analytics_tree.pack(side='left', fill='both', expand=True)
+        
+        self.search_inventory_analytics()
+    
+    def search_inventory_analytics(self):
+        """按统计窗口和 ABC 分类刷新库存分析表格"""
+        window_days = int(self.analytics_window_var.get())
+        abc_class = self.analytics_class_var.get()
+        abc_class = None if abc_class == "全部" else abc_class
+        
+        try:
+            summary = self.analytics.compute(window_days)['summary']
+            rows = self.analytics.get_rows(window_days, abc_class, ANALYTICS_ROW_LIMIT)
+        except Exception as e:
+            messagebox.showerror("错误", f"库存分析出错：{str(e)}")
+            return
+        
+        class_text = " | ".join(
+            f"{abc_class}类 {summary[abc_class]['count']} 种 ({summary[abc_class]['value_share']:.1%})"
+            for abc_class in ('A', 'B', 'C'))
+        engine_text = "NumPy 向量化计算" if self.analytics.use_numpy else "纯 Python 计算（未安装 NumPy）"
+        self.analytics_summary_label.configure(
+            text=f"物资 {summary['item_count']} 种 | 近 {window_days} 天消耗金额 ¥{summary['total_value']:,.2f}\n"
+                 f"{class_text} | 按消耗金额显示前 {ANALYTICS_ROW_LIMIT} 项 | {engine_text}")
+        
+        self.analytics_tree.delete(*self.analytics_tree.get_children())
+        for row in rows:
+            self.analytics_tree.insert('', 'end', values=(
+                row.item_code, row.item_name, row.abc_class,
+                f"{row.usage:g}", f"¥{row.consumption_value:,.2f}",
+                f"{row.avg_daily_usage:.2f}", f"{row.current_stock:g}",
+                f"{row.turnover:.1f}" if row.turnover is not None else '-',
+                f"{row.days_of_cover:.0f}" if row.days_of_cover is not None else '无消耗'
+            ), tags=(row.abc_class,))
+    
+    def show_inventory_valuation(self):
+        """显示库存估值（按类目或库位汇总库存金额）"""
+        self.clear_content()
+        
+        title_label = tk.Label(self.content_frame, text="库存估值", 
+                              font=('微软雅黑', 18, 'bold'), bg='#f0f0f0')
+        title_label.pack(anchor='w', pady=(0, 10))
+        
+        # 筛选条件
+        filter_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        filter_frame.pack(fill='x', pady=(0, 10))
+        
+        tk.Label(filter_frame, text="估值方法:", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left', padx=(0, 5))
+        self.valuation_method_var = tk.StringVar(value=VALUATION_METHOD_OPTIONS[0][0])
+        method_combo = ttk.Combobox(filter_frame, textvariable=self.valuation_method_var,
+                                   values=[name for name, _ in VALUATION_METHOD_OPTIONS],
+                                   width=18, font=('微软雅黑', 9), state='readonly')
+        method_combo.pack(side='left', padx=5)
+        
+        tk.Label(filter_frame, text="汇总:", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left', padx=(20, 5))
+        self.valuation_group_var = tk.StringVar(value=VALUATION_GROUPS[0])
+        group_combo = ttk.Combobox(filter_frame, textvariable=self.valuation_group_var,
+                                  values=VALUATION_GROUPS, width=8, font=('微软雅黑', 9), state='readonly')
+        group_combo.pack(side='left', padx=5)
+        
+        search_btn = tk.Button(filter_frame, text="查询", command=self.search_inventory_valuation,
+                              font=('微软雅黑', 10), bg='#3498db', fg='white')
+        search_btn.pack(side='left', padx=(20, 5))
+        
+        # 汇总信息
+        self.valuation_summary_label = tk.Label(self.content_frame, text="", justify='left',
+                                                font=('微软雅黑', 11), bg='#f0f0f0')
+        self.valuation_summary_label.pack(anchor='w', pady=(0, 10))
+        
+        table_container = tk.Frame(self.content_frame, bg='white')
+        table_container.pack(fill='both', expand=True)
+        
+        v_scrollbar = ttk.Scrollbar(table_container, orient='vertical')
+        v_scrollbar.pack(side='right', fill='y')
+        
+        columns = ('name', 'item_count', 'quantity', 'value', 'share')
+        self.valuation_tree = ttk.Treeview(table_container, columns=columns, show='headings', height=15,
+                                           yscrollcommand=v_scrollbar.set)
+        
+        self.valuation_tree.heading('name', text='类目')
+        self.valuation_tree.heading('item_count', text='物资种数')
+        self.valuation_tree.heading('quantity', text='库存数量')
+        self.valuation_tree.heading('value', text='库存金额')
+        self.valuation_tree.heading('share', text='金额占比')
+        
+        for column in columns:
+            self.valuation_tree.column(column, width=110)
+        self.valuation_tree.column('name', width=180)
+        
+        v_scrollbar.config(command=self.valuation_tree.yview)
+        self.valuation_tree.pack(side='left', fill='both', expand=True)
+        
+        self.search_inventory_valuation()
+    
+    def search_inventory_valuation(self):
+        """按估值方法和汇总维度刷新库存估值表格"""
+        method = dict(VALUATION_METHOD_OPTIONS)[self.valuation_method_var.get()]
+        by_category = self.valuation_group_var.get() == VALUATION_GROUPS[0]
+        
+        try:
+            if by_category:
+                rows = self.valuation.get_value_by_category(method)
+            else:
+                rows = self.valuation.get_value_by_location(method)
+            totals = {name: self.valuation.get_total_value(value) for name, value in VALUATION_METHOD_OPTIONS}
+        except Exception as e:
+            messagebox.showerror("错误", f"库存估值出错：{str(e)}")
+            return
+        
+        total_text = " | ".join(f"{name} ¥{total:,.2f}" for name, total in totals.items())
+        self.valuation_summary_label.configure(text=f"库存总金额：{total_text}")
+        
+        self.valuation_tree.heading('name', text='类目' if by_category else '库位')
+        self.valuation_tree.delete(*self.valuation_tree.get_children())
+        total = sum(row.value or 0 for row in rows)
+        for row in rows:
+            self.valuation_tree.insert('', 'end', values=(
+                row.category_name if by_category else row.location,
+                row.item_count, f"{row.quantity:g}", f"¥{row.value:,.2f}",
+                f"{row.value / total:.1%}" if total else '-'
+            ))
+    
+    def generate_purchase_orders(self):
+        """为全部低库存物资生成草稿采购单（每个供应商一张）"""
+        try:
+            result = self.purchase_planner.create_draft_orders(created_by=self.current_user['user_id'])
+        except Exception as e:
+            messagebox.showerror("错误", f"生成采购单出错：{str(e)}")
+            return
+        if result['orders']:
+            messagebox.showinfo("成功", f"已生成草稿采购单 {result['orders']} 张，共 {result['lines']} 种物资，"
+                                      f"金额 ¥{result['total_amount']:,.2f}")
+        else:
+            messagebox.showinfo("提示", "没有需要补货的物资（低库存物资均已有在途采购单）")
+        if getattr(self, 'purchase_order_tree', None) is not None and self.purchase_order_tree.winfo_exists():
+            self.search_purchase_orders()
+    
+    def show_purchase_orders(self):
+        """显示采购建议（草稿采购单及明细）"""
+        self.clear_content()
+        
+        title_label = tk.Label(self.content_frame, text="采购建议", 
+                              font=('微软雅黑', 18, 'bold'), bg='#f0f0f0')
+        title_label.pack(anchor='w', pady=(0, 10))
+        
+        # 操作和筛选
+        action_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        action_frame.pack(fill='x', pady=(0, 10))
+        
+        generate_btn = tk.Button(action_frame, text="生成采购建议", command=self.generate_purchase_orders,
+                                font=('微软雅黑', 10), bg='#27ae60', fg='white')
+        generate_btn.pack(side='left')
+        
+        tk.Label(action_frame, text="状态:", bg='#f0f0f0', font=('微软雅黑', 10)).pack(side='left', padx=(20, 5))
+        self.purchase_status_var = tk.StringVar(value="全部")
+        status_combo = ttk.Combobox(action_frame, textvariable=self.purchase_status_var, 
+                                   values=["全部"] + list(PO_STATUSES), width=8, font=('微软雅黑', 9), state='readonly')
+        status_combo.pack(side='left', padx=5)
+        status_combo.bind('<<ComboboxSelected>>', lambda e: self.search_purchase_orders())
+        
+        for text, status, color in (("标记已下单", PO_STATUS_ORDERED, '#3498db'),
+                                    ("标记已收货", PO_STATUS_RECEIVED, '#16a085'),
+                                    ("作废", PO_STATUS_CANCELLED, '#e74c3c')):
+            btn = tk.Button(action_frame, text=text, command=lambda s=status: self.update_purchase_order_status(s),
+                           font=('微软雅黑', 10), bg=color, fg='white')
+            btn.pack(side='left', padx=(10, 0))
+        
+        # 采购单表格（上）和选中采购单的明细（下）
+        tables_frame = tk.Frame(self.content_frame, bg='#f0f0f0')
+        tables_frame.pack(fill='both', expand=True)
+        
+        order_container = tk.Frame(tables_frame, bg='white')
+        order_container.pack(fill='both', expand=True, pady=(0, 10))
+        order_scrollbar = ttk.Scrollbar(order_container, orient='vertical')
+        order_scrollbar.pack(side='right', fill='y')
+        
+        columns = ('po_id', 'supplier', 'status', 'line_count', 'total_amount', 'created_at', 'created_by')
+        self.purchase_order_tree = ttk.Treeview(order_container, columns=columns, show='headings', height=8,
+                                                yscrollcommand=order_scrollbar.set)
+        self.purchase_order_tree.heading('po_id', text='采购单号')
+        self.purchase_order_tree.heading('supplier', text='供应商')
+        self.purchase_order_tree.heading('status', text='状态')
+        self.purchase_order_tree.heading('line_count', text='物资种数')
+        self.purchase_order_tree.heading('total_amount', text='金额')
+        self.purchase_order_tree.heading('created_at', text='创建时间')
+        self.purchase_order_tree.heading('created_by', text='创建人')
+        for column in columns:
+            self.purchase_order_tree.column(column, width=100)
+        self.purchase_order_tree.column('created_at', width=150)
+        order_scrollbar.config(command=self.purchase_order_tree.yview)
+        self.purchase_order_tree.pack(side='left', fill='both', expand=True)
+        self.purchase_order_tree.bind('<<TreeviewSelect>>', lambda e: self.show_purchase_order_lines())
+        
+        line_container = tk.Frame(tables_frame, bg='white')
+        line_container.pack(fill='both', expand=True)
+        line_scrollbar = ttk.Scrollbar(line_container, orient='vertical')
+        line_scrollbar.pack(side='right', fill='y')
+        
+        columns = ('item_code', 'item_name', 'unit', 'quantity', 'unit_price', 'amount')
+        self.purchase_line_tree = ttk.Treeview(line_container, columns=columns, show='headings', height=8,
+                                               yscrollcommand=line_scrollbar.set)
+        self.purchase_line_tree.heading('item_code', text='物资编码')
+        self.purchase_line_tree.heading('item_name', text='物资名称')
+        self.purchase_line_tree.heading('unit', text='单位')
+        self.purchase_line_tree.heading('quantity', text='采购数量')
+        self.purchase_line_tree.heading('unit_price', text='单价')
+        self.purchase_line_tree.heading('amount', text='金额')
+        for column in columns:
+            self.purchase_line_tree.column(column, width=100)
+        self.purchase_line_tree.column('item_name', width=150)
+        line_scrollbar.config(command=self.purchase_line_tree.yview)
+        self.purchase_line_tree.pack(side='left', fill='both', expand=True)
+        
+        self.search_purchase_orders()
+    
+    def search_purchase_orders(self):
+        """按状态刷新采购单表格"""
+        status = self.purchase_status_var.get()
+        orders = self.db.get_purchase_orders(None if status == "全部" else status)
+        
+        self.purchase_order_tree.delete(*self.purchase_order_tree.get_children())
+        self.purchase_line_tree.delete(*self.purchase_line_tree.get_children())
+        for order in orders:
+            self.purchase_order_tree.insert('', 'end', iid=str(order.po_id), values=(
+                order.po_id, order.supplier, order.status, order.line_count,
+                f"¥{order.total_amount:,.2f}", order.created_at, order.created_by or ''
+            ))
+    
+    def show_purchase_order_lines(self):
+        """显示选中采购单的明细"""
+        selection = self.purchase_order_tree.selection()
+        self.purchase_line_tree.delete(*self.purchase_line_tree.get_children())
+        if not selection:
+            return
+        for line in self.db.get_purchase_order_lines(int(selection[0])):
+            self.purchase_line_tree.insert('', 'end', values=(
+                line.item_code, line.item_name, line.unit, line.quantity,
+                f"¥{line.unit_price:.2f}", f"¥{line.amount:,.2f}"
+            ))
+    
+    def update_purchase_order_status(self, status):
+        """修改选中采购单的状态（已收货、已作废的采购单不再计入在途量）"""
+        selection = self.purchase_order_tree.selection()
+        if not selection:
+            messagebox.showwarning("提示", "请先选择采购单")
+            return
+        po_id = int(selection[0])
+        if self.db.set_purchase_order_status(po_id, status):
+            self.search_purchase_orders()
+        else:
+            messagebox.showerror("错误", f"采购单 {po_id} 已收货或已作废，不能修改状态")
+    
     def show_user_management(self):
         """显示用户管理界面"""
         self.clear_content()
@@ -772,8 +1544,8 @@ class InventoryManagementSystem:
         users = self.db.get_users()
         for user in users:
             tree.insert('', 'end', values=(
-                user['user_id'], user['username'], user['full_name'],
-                user['role'], user['created_at']
+                user.user_id, user.username, user.full_name,
+                user.role, user.created_at
             ))
         
         # 配置滚动条
@@ -787,7 +1559,7 @@ class InventoryManagementSystem:
         """添加类目对话框"""
         dialog = tk.Toplevel(self.root)
         dialog.title("添加物资类目")
-        dialog.geometry("400x200")
+        dialog.geometry("400x260")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -799,11 +1571,22 @@ class InventoryManagementSystem:
         desc_entry = tk.Entry(dialog, width=30)
         desc_entry.pack(pady=5)
         
+        tk.Label(dialog, text="父类目:").pack(pady=5)
+        category_tree = self.db.get_category_tree()
+        parent_var = tk.StringVar(value="无")
+        parent_names = ["无"] + [category_tree.names[category_id]
+                                for root_id in category_tree.roots()
+                                for category_id in category_tree.subtree_ids(root_id)]
+        parent_combo = ttk.Combobox(dialog, textvariable=parent_var, values=parent_names,
+                                    state='readonly', width=27)
+        parent_combo.pack(pady=5)
+        
         def submit():
             name = name_entry.get().strip()
             desc = desc_entry.get().strip()
+            parent_id = category_tree.ids_by_name.get(parent_var.get())
             if name:
-                if self.db.add_category(name, desc):
+                if self.db.add_category(name, desc, parent_id):
                     messagebox.showinfo("成功", "类目添加成功")
                     dialog.destroy()
                     self.show_category_management()
@@ -921,6 +1704,8 @@ class InventoryManagementSystem:
                 )
                 
                 if success:
+                    # 新物资没有库存，可能低于最低库存
+                    self.projector.refresh_alerts()
                     messagebox.showinfo("成功", "物资添加成功")
                     dialog.destroy()
                     # 刷新物资列表
@@ -1011,6 +1796,47 @@ class InventoryManagementSystem:
         self._update_inventory_table(self.db.get_inventory_status())
         messagebox.showinfo("提示", "已清除搜索条件，显示所有库存记录")
     
+    def show_location_distribution(self):
+        """在新窗口中按库位透视显示各物资库存（只列出有库存的物资）"""
+        try:
+            locations = self.db.get_locations()
+            rows = [row for row in self.db.get_inventory_status(by_location=True) if row.location_stock]
+        except Exception as e:
+            messagebox.showerror("错误", f"查询库位库存出错：{str(e)}")
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("库位分布")
+        window.geometry("900x500")
+        
+        table_container = tk.Frame(window, bg='white')
+        table_container.pack(fill='both', expand=True)
+        h_scrollbar = ttk.Scrollbar(table_container, orient='horizontal')
+        h_scrollbar.pack(side='bottom', fill='x')
+        v_scrollbar = ttk.Scrollbar(table_container, orient='vertical')
+        v_scrollbar.pack(side='right', fill='y')
+        
+        columns = ['item_code', 'item_name', 'unit', 'current_stock'] + [f"loc{i}" for i in range(len(locations))]
+        tree = ttk.Treeview(table_container, columns=columns, show='headings',
+                           xscrollcommand=h_scrollbar.set, yscrollcommand=v_scrollbar.set)
+        tree.heading('item_code', text='物资编码')
+        tree.heading('item_name', text='物资名称')
+        tree.heading('unit', text='单位')
+        tree.heading('current_stock', text='合计')
+        for index, location in enumerate(locations):
+            tree.heading(f"loc{index}", text=location)
+        for column in columns:
+            tree.column(column, width=90)
+        tree.column('item_name', width=150)
+        
+        for row in rows:
+            tree.insert('', 'end', values=[row.item_code, row.item_name, row.unit, row.current_stock] +
+                        [row.location_stock.get(location, '') for location in locations])
+        
+        h_scrollbar.config(command=tree.xview)
+        v_scrollbar.config(command=tree.yview)
+        tree.pack(side='left', fill='both', expand=True)
+    
     def search_items(self):
         """搜索物资信息"""
         keyword = self.item_search_var.get().strip()
@@ -1045,18 +1871,18 @@ class InventoryManagementSystem:
     def _update_item_table(self, data):
         """更新物资信息表格"""
         # 清空表格
-        for item in self.item_tree.get_children():
-            self.item_tree.delete(item)
-        
-        # 添加新数据
-        for item in data:
-            self.item_tree.insert('', 'end', values=(
-                item['item_id'], item['item_code'], item['item_name'],
-                item['category_name'], item['specification'] or '',
-                item['unit'], item['supplier'] or '',
-                f"¥{item['purchase_price']:.2f}" if item['purchase_price'] else '',
-                f"¥{item['selling_price']:.2f}" if item['selling_price'] else ''
-            ))
+        self.item_tree.delete(*self.item_tree.get_children())
+        
+        # 分批添加新数据
+        self.load_tree(self.item_tree, data, self._item_row_values)
+    
+    @staticmethod
+    def _item_row_values(item):
+        return (item.item_id, item.item_code, item.item_name,
+                item.category_name, item.specification or '',
+                item.unit, item.supplier or '',
+                f"¥{item.purchase_price:.2f}" if item.purchase_price else '',
+                f"¥{item.selling_price:.2f}" if item.selling_price else '')
     
     def _update_inventory_table(self, data):
         """更新库存表格数据"""
@@ -1069,17 +1895,8 @@ class InventoryManagementSystem:
                         # 清空现有数据
                         child.delete(*child.get_children())
                         
-                        # 添加新数据
-                        for item in data:
-                            status_color = '#e74c3c' if item['status'] == '库存不足' else (
-                                '#f39c12' if item['status'] == '库存过高' else '#27ae60'
-                            )
-                            
-                            child.insert('', 'end', values=(
-                                item['item_code'], item['item_name'], item['category_name'],
-                                item['unit'], item['min_stock'], item['max_stock'],
-                                item['current_stock'], item['status']
-                            ), tags=(status_color,))
+                        # 分批添加新数据
+                        self.load_tree(child, data, self._inventory_row_values, self._inventory_row_options)
                         return
     
     def submit_stock_in(self):
@@ -1091,6 +1908,9 @@ class InventoryManagementSystem:
             unit_price = self.price_var.get()
             supplier = self.supplier_var.get()
             batch_number = self.batch_var.get()
+            production_date = self.production_date_var.get().strip()
+            expiry_date = self.expiry_date_var.get().strip()
+            location = self.location_var.get().strip() or DEFAULT_LOCATION
             
             # 验证必填字段
             if not item_selection:
@@ -1119,6 +1939,15 @@ class InventoryManagementSystem:
                 messagebox.showerror("错误", "单价不能为负数")
                 return
             
+            # 验证日期格式
+            for date_text, field_name in ((production_date, "生产日期"), (expiry_date, "有效期")):
+                if date_text:
+                    try:
+                        datetime.strptime(date_text, "%Y-%m-%d")
+                    except ValueError:
+                        messagebox.showerror("错误", f"{field_name}格式应为 YYYY-MM-DD")
+                        return
+            
             # 解析物资选择
             item_code = item_selection.split(' - ')[0]
             
@@ -1141,7 +1970,10 @@ class InventoryManagementSystem:
                 unit_price=unit_price,
                 supplier=supplier,
                 batch_number=batch_number,
-                operator_id=self.current_user['user_id']
+                production_date=production_date or None,
+                expiry_date=expiry_date or None,
+                operator_id=self.current_user['user_id'],
+                location=location
             )
             
             if success:
@@ -1152,6 +1984,8 @@ class InventoryManagementSystem:
                 self.price_var.set("")
                 self.supplier_var.set("")
                 self.batch_var.set("")
+                self.production_date_var.set("")
+                self.expiry_date_var.set("")
                 
                 # 入库后检查库存预警
                 self.alert_notification_shown = False  # 重置通知状态
@@ -1171,6 +2005,9 @@ class InventoryManagementSystem:
             unit_price = self.out_price_var.get()
             recipient = self.recipient_var.get()
             purpose = self.purpose_var.get()
+            strategy = dict(STOCK_OUT_STRATEGIES).get(self.strategy_var.get(), "FEFO")
+            location = self.out_location_var.get()
+            location = None if location == ALL_LOCATIONS else location
             
             # 验证必填字段
             if not item_selection:
@@ -1217,13 +2054,8 @@ class InventoryManagementSystem:
                 messagebox.showerror("错误", "未找到选择的物资")
                 return
             
-            # 检查库存是否足够
-            inventory = self.db.get_inventory_status()
-            current_stock = 0
-            for item in inventory:
-                if item['item_code'] == item_code:
-                    current_stock = item['current_stock']
-                    break
+            # 检查库存是否足够（指定库位时只计该库位）
+            current_stock = self.db.get_current_stock(item_id, location)
             
             if current_stock < quantity:
                 messagebox.showerror("错误", f"库存不足，当前库存：{current_stock}")
@@ -1236,7 +2068,9 @@ class InventoryManagementSystem:
                 unit_price=unit_price,
                 recipient=recipient,
                 purpose=purpose,
-                operator_id=self.current_user['user_id']
+                operator_id=self.current_user['user_id'],
+                strategy=strategy,
+                location=location
             )
             
             if success:
@@ -1257,11 +2091,24 @@ class InventoryManagementSystem:
         except Exception as e:
             messagebox.showerror("错误", f"出库操作出错：{str(e)}")
 
-def main():
-    """主函数"""
+def main(expiry_days=30, profile=False, trace_path=None, storage_profile=DEFAULT_STORAGE_PROFILE):
+    """主函数
+    
+    Args:
+        profile: 显示界面性能悬浮窗
+        trace_path: 退出时导出 Chrome 跟踪文件（同时开启性能分析）
+        storage_profile: 数据库存储配置（STORAGE_PROFILES 中的名称）
+    """
     root = tk.Tk()
-    app = InventoryManagementSystem(root)
+    profiler = None
+    if profile or trace_path:
+        from gui_profiler import GuiProfiler
+        profiler = GuiProfiler(trace_path=trace_path, overlay=profile)
+    app = InventoryManagementSystem(root, expiry_days=expiry_days, profiler=profiler,
+                                    storage_profile=storage_profile)
     root.mainloop()
+    if profiler is not None:
+        profiler.write_trace()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+界面性能分析器（可选）
+用 after 心跳测量 Tk 事件循环卡顿，记录每个界面构建/事件处理函数的耗时，
+并把耗时拆分为数据库时间和界面（控件）时间；结果显示在悬浮窗中或导出为 Chrome 跟踪文件
+"""
+
+import functools
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+# 需要计时的界面方法（按名称前缀匹配）
+PROFILED_PREFIXES = ("show_", "search_", "clear_search_", "submit_", "add_", "check_",
+                     "scheduled_", "_update_", "create_")
+
+# 跟踪文件中保留的事件数上限，避免长时间运行占用过多内存
+MAX_TRACE_EVENTS = 200000
+
+
+class GuiProfiler:
+    """Tk 界面性能分析器
+
+    必须在界面创建之前挂接（导航按钮在创建时就绑定了方法），
+    InventoryManagementSystem 通过 profiler 参数在 create_main_interface 之前调用 attach。
+
+    Args:
+        heartbeat_ms: 心跳间隔（毫秒）
+        stall_ms: 心跳延迟超过该值记为一次卡顿
+        trace_path: Chrome 跟踪文件路径（chrome://tracing 或 Perfetto 打开），None 表示不导出
+        overlay: 是否显示悬浮统计窗口
+    """
+
+    def __init__(self, heartbeat_ms: int = 50, stall_ms: int = 100,
+                 trace_path: Optional[str] = None, overlay: bool = True):
+        self.heartbeat_ms = heartbeat_ms
+        self.stall_ms = stall_ms
+        self.trace_path = trace_path
+        self.overlay = overlay
+        self.root = None
+        self._origin = time.perf_counter()
+        self._stack = []  # 当前正在执行的界面函数: [名称, 开始时间, 数据库耗时]
+        self._db_depth = 0
+        self._handlers = {}  # 名称 -> [次数, 总耗时, 数据库耗时, 最大耗时]
+        self._lags = []
+        self._stalls = []
+        self._trace_events = []
+        self._last_handler = None
+        self._expected_beat = None
+        self._overlay_label = None
+
+    # ---------- 挂接 ----------
+    def attach(self, app):
+        """包装 app 的界面方法和 app.db 的公开方法，并启动心跳"""
+        self.root = app.root
+        for name in dir(type(app)):
+            if name.startswith(PROFILED_PREFIXES) and callable(getattr(app, name)):
+                setattr(app, name, self._wrap_handler(name, getattr(app, name)))
+        for name in dir(type(app.db)):
+            if not name.startswith("_") and callable(getattr(app.db, name)):
+                setattr(app.db, name, self._wrap_db(name, getattr(app.db, name)))
+
+        self._expected_beat = time.perf_counter() + self.heartbeat_ms / 1000.0
+        self.root.after(self.heartbeat_ms, self._heartbeat)
+        if self.overlay:
+            self._create_overlay()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _add_trace_event(self, event: Dict):
+        if self.trace_path and len(self._trace_events) < MAX_TRACE_EVENTS:
+            self._trace_events.append(event)
+
+    def _wrap_handler(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            self._stack.append([name, start, 0.0])
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _, _, db_time = self._stack.pop()
+                elapsed = time.perf_counter() - start
+                # 嵌套调用时，子函数的数据库时间同时计入父函数
+                if self._stack:
+                    self._stack[-1][2] += db_time
+                entry = self._handlers.setdefault(name, [0, 0.0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += db_time
+                entry[3] = max(entry[3], elapsed)
+                self._last_handler = name
+                self._add_trace_event({
+                    'name': name, 'cat': 'gui', 'ph': 'X', 'pid': os.getpid(), 'tid': 1,
+                    'ts': (start - self._origin) * 1e6, 'dur': elapsed * 1e6,
+                    'args': {'db_ms': round(db_time * 1000, 3),
+                             'widget_ms': round((elapsed - db_time) * 1000, 3)},
+                })
+        return wrapper
+
+    def _wrap_db(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # 数据库方法互相调用时只统计最外层
+            if self._db_depth:
+                return method(*args, **kwargs)
+            self._db_depth += 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._db_depth -= 1
+                elapsed = time.perf_counter() - start
+                if self._stack:
+                    self._stack[-1][2] += elapsed
+                else:
+                    # 不在任何已计时的界面函数内（如对话框内部的提交函数）
+                    entry = self._handlers.setdefault(f"db.{name}", [0, 0.0, 0.0, 0.0])
+                    entry[0] += 1
+                    entry[1] += elapsed
+                    entry[2] += elapsed
+                    entry[3] = max(entry[3], elapsed)
+                self._add_trace_event({
+                    'name': f"db.{name}", 'cat': 'db', 'ph': 'X', 'pid': os.getpid(), 'tid': 1,
+                    'ts': (start - self._origin) * 1e6, 'dur': elapsed * 1e6,
+                })
+        return wrapper
+
+    # ---------- 事件循环心跳 ----------
+    def _heartbeat(self):
+        now = time.perf_counter()
+        lag_ms = max(0.0, (now - self._expected_beat) * 1000)
+        self._lags.append(lag_ms)
+        if len(self._lags) > 10000:
+            del self._lags[:5000]
+        if lag_ms >= self.stall_ms:
+            stall = {
+                'time': time.strftime("%H:%M:%S"),
+                'lag_ms': round(lag_ms, 1),
+                'last_handler': self._last_handler,
+            }
+            self._stalls.append(stall)
+            self._add_trace_event({
+                'name': f"卡顿 {lag_ms:.0f}ms", 'cat': 'stall', 'ph': 'X', 'pid': os.getpid(), 'tid': 2,
+                'ts': (self._expected_beat - self._origin) * 1e6, 'dur': lag_ms * 1000,
+                'args': stall,
+            })
+        self._last_handler = None
+        self._expected_beat = now + self.heartbeat_ms / 1000.0
+        self.root.after(self.heartbeat_ms, self._heartbeat)
+
+    # ---------- 结果 ----------
+    def get_handler_stats(self) -> List[Dict]:
+        """按总耗时降序返回各界面函数的统计"""
+        stats = []
+        for name, (count, total, db_time, maximum) in self._handlers.items():
+            stats.append({
+                'name': name,
+                'count': count,
+                'total_ms': round(total * 1000, 1),
+                'db_ms': round(db_time * 1000, 1),
+                'widget_ms': round((total - db_time) * 1000, 1),
+                'max_ms': round(maximum * 1000, 1),
+            })
+        stats.sort(key=lambda s: s['total_ms'], reverse=True)
+        return stats
+
+    def get_loop_stats(self) -> Dict:
+        """事件循环延迟统计"""
+        lags = sorted(self._lags)
+        if not lags:
+            return {'beats': 0, 'p50_ms': 0, 'p95_ms': 0, 'max_ms': 0, 'stalls': 0}
+        return {
+            'beats': len(lags),
+            'p50_ms': round(lags[len(lags) // 2], 1),
+            'p95_ms': round(lags[min(len(lags) - 1, int(len(lags) * 0.95))], 1),
+            'max_ms': round(lags[-1], 1),
+            'stalls': len(self._stalls),
+        }
+
+    def get_stalls(self) -> List[Dict]:
+        return list(self._stalls)
+
+    def write_trace(self, path: Optional[str] = None):
+        """导出 Chrome 跟踪文件（traceEvents 格式），附带汇总统计"""
+        path = path or self.trace_path
+        if not path:
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                'traceEvents': self._trace_events,
+                'displayTimeUnit': 'ms',
+                'otherData': {
+                    'loop': self.get_loop_stats(),
+                    'handlers': self.get_handler_stats(),
+                    'stalls': self.get_stalls(),
+                },
+            }, f, ensure_ascii=False)
+        print(f"界面性能跟踪已写入: {path}")
+
+    # ---------- 悬浮窗 ----------
+    def _create_overlay(self):
+        import tkinter as tk
+
+        window = tk.Toplevel(self.root)
+        window.title("界面性能")
+        window.geometry("420x260+20+20")
+        window.attributes('-topmost', True)
+        self._overlay_label = tk.Label(window, justify='left', anchor='nw',
+                                       font=('Consolas', 9), bg='#1e1e1e', fg='#d4d4d4')
+        self._overlay_label.pack(fill='both', expand=True)
+        self._refresh_overlay()
+
+    def _refresh_overlay(self):
+        if self._overlay_label is None or not self._overlay_label.winfo_exists():
+            return
+        loop = self.get_loop_stats()
+        lines = [
+            f"事件循环延迟 p50 {loop['p50_ms']}ms  p95 {loop['p95_ms']}ms  最大 {loop['max_ms']}ms",
+            f"卡顿(≥{self.stall_ms}ms) {loop['stalls']} 次",
+            "",
+            f"{'函数':<26}{'次数':>5}{'总ms':>9}{'数据库':>9}{'界面':>9}",
+        ]
+        for stat in self.get_handler_stats()[:10]:
+            lines.append(f"{stat['name'][:26]:<26}{stat['count']:>5}{stat['total_ms']:>9.1f}"
+                         f"{stat['db_ms']:>9.1f}{stat['widget_ms']:>9.1f}")
+        if self._stalls:
+            last = self._stalls[-1]
+            lines.append("")
+            lines.append(f"最近卡顿 {last['time']} {last['lag_ms']}ms ({last['last_handler'] or '空闲'})")
+        self._overlay_label.configure(text="\n".join(lines))
+        self.root.after(1000, self._refresh_overlay)
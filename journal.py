@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存流水日志投影
+movement_journal 只追加、记录每次批次库存变化，是库存的唯一事实来源：
+- inventory（批次库存）与流水日志在同一事务中同步更新，可随时由流水日志完整重建
+- item_balances（物资库存余额）、stock_alerts（库存预警）为异步投影，
+  按检查点分段追赶流水日志，每段的投影更新和检查点在同一事务中提交，中断后从检查点继续
+"""
+
+import json
+import time
+from typing import Dict, Optional, Sequence
+
+from database import DatabaseManager
+from query_builder import REORDER_POINT_SQL, STATUS_HIGH, STATUS_LOW
+
+# 每个事务追赶的事件数
+CATCH_UP_BATCH_SIZE = 50000
+
+
+class ItemBalanceProjection:
+    """物资库存余额：按物资累加事件数量"""
+
+    name = 'item_balances'
+
+    def reset(self, cursor):
+        cursor.execute("DELETE FROM item_balances")
+
+    def apply(self, cursor, after_event_id: int, last_event_id: int):
+        cursor.execute('''
+            INSERT INTO item_balances (item_id, quantity, last_event_id)
+            SELECT item_id, SUM(quantity), MAX(event_id) FROM movement_journal
+            WHERE event_id > ? AND event_id <= ?
+            GROUP BY item_id
+            ON CONFLICT(item_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                last_event_id = excluded.last_event_id
+        ''', (after_event_id, last_event_id))
+
+
+class StockAlertProjection:
+    """库存预警：按余额和补货预警线/最高库存判定，只重算事件涉及的物资
+
+    依赖 item_balances，须排在其后追赶；补货点、最高库存等主数据变化后用 refresh 重算。
+    """
+
+    name = 'stock_alerts'
+
+    # 物资的预警状态（余额投影中没有的物资库存为 0）
+    _ALERT_SQL = f'''
+        INSERT INTO stock_alerts (item_id, status, quantity, reorder_point)
+        SELECT item_id, CASE WHEN quantity <= reorder_point THEN '{STATUS_LOW}' ELSE '{STATUS_HIGH}' END,
+               quantity, reorder_point
+        FROM (
+            SELECT i.item_id, COALESCE(b.quantity, 0) AS quantity,
+                   {REORDER_POINT_SQL} AS reorder_point, i.max_stock
+            FROM items i
+            LEFT JOIN item_balances b ON b.item_id = i.item_id
+            LEFT JOIN item_replenishment r ON r.item_id = i.item_id
+            {{condition}}
+        )
+        WHERE quantity <= reorder_point OR quantity >= max_stock
+    '''
+
+    def reset(self, cursor):
+        cursor.execute("DELETE FROM stock_alerts")
+
+    def apply(self, cursor, after_event_id: int, last_event_id: int):
+        touched = "SELECT DISTINCT item_id FROM movement_journal WHERE event_id > ? AND event_id <= ?"
+        cursor.execute(f"DELETE FROM stock_alerts WHERE item_id IN ({touched})",
+                       (after_event_id, last_event_id))
+        cursor.execute(self._ALERT_SQL.format(condition=f"WHERE i.item_id IN ({touched})"),
+                       (after_event_id, last_event_id))
+
+    def refresh(self, cursor, item_ids: Optional[Sequence[int]] = None):
+        """重算指定物资（None 为全部物资）的预警"""
+        if item_ids is None:
+            cursor.execute("DELETE FROM stock_alerts")
+            cursor.execute(self._ALERT_SQL.format(condition=""))
+            return
+        ids = "SELECT value FROM json_each(?)"
+        ids_json = json.dumps(list(item_ids))
+        cursor.execute(f"DELETE FROM stock_alerts WHERE item_id IN ({ids})", (ids_json,))
+        cursor.execute(self._ALERT_SQL.format(condition=f"WHERE i.item_id IN ({ids})"), (ids_json,))
+
+
+class JournalProjector:
+    """流水日志投影维护
+
+    Args:
+        db: 数据库管理器
+        batch_size: 每个事务追赶的事件数
+    """
+
+    def __init__(self, db: DatabaseManager, batch_size: int = CATCH_UP_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        # 按依赖顺序排列
+        self.projections = [ItemBalanceProjection(), StockAlertProjection()]
+        self._alerts = self.projections[1]
+
+    def get_checkpoints(self) -> Dict[str, int]:
+        """各投影已处理到的事件ID"""
+        checkpoints = {projection.name: 0 for projection in self.projections}
+        checkpoints.update(self.db.execute_query(
+            "SELECT projection, last_event_id FROM projection_checkpoints"))
+        return checkpoints
+
+    def get_last_event_id(self) -> int:
+        return self.db.execute_query("SELECT COALESCE(MAX(event_id), 0) FROM movement_journal")[0][0]
+
+    def catch_up(self) -> Dict:
+        """把各投影追赶到当前最新事件
+
+        Returns:
+            {'events': 处理的事件数（各投影合计）, 'transactions': 事务数, 'last_event_id', 'seconds'}
+        """
+        started = time.perf_counter()
+        target = self.get_last_event_id()
+        checkpoints = self.get_checkpoints()
+        events = 0
+        transactions = 0
+        for projection in self.projections:
+            position = checkpoints[projection.name]
+            while position < target:
+                start, position = self.db.run_in_transaction(
+                    lambda cursor: self._apply(cursor, projection, target))
+                events += position - start
+                transactions += 1
+        return {
+            'events': events,
+            'transactions': transactions,
+            'last_event_id': target,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def _apply(self, cursor, projection, target: int):
+        """在一个事务中从检查点起应用一段事件并推进检查点，返回 (起点, 新检查点)
+
+        检查点在事务内读取，多个进程同时追赶时不会重复应用同一段事件。
+        """
+        cursor.execute("SELECT last_event_id FROM projection_checkpoints WHERE projection = ?",
+                       (projection.name,))
+        row = cursor.fetchone()
+        start = row[0] if row else 0
+        end = min(start + self.batch_size, target)
+        if end > start:
+            projection.apply(cursor, start, end)
+            self._set_checkpoint(cursor, projection.name, end)
+        return start, max(start, end)
+
+    @staticmethod
+    def _set_checkpoint(cursor, name: str, last_event_id: int):
+        cursor.execute('''
+            INSERT INTO projection_checkpoints (projection, last_event_id, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(projection) DO UPDATE SET
+                last_event_id = excluded.last_event_id,
+                updated_at = excluded.updated_at
+        ''', (name, last_event_id))
+
+    def rebuild(self) -> Dict:
+        """清空异步投影和检查点后从第一个事件重新追赶"""
+        def work(cursor):
+            for projection in self.projections:
+                projection.reset(cursor)
+                self._set_checkpoint(cursor, projection.name, 0)
+        self.db.run_in_transaction(work)
+        result = self.catch_up()
+        # 没有任何事件的物资也可能低于最低库存
+        self.refresh_alerts()
+        return result
+
+    def refresh_alerts(self, item_ids: Optional[Sequence[int]] = None):
+        """补货点、最高库存、新物资等主数据变化后重算预警（先追赶余额）"""
+        self.catch_up()
+        self.db.run_in_transaction(lambda cursor: self._alerts.refresh(cursor, item_ids))
+
+    def rebuild_inventory(self) -> int:
+        """由流水日志重建批次库存表（保留 inventory_id，批次成本取该批次最后一个事件的成本），返回重建的批次数"""
+        def work(cursor):
+            cursor.execute("DELETE FROM inventory")
+            cursor.execute('''
+                INSERT INTO inventory (inventory_id, item_id, quantity, location, batch_number,
+                                       production_date, expiry_date, unit_cost, created_at, updated_at)
+                SELECT b.inventory_id, b.item_id, b.quantity, b.location, b.batch_number,
+                       b.production_date, b.expiry_date, j.unit_cost, b.created_at, b.updated_at
+                FROM (
+                    SELECT inventory_id, MIN(item_id) AS item_id, SUM(quantity) AS quantity,
+                           MIN(location) AS location, MIN(batch_number) AS batch_number,
+                           MIN(production_date) AS production_date, MIN(expiry_date) AS expiry_date,
+                           MIN(created_at) AS created_at, MAX(created_at) AS updated_at,
+                           MAX(event_id) AS last_event_id
+                    FROM movement_journal
+                    GROUP BY inventory_id
+                    HAVING SUM(quantity) > 0
+                ) b
+                JOIN movement_journal j ON j.event_id = b.last_event_id
+            ''')
+            return cursor.rowcount
+        return self.db.run_in_transaction(work)
+
+    def verify(self) -> Dict[str, int]:
+        """核对投影与流水日志：返回各表与日志汇总不一致的行数（异步投影须先追赶）"""
+        journal_batches = '''
+            SELECT inventory_id, SUM(quantity) FROM movement_journal
+            GROUP BY inventory_id HAVING SUM(quantity) != 0
+        '''
+        journal_items = '''
+            SELECT item_id, SUM(quantity) FROM movement_journal
+            GROUP BY item_id HAVING SUM(quantity) != 0
+        '''
+        queries = {
+            'inventory': (journal_batches,
+                          "SELECT inventory_id, quantity FROM inventory WHERE quantity != 0"),
+            'item_balances': (journal_items,
+                              "SELECT item_id, quantity FROM item_balances WHERE quantity != 0"),
+        }
+        result = {}
+        for name, (expected, actual) in queries.items():
+            result[name] = self.db.execute_query(f'''
+                SELECT (SELECT COUNT(*) FROM ({expected} EXCEPT {actual}))
+                     + (SELECT COUNT(*) FROM ({actual} EXCEPT {expected}))
+            ''')[0][0]
+        return result
@@ -1,7 +1,12 @@
 import sys
 import os
-from database import DatabaseManager
-from gui import main as gui_main
+import argparse
+import atexit
+import query_stats
+from database import DEFAULT_STORAGE_PROFILE, STORAGE_PROFILES, DatabaseManager
+from expiry_monitor import run_headless
+from replenishment import ReplenishmentPlanner
+from journal import JournalProjector
 
 def initialize_sample_data():
     """初始化示例数据"""
@@ -91,13 +96,50 @@ def initialize_sample_data():
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="库存管理系统")
+    parser.add_argument("--headless", action="store_true", help="无界面模式，定时输出近效期预警")
+    parser.add_argument("--expiry-days", type=int, default=30, help="近效期预警天数")
+    parser.add_argument("--interval", type=int, default=300, help="无界面模式检查间隔（秒）")
+    parser.add_argument("--query-stats", metavar="FILE", help="开启 SQL 统计，退出时写入 JSON 文件")
+    parser.add_argument("--metrics-port", type=int, help="开启 SQL 统计，并在该端口提供 /metrics 接口")
+    parser.add_argument("--slow-ms", type=float, default=100.0, help="慢查询阈值（毫秒）")
+    parser.add_argument("--profile", action="store_true", help="显示界面性能悬浮窗（事件循环延迟、各界面耗时）")
+    parser.add_argument("--storage-profile", default=DEFAULT_STORAGE_PROFILE, choices=list(STORAGE_PROFILES),
+                        help="数据库存储配置（内存映射、页缓存、常驻读连接）")
+    parser.add_argument("--profile-trace", metavar="FILE", help="退出时导出界面性能跟踪文件（Chrome trace 格式）")
+    args = parser.parse_args()
+    
+    if args.query_stats or args.metrics_port:
+        stats = query_stats.enable(args.slow_ms)
+        if args.query_stats:
+            atexit.register(stats.write_json, args.query_stats)
+        if args.metrics_port:
+            stats.serve(args.metrics_port)
+            print(f"SQL 统计接口: http://127.0.0.1:{args.metrics_port}/metrics")
+    
     try:
         # 初始化示例数据
         initialize_sample_data()
         
-        # 启动GUI界面
+        # 补齐库存快照检查点，保证历史时点库存查询只需回放有限流水
+        DatabaseManager().create_periodic_snapshots()
+        
+        # 按最新出库需求增量更新补货点和安全库存（库存预警使用）
+        ReplenishmentPlanner(DatabaseManager()).run()
+        
+        # 流水日志投影追赶到最新事件，并按新的补货点重算库存预警
+        JournalProjector(DatabaseManager()).refresh_alerts()
+        
+        if args.headless:
+            print("以无界面模式运行近效期监控...")
+            run_headless(DatabaseManager(storage_profile=args.storage_profile), args.expiry_days, args.interval)
+            return
+        
+        # 启动GUI界面（无界面模式不依赖 tkinter）
+        from gui import main as gui_main
         print("启动库存管理系统...")
-        gui_main()
+        gui_main(expiry_days=args.expiry_days, profile=args.profile, trace_path=args.profile_trace,
+                 storage_profile=args.storage_profile)
         
     except Exception as e:
         print(f"系统启动失败: {e}")
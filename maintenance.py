@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库维护：在线备份、增量清理空闲页、更新统计信息、历史流水归档
+- 备份使用 SQLite 在线备份接口按页分段复制，每段之间释放读锁，备份期间照常出入库
+- 删除的库存行和归档迁出的流水留下的空闲页由 incremental_vacuum 分段归还给文件系统
+- 超过保留期的入库/出库/调拨记录按年份分区迁入同目录的归档库（inventory_archive.db），
+  主库只保留近期的热分区；记录查询按时间范围附加归档库，只读取有交集的分区
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from database import ARCHIVED_LEDGERS, LEDGER_PARTITION_KEY_SQL, DatabaseManager, TIMESTAMP_FORMAT
+
+# 备份每步复制的页数（默认页大小 4KB 时约 4MB）
+BACKUP_PAGES_PER_STEP = 1024
+# 分段备份期间源库被其他连接写入时备份会从头开始；超过该次数后改为一次复制
+# （WAL 模式下一次复制只持有读快照，不阻塞写入）
+BACKUP_MAX_RESTARTS = 3
+# 每个事务归还的空闲页数
+VACUUM_PAGES_PER_STEP = 2048
+# 每个事务归档的流水行数
+ARCHIVE_BATCH_SIZE = 10000
+DEFAULT_RETENTION_MONTHS = 24
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _months_before(moment: datetime, months: int) -> datetime:
+    """moment 之前 months 个月的同一时刻（月末日期按目标月份天数截断）"""
+    month_index = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    next_month = datetime(year + (month == 12), month % 12 + 1, 1)
+    last_day = (next_month - datetime(year, month, 1)).days
+    return moment.replace(year=year, month=month, day=min(moment.day, last_day))
+
+
+class DatabaseMaintenance:
+    """数据库维护
+
+    Args:
+        db: 数据库管理器（归档库路径取 db.archive_path）
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    # ---------- 状态 ----------
+    def get_file_stats(self) -> Dict:
+        """数据库文件页数、空闲页数、大小和日志/清理模式"""
+        page_count, page_size, freelist, auto_vacuum, journal_mode = self.db.execute_query('''
+            SELECT (SELECT page_count FROM pragma_page_count),
+                   (SELECT page_size FROM pragma_page_size),
+                   (SELECT freelist_count FROM pragma_freelist_count),
+                   (SELECT auto_vacuum FROM pragma_auto_vacuum),
+                   (SELECT journal_mode FROM pragma_journal_mode)
+        ''')[0]
+        return {
+            'page_count': page_count,
+            'page_size': page_size,
+            'freelist_count': freelist,
+            'size_mb': round(page_count * page_size / 1048576, 2),
+            'free_mb': round(freelist * page_size / 1048576, 2),
+            'auto_vacuum': ('none', 'full', 'incremental')[auto_vacuum],
+            'journal_mode': journal_mode,
+            'archive_mb': (round(os.path.getsize(self.db.archive_path) / 1048576, 2)
+                           if self.db.has_archive() else 0.0),
+        }
+
+    # ---------- 在线备份 ----------
+    def backup(self, dest_path: str, pages_per_step: int = BACKUP_PAGES_PER_STEP,
+               progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """在线备份到 dest_path（先写临时文件，完成后替换，中途失败不会留下不完整的备份）
+
+        Args:
+            pages_per_step: 每步复制的页数，步与步之间不持有源库的锁
+            progress: 每步完成后调用 progress(剩余页数, 总页数)
+
+        Returns:
+            {'path', 'pages', 'steps', 'restarts', 'seconds'}
+        """
+        started = time.perf_counter()
+        partial_path = dest_path + ".partial"
+        state = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+        def on_step(status, remaining, total):
+            state['steps'] += 1
+            # 剩余页数变多说明源库被其他连接修改，备份从头开始
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > BACKUP_MAX_RESTARTS:
+                    raise _BackupRestarted()
+            state['remaining'] = remaining
+            state['total'] = total
+            if progress is not None:
+                progress(remaining, total)
+
+        source = self.db._connect()
+        try:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            target = sqlite3.connect(partial_path)
+            try:
+                try:
+                    source.backup(target, pages=pages_per_step, progress=on_step)
+                except _BackupRestarted:
+                    state['remaining'] = None
+                    source.backup(target, pages=-1, progress=on_step)
+            finally:
+                target.close()
+        finally:
+            source.close()
+        os.replace(partial_path, dest_path)
+        return {
+            'path': dest_path,
+            'pages': state.get('total', 0),
+            'steps': state['steps'],
+            'restarts': state['restarts'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    # ---------- 空闲页清理 ----------
+    def enable_incremental_vacuum(self) -> Dict:
+        """把已有数据库切换为增量清理模式（整库 VACUUM 一次，期间独占数据库）"""
+        started = time.perf_counter()
+        before = self.get_file_stats()
+        conn = self.db._connect()
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        after = self.get_file_stats()
+        return {
+            'auto_vacuum': after['auto_vacuum'],
+            'size_mb_before': before['size_mb'],
+            'size_mb_after': after['size_mb'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def incremental_vacuum(self, max_pages: Optional[int] = None,
+                           pages_per_step: int = VACUUM_PAGES_PER_STEP) -> Dict:
+        """分段归还空闲页（每段一个短事务，期间其他进程可以写入）
+
+        数据库未启用增量清理时不做任何事，返回的 auto_vacuum 为 'none'，需先调用 enable_incremental_vacuum。
+        """
+        started = time.perf_counter()
+        stats = self.get_file_stats()
+        freed = 0
+        if stats['auto_vacuum'] == 'incremental':
+            limit = stats['freelist_count'] if max_pages is None else min(max_pages, stats['freelist_count'])
+            while freed < limit:
+                step = min(pages_per_step, limit - freed)
+
+                def work(cursor, pages=step):
+                    cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+
+                self.db.run_in_transaction(work)
+                freed += step
+        after = self.get_file_stats()
+        return {
+            'auto_vacuum': stats['auto_vacuum'],
+            'freelist_before': stats['freelist_count'],
+            'freelist_after': after['freelist_count'],
+            'size_mb_before': stats['size_mb'],
+            'size_mb_after': after['size_mb'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    # ---------- 统计信息 ----------
+    def analyze(self, analysis_limit: Optional[int] = None) -> Dict:
+        """更新查询优化器统计信息（analysis_limit 限制每个索引抽样的行数，大库上缩短耗时）"""
+        started = time.perf_counter()
+
+        def work(cursor):
+            if analysis_limit is not None:
+                cursor.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+            cursor.execute("ANALYZE")
+
+        self.db.run_in_transaction(work)
+        return {'seconds': round(time.perf_counter() - started, 3)}
+
+    # ---------- 历史流水归档 ----------
+    def archive_ledgers(self, months: int = DEFAULT_RETENTION_MONTHS,
+                        batch_size: int = ARCHIVE_BATCH_SIZE, now: Optional[datetime] = None) -> Dict:
+        """把 months 个月前的入库/出库（含批次分配）/调拨记录按年份迁入归档库分区
+
+        迁移前在截止时间创建库存快照，截止时间之后的历史时点库存仍可由快照加剩余流水重建（更早的时点从归档分区回放）；
+        流水日志（movement_journal）是库存投影的事实来源，不归档。
+        每批在一个事务中先复制到归档库（按主键忽略已存在的行）再从主库删除，中断后重新执行即可。
+
+        Returns:
+            {'cutoff', 'rows': {表名: 迁移行数}, 'seconds'}
+        """
+        started = time.perf_counter()
+        cutoff = _months_before(now or datetime.utcnow(), months).strftime(TIMESTAMP_FORMAT)
+        self.db.create_stock_snapshot(cutoff)
+
+        conn = self.db._connect()
+        rows = {table: 0 for table in ARCHIVED_LEDGERS}
+        rows['stock_out_allocations'] = 0
+        try:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.db.archive_path,))
+            self._prepare_archive(conn)
+            for table, key in ARCHIVED_LEDGERS.items():
+                while True:
+                    moved = self.db._retry_on_busy(
+                        lambda: self._archive_batch(conn, table, key, cutoff, batch_size))
+                    if not moved:
+                        break
+                    rows[table] += moved[0]
+                    rows['stock_out_allocations'] += moved[1]
+            self._refresh_history_views(conn)
+        finally:
+            conn.close()
+        return {'cutoff': cutoff, 'rows': rows, 'seconds': round(time.perf_counter() - started, 3)}
+
+    @staticmethod
+    def _columns(conn: sqlite3.Connection, schema: str, table: str):
+        return [(row[1], row[2]) for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+    def _prepare_archive(self, conn: sqlite3.Connection):
+        """在归档库中创建分区登记表"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.ledger_partitions (
+                ledger TEXT NOT NULL,
+                partition_key TEXT NOT NULL,
+                min_time TIMESTAMP NOT NULL,
+                max_time TIMESTAMP NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (ledger, partition_key)
+            )
+        ''')
+        conn.commit()
+
+    def _ensure_partition(self, conn: sqlite3.Connection, table: str, partition_key: str):
+        """创建与主库同列的分区表及其索引（主库后来增加的列补到已有分区）"""
+        name = f"{table}_{partition_key}"
+        primary_key = ARCHIVED_LEDGERS.get(table, 'allocation_id')
+        columns = self._columns(conn, 'main', table)
+        existing = {column for column, _ in self._columns(conn, 'archive', name)}
+        if not existing:
+            definitions = ", ".join(
+                f"{column} {declared_type}" + (" PRIMARY KEY" if column == primary_key else "")
+                for column, declared_type in columns)
+            conn.execute(f"CREATE TABLE archive.{name} ({definitions})")
+            indexed = 'stock_out_id' if table == 'stock_out_allocations' else 'operation_time'
+            conn.execute(f"CREATE INDEX archive.idx_{name}_{indexed} ON {name} ({indexed})")
+            return
+        for column, declared_type in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE archive.{name} ADD COLUMN {column} {declared_type}")
+
+    def _archive_batch(self, conn: sqlite3.Connection, table: str, key: str, cutoff: str,
+                       batch_size: int):
+        """迁移一批早于截止时间的流水到所属年份分区，返回 (流水行数, 批次分配行数)，没有可迁移的行时返回 None"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            bound = conn.execute(f'''
+                SELECT MAX({key}) FROM (
+                    SELECT {key} FROM main.{table} WHERE operation_time <= ? ORDER BY {key} LIMIT ?
+                )
+            ''', (cutoff, batch_size)).fetchone()[0]
+            if bound is None:
+                conn.rollback()
+                return None
+            condition = f"operation_time <= ? AND {key} <= ?"
+            partitions = conn.execute(f'''
+                SELECT {LEDGER_PARTITION_KEY_SQL}, MIN(operation_time), MAX(operation_time)
+                FROM main.{table} WHERE {condition}
+                GROUP BY 1
+            ''', (cutoff, bound)).fetchall()
+            allocations = 0
+            for partition_key, min_time, max_time in partitions:
+                if not partition_key.isdigit():
+                    raise ValueError(f"无法按年份分区的操作时间: {min_time}")
+                params = (cutoff, bound, partition_key)
+                selected = f"{condition} AND {LEDGER_PARTITION_KEY_SQL} = ?"
+                if table == 'stock_out':
+                    self._ensure_partition(conn, 'stock_out_allocations', partition_key)
+                    columns = ", ".join(name for name, _ in self._columns(conn, 'main', 'stock_out_allocations'))
+                    conn.execute(f'''
+                        INSERT OR IGNORE INTO archive.stock_out_allocations_{partition_key} ({columns})
+                        SELECT {columns} FROM main.stock_out_allocations
+                        WHERE stock_out_id IN (SELECT stock_out_id FROM main.stock_out WHERE {selected})
+                    ''', params)
+                self._ensure_partition(conn, table, partition_key)
+                columns = ", ".join(name for name, _ in self._columns(conn, 'main', table))
+                inserted = conn.execute(f'''
+                    INSERT OR IGNORE INTO archive.{table}_{partition_key} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE {selected}
+                ''', params).rowcount
+                conn.execute('''
+                    INSERT INTO archive.ledger_partitions (ledger, partition_key, min_time, max_time, row_count)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(ledger, partition_key) DO UPDATE SET
+                        min_time = MIN(min_time, excluded.min_time),
+                        max_time = MAX(max_time, excluded.max_time),
+                        row_count = row_count + excluded.row_count
+                ''', (table, partition_key, min_time, max_time, inserted))
+            if table == 'stock_out':
+                allocations = conn.execute(f'''
+                    DELETE FROM main.stock_out_allocations
+                    WHERE stock_out_id IN (SELECT stock_out_id FROM main.stock_out WHERE {condition})
+                ''', (cutoff, bound)).rowcount
+            moved = conn.execute(f"DELETE FROM main.{table} WHERE {condition}", (cutoff, bound)).rowcount
+            conn.commit()
+            return moved, allocations
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _refresh_history_views(self, conn: sqlite3.Connection):
+        """重建归档库中合并全部分区的视图（stock_in_history 等），供报表和临时查询使用"""
+        partitions = {}
+        for ledger, partition_key in conn.execute(
+                "SELECT ledger, partition_key FROM archive.ledger_partitions ORDER BY partition_key"):
+            partitions.setdefault(ledger, []).append(partition_key)
+        if 'stock_out' in partitions:
+            partitions['stock_out_allocations'] = partitions['stock_out']
+        for table, keys in partitions.items():
+            conn.execute(f"DROP VIEW IF EXISTS archive.{table}_history")
+            union = " UNION ALL ".join(f"SELECT * FROM {table}_{key}" for key in keys)
+            conn.execute(f"CREATE VIEW archive.{table}_history AS {union}")
+        conn.commit()
+
+    def run(self, months: Optional[int] = None, analysis_limit: Optional[int] = None) -> Dict:
+        """例行维护：归档（指定 months 时）、归还空闲页、更新统计信息"""
+        result = {}
+        if months is not None:
+            result['archive'] = self.archive_ledgers(months)
+        result['vacuum'] = self.incremental_vacuum()
+        result['analyze'] = self.analyze(analysis_limit)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="库存数据库维护")
+    parser.add_argument("--db", default="inventory.db")
+    subparsers = parser.add_subparsers(dest="command")
+
+    backup_parser = subparsers.add_parser("backup", help="在线备份")
+    backup_parser.add_argument("dest", help="备份文件路径")
+    backup_parser.add_argument("--pages-per-step", type=int, default=BACKUP_PAGES_PER_STEP)
+
+    subparsers.add_parser("enable-incremental-vacuum", help="切换为增量清理模式（整库 VACUUM 一次）")
+    vacuum_parser = subparsers.add_parser("vacuum", help="归还空闲页")
+    vacuum_parser.add_argument("--max-pages", type=int)
+
+    analyze_parser = subparsers.add_parser("analyze", help="更新统计信息")
+    analyze_parser.add_argument("--analysis-limit", type=int)
+
+    archive_parser = subparsers.add_parser("archive", help="归档历史流水")
+    archive_parser.add_argument("--months", type=int, default=DEFAULT_RETENTION_MONTHS, help="主库保留的月数")
+
+    run_parser = subparsers.add_parser("run", help="例行维护（归档、归还空闲页、更新统计信息）")
+    run_parser.add_argument("--months", type=int, help="同时归档该月数之前的流水")
+
+    subparsers.add_parser("stats", help="文件大小与空闲页")
+    args = parser.parse_args()
+
+    maintenance = DatabaseMaintenance(DatabaseManager(args.db))
+    if args.command == "backup":
+        result = maintenance.backup(args.dest, args.pages_per_step)
+        print(f"✓ 备份到 {result['path']}：{result['pages']} 页，{result['steps']} 步，"
+              f"重新开始 {result['restarts']} 次，耗时 {result['seconds']}s")
+    elif args.command == "enable-incremental-vacuum":
+        result = maintenance.enable_incremental_vacuum()
+        print(f"✓ 清理模式 {result['auto_vacuum']}，{result['size_mb_before']}MB -> "
+              f"{result['size_mb_after']}MB，耗时 {result['seconds']}s")
+    elif args.command == "vacuum":
+        result = maintenance.incremental_vacuum(args.max_pages)
+        if result['auto_vacuum'] != 'incremental':
+            print("数据库未启用增量清理，请先执行 enable-incremental-vacuum")
+        else:
+            print(f"✓ 空闲页 {result['freelist_before']} -> {result['freelist_after']}，"
+                  f"{result['size_mb_before']}MB -> {result['size_mb_after']}MB，耗时 {result['seconds']}s")
+    elif args.command == "analyze":
+        result = maintenance.analyze(args.analysis_limit)
+        print(f"✓ 统计信息已更新，耗时 {result['seconds']}s")
+    elif args.command == "archive":
+        result = maintenance.archive_ledgers(args.months)
+        moved = "，".join(f"{table} {count} 行" for table, count in result['rows'].items())
+        print(f"✓ 归档 {result['cutoff']} 之前的流水：{moved}，耗时 {result['seconds']}s")
+    elif args.command == "run":
+        result = maintenance.run(args.months)
+        print(f"✓ 例行维护完成：空闲页 {result['vacuum']['freelist_before']} -> "
+              f"{result['vacuum']['freelist_after']}，统计信息耗时 {result['analyze']['seconds']}s")
+    else:
+        for key, value in maintenance.get_file_stats().items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
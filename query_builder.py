@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+物资/库存状态组合查询
+筛选条件先解析为键值（类目ID、供应商、状态），再按条件组合编译 SQL 并缓存
+"""
+
+import json
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+# 库存状态
+STATUS_LOW = '库存不足'
+STATUS_HIGH = '库存过高'
+STATUS_NORMAL = '正常'
+STATUS_VALUES = (STATUS_LOW, STATUS_HIGH, STATUS_NORMAL)
+
+# 当前库存：按物资逐个汇总批次库存（走 inventory 的 item_id 前缀索引）
+CURRENT_STOCK_SQL = "COALESCE((SELECT SUM(inv.quantity) FROM inventory inv WHERE inv.item_id = i.item_id), 0)"
+
+# 补货预警线：已计算补货点（item_replenishment）时取补货点，否则取人工设置的最低库存
+REORDER_POINT_SQL = "COALESCE(r.reorder_point, i.min_stock)"
+
+# 状态条件（作用于单个物资，而不是聚合后的 HAVING）
+STATUS_CONDITIONS = {
+    STATUS_LOW: "{stock} <= {reorder}",
+    STATUS_HIGH: "{stock} >= i.max_stock",
+    STATUS_NORMAL: "{stock} > {reorder} AND {stock} < i.max_stock",
+}
+
+# 可排序列 -> 排序表达式（可空列用 COALESCE，保证键集分页比较有意义）
+ITEM_SORT_COLUMNS = {
+    'item_id': "i.item_id",
+    'item_code': "i.item_code",
+    'item_name': "i.item_name",
+    'category_name': "c.category_name",
+    'specification': "COALESCE(i.specification, '')",
+    'unit': "i.unit",
+    'supplier': "COALESCE(i.supplier, '')",
+    'purchase_price': "COALESCE(i.purchase_price, 0)",
+    'selling_price': "COALESCE(i.selling_price, 0)",
+    'min_stock': "i.min_stock",
+    'max_stock': "i.max_stock",
+    'created_at': "i.created_at",
+}
+STATUS_SORT_COLUMNS = {column: ITEM_SORT_COLUMNS[column] for column in
+                       ('item_id', 'item_code', 'item_name', 'category_name', 'unit', 'min_stock', 'max_stock')}
+STATUS_SORT_COLUMNS['current_stock'] = CURRENT_STOCK_SQL
+STATUS_SORT_COLUMNS['reorder_point'] = REORDER_POINT_SQL
+
+_VIEWS = {
+    'items': {
+        'select': '''
+            SELECT i.item_id, i.item_code, i.item_name, c.category_name,
+                   i.specification, i.unit, i.supplier, i.purchase_price,
+                   i.selling_price, i.min_stock, i.max_stock, i.created_at''',
+        'sort_columns': ITEM_SORT_COLUMNS,
+        'joins': '',
+    },
+    'status': {
+        'select': f'''
+            SELECT i.item_id, i.item_code, i.item_name, c.category_name,
+                   i.unit, i.min_stock, i.max_stock,
+                   {CURRENT_STOCK_SQL} AS current_stock,
+                   {REORDER_POINT_SQL} AS reorder_point''',
+        'sort_columns': STATUS_SORT_COLUMNS,
+        'joins': '''
+            LEFT JOIN item_replenishment r ON r.item_id = i.item_id''',
+    },
+}
+
+
+class ItemFilter:
+    """已解析的物资筛选条件
+
+    Args:
+        keyword: 物资编码/名称关键字（模糊匹配）
+        category_ids: 类目ID列表（已展开子类目），None 表示不限
+        supplier: 供应商（精确匹配），None 表示不限
+        status: 库存状态（STATUS_VALUES 之一），None 表示不限
+    """
+
+    def __init__(self, keyword: str = "", category_ids: Optional[Sequence[int]] = None,
+                 supplier: Optional[str] = None, status: Optional[str] = None):
+        if status is not None and status not in STATUS_VALUES:
+            raise ValueError(f"未知的库存状态: {status}")
+        self.keyword = keyword
+        self.category_ids = list(category_ids) if category_ids is not None else None
+        self.supplier = supplier
+        self.status = status
+
+    def shape(self) -> Tuple[bool, bool, bool, Optional[str]]:
+        """条件组合形态：相同形态的查询共用同一条编译后的 SQL"""
+        return (bool(self.keyword), self.category_ids is not None,
+                self.supplier is not None, self.status)
+
+    def params(self) -> List:
+        """与 compile_query 生成的占位符顺序一致的参数"""
+        params = []
+        if self.keyword:
+            params.extend([f'%{self.keyword}%', f'%{self.keyword}%'])
+        if self.category_ids is not None:
+            params.append(json.dumps(self.category_ids))
+        if self.supplier is not None:
+            params.append(self.supplier)
+        return params
+
+
+@lru_cache(maxsize=256)
+def compile_query(view: str, shape: Tuple, sort_by: str = 'item_id',
+                  descending: bool = False, keyset: bool = False) -> str:
+    """按视图和条件形态生成 SQL
+
+    条件全部作用于 items 行（包括库存状态），每页只汇总实际扫描到的物资；
+    结果以 (排序列, item_id) 做键集分页，末尾占位符依次为 [键集值, 键集ID,] LIMIT。
+    """
+    spec = _VIEWS[view]
+    if sort_by not in spec['sort_columns']:
+        raise ValueError(f"不支持的排序列: {sort_by}")
+    has_keyword, has_categories, has_supplier, status = shape
+    sort_expr = spec['sort_columns'][sort_by]
+    direction = "DESC" if descending else "ASC"
+
+    conditions = []
+    if has_keyword:
+        conditions.append("(i.item_code LIKE ? OR i.item_name LIKE ?)")
+    if has_categories:
+        conditions.append("i.category_id IN (SELECT value FROM json_each(?))")
+    if has_supplier:
+        conditions.append("i.supplier = ?")
+    if status is not None:
+        conditions.append(STATUS_CONDITIONS[status].format(stock=CURRENT_STOCK_SQL, reorder=REORDER_POINT_SQL))
+    if keyset:
+        conditions.append(f"({sort_expr}, i.item_id) {'<' if descending else '>'} (?, ?)")
+
+    inner = spec['select'] + '''
+            FROM items i
+            JOIN categories c ON i.category_id = c.category_id''' + spec['joins']
+    if conditions:
+        inner += "\n            WHERE " + "\n              AND ".join(conditions)
+    # 内层 LIMIT 阻止子查询被展开，当前库存的相关子查询每行只计算一次
+    inner += f"\n            ORDER BY {sort_expr} {direction}, i.item_id {direction}\n            LIMIT ?"
+
+    if view == 'items':
+        return inner
+
+    # 外层只对内层截断后的一页重新排序
+    return f'''
+        SELECT s.item_id, s.item_code, s.item_name, s.category_name, s.unit,
+               s.min_stock, s.max_stock, s.current_stock,
+               CASE
+                   WHEN s.current_stock <= s.reorder_point THEN '{STATUS_LOW}'
+                   WHEN s.current_stock >= s.max_stock THEN '{STATUS_HIGH}'
+                   ELSE '{STATUS_NORMAL}'
+               END AS status,
+               s.reorder_point
+        FROM ({inner}) s
+        ORDER BY s.{sort_by} {direction}, s.item_id {direction}
+    '''
+
+
+def build_query(view: str, item_filter: ItemFilter, sort_by: str = 'item_id',
+                descending: bool = False, after: Optional[Tuple] = None,
+                limit: Optional[int] = None) -> Tuple[str, List]:
+    """返回 (sql, params)
+
+    Args:
+        after: 上一页最后一行的 (排序列值, item_id)，None 表示第一页
+        limit: 每页行数，None 表示不限
+    """
+    sql = compile_query(view, item_filter.shape(), sort_by, descending, after is not None)
+    params = item_filter.params()
+    if after is not None:
+        params.extend(after)
+    params.append(limit if limit is not None else -1)
+    return sql, params
+
+
+def sort_key(row: dict, sort_by: str) -> Tuple:
+    """从结果行取出键集分页用的 (排序列值, item_id)，与 ITEM_SORT_COLUMNS 的 COALESCE 规则一致"""
+    value = row[sort_by]
+    if value is None:
+        value = 0 if sort_by in ('purchase_price', 'selling_price') else ''
+    return value, row['item_id']
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL 执行统计与慢查询日志
+按归一化 SQL 汇总执行次数、耗时和行数；超过阈值的语句自动记录 EXPLAIN QUERY PLAN
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional
+
+# 只对这些语句取查询计划（BEGIN / CREATE / PRAGMA 等没有意义）
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """归一化 SQL：压缩空白，字面量替换为 ?，IN (?, ?, ...) 合并为 IN (?)
+
+    语句文本基本是常量，结果按原文缓存，统计开启后每次执行只多一次字典查找。
+    """
+    normalized = _STRING_LITERAL.sub("?", sql)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(?)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class QueryStats:
+    """SQL 执行统计
+
+    Args:
+        slow_ms: 慢查询阈值（毫秒），单次执行（含取数）超过即记录查询计划
+        slow_log_size: 慢查询日志保留条数
+    """
+
+    def __init__(self, slow_ms: float = 100.0, slow_log_size: int = 200):
+        self.slow_ms = slow_ms
+        self.slow_seconds = slow_ms / 1000.0
+        self._lock = threading.Lock()
+        self._statements = {}  # 归一化 SQL -> [次数, 总耗时秒, 最大耗时秒, 行数]
+        self._slow_log = deque(maxlen=slow_log_size)
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def record(self, sql: str, elapsed: float, rows: int, executions: int = 1) -> List:
+        """累计一条语句的执行数据，返回语句的累计项 [次数, 总耗时秒, 最大耗时秒, 行数]
+
+        热路径上不加锁：单个计数偶尔与导出线程交错只影响一次快照。新增语句时在锁内
+        连同首次执行一起写入，导出时不会看到次数为 0 的语句。
+        """
+        key = normalize_sql(sql)
+        entry = self._statements.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._statements.get(key)
+                if entry is None:
+                    self._statements[key] = [executions, elapsed, elapsed, rows]
+                    return self._statements[key]
+        entry[0] += executions
+        entry[1] += elapsed
+        entry[3] += rows
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        return entry
+
+    def log_slow(self, connection: sqlite3.Connection, sql: str, params, elapsed: float):
+        """记录慢查询及其查询计划（在同一连接上执行，能看到事务内的临时状态）"""
+        plan = []
+        if sql.lstrip().upper().startswith(_EXPLAINABLE):
+            try:
+                plan_cursor = connection.cursor(sqlite3.Cursor)
+                plan = [row[-1] for row in plan_cursor.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            except sqlite3.Error as e:
+                plan = [f"无法获取查询计划: {e}"]
+        with self._lock:
+            self._slow_log.append({
+                'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'sql': normalize_sql(sql),
+                'elapsed_ms': round(elapsed * 1000, 3),
+                'plan': plan,
+            })
+
+    def reset(self):
+        """清空统计和慢查询日志"""
+        with self._lock:
+            self._statements = {}
+            self._slow_log.clear()
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def get_statements(self, sort_by: str = 'total_ms') -> List[Dict]:
+        """按语句返回汇总，默认按总耗时降序"""
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._statements.items()]
+        statements = []
+        for key, (count, total, maximum, rows) in items:
+            statements.append({
+                'sql': key,
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / count, 3),
+                'max_ms': round(maximum * 1000, 3),
+                'rows': rows,
+            })
+        statements.sort(key=lambda s: s[sort_by], reverse=True)
+        return statements
+
+    def get_slow_queries(self) -> List[Dict]:
+        with self._lock:
+            return list(self._slow_log)
+
+    def to_dict(self) -> Dict:
+        statements = self.get_statements()
+        return {
+            'started_at': self.started_at,
+            'slow_ms': self.slow_ms,
+            'total_count': sum(s['count'] for s in statements),
+            'total_ms': round(sum(s['total_ms'] for s in statements), 3),
+            'statements': statements,
+            'slow_queries': self.get_slow_queries(),
+        }
+
+    def write_json(self, path: str):
+        """导出为 JSON 文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def serve(self, port: int = 9465, host: str = "127.0.0.1") -> HTTPServer:
+        """在后台线程启动指标接口：GET /metrics 返回 JSON 汇总，/slow 返回慢查询日志"""
+        stats = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") in ("", "/metrics"):
+                    payload = stats.to_dict()
+                elif self.path.rstrip("/") == "/slow":
+                    payload = stats.get_slow_queries()
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录执行耗时的游标：execute 与随后的 fetch* 计入同一次执行"""
+
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.connection.stats
+            self._entry = stats.record(sql, elapsed, max(self.rowcount, 0))
+            self._sql = sql
+            self._params = parameters
+            self._elapsed = elapsed
+            self._logged = elapsed >= stats.slow_seconds
+            if self._logged:
+                stats.log_slow(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._entry = None
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.stats.record(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self._entry is not None:
+            self._add_fetch(time.perf_counter() - start, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._entry is not None:
+            self._add_fetch(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self._entry is not None:
+            self._add_fetch(time.perf_counter() - start, len(rows))
+        return rows
+
+    def _add_fetch(self, elapsed, rows):
+        """取数耗时和行数并入本次执行（不重复计次）"""
+        entry = self._entry
+        entry[1] += elapsed
+        entry[3] += rows
+        self._elapsed += elapsed
+        if self._elapsed > entry[2]:
+            entry[2] = self._elapsed
+        if not self._logged:
+            stats = self.connection.stats
+            if self._elapsed >= stats.slow_seconds:
+                self._logged = True
+                stats.log_slow(self.connection, self._sql, self._params, self._elapsed)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """默认创建 InstrumentedCursor 的连接，stats 在连接建立后赋值"""
+
+    stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# 进程级统计：DatabaseManager 未单独指定时使用
+_active_stats = None
+
+
+def enable(slow_ms: float = 100.0, slow_log_size: int = 200) -> QueryStats:
+    """开启进程级 SQL 统计，返回统计对象（已开启则返回现有对象）"""
+    global _active_stats
+    if _active_stats is None:
+        _active_stats = QueryStats(slow_ms, slow_log_size)
+    return _active_stats
+
+
+def disable():
+    global _active_stats
+    _active_stats = None
+
+
+def get_active_stats() -> Optional[QueryStats]:
+    return _active_stats
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内库存状态读模型
+按 item_id 下标保存每种物资的库存、补货预警线、最高库存和库存状态（紧凑数组，每种物资约 25 字节），
+库存状态、预警计数和预警清单直接在内存中回答：
+- 本进程经 DatabaseManager 出入库、调拨提交后立即从流水日志追加本次事件（写穿）
+- 查询前比较 PRAGMA data_version，其他进程写入过数据库时同样从流水日志追赶
+- 补货点、最高库存等阈值只在 load/reload_thresholds 时读取，主数据变化后须调用 reload_thresholds
+"""
+
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from database import DatabaseManager
+from query_builder import REORDER_POINT_SQL, STATUS_HIGH, STATUS_LOW, STATUS_NORMAL
+from records import Record, record_type
+
+ItemStatusRecord = record_type('ItemStatusRecord', (
+    'item_id', 'status', 'current_stock', 'reorder_point', 'max_stock'))
+
+# 状态编码（bytearray 每种物资 1 字节）
+_NORMAL, _LOW, _HIGH, _MISSING = 0, 1, 2, 255
+_STATUS_NAMES = {_NORMAL: STATUS_NORMAL, _LOW: STATUS_LOW, _HIGH: STATUS_HIGH}
+_STATUS_CODES = {name: code for code, name in _STATUS_NAMES.items()}
+
+_THRESHOLD_SQL = f'''
+    SELECT i.item_id, {REORDER_POINT_SQL}, i.max_stock
+    FROM items i
+    LEFT JOIN item_replenishment r ON r.item_id = i.item_id
+    WHERE i.item_id > ?
+'''
+
+
+class InventoryReadModel:
+    """库存状态读模型
+
+    Args:
+        db: 数据库管理器；读模型注册为其出入库监听器，并使用一个独立的连接
+            （data_version 只反映其他连接的提交）
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self._conn = db._connect()
+        self.load()
+        db.add_movement_listener(self.sync)
+
+    def close(self):
+        self.db.remove_movement_listener(self.sync)
+        self._conn.close()
+
+    # ---------- 加载与同步 ----------
+    def load(self) -> Dict:
+        """从数据库全量加载（库存、阈值与流水日志位置取自同一个读快照）
+
+        Returns:
+            {'items', 'last_event_id', 'seconds'}
+        """
+        started = time.perf_counter()
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            self.last_event_id = conn.execute(
+                "SELECT COALESCE(MAX(event_id), 0) FROM movement_journal").fetchone()[0]
+            size = conn.execute("SELECT COALESCE(MAX(item_id), 0) + 1 FROM items").fetchone()[0]
+            self._stock = array('q', bytes(8 * size))
+            self._reorder_point = array('d', bytes(8 * size))
+            self._max_stock = array('q', bytes(8 * size))
+            self._status = bytearray([_MISSING]) * size
+            self._counts = {code: 0 for code in _STATUS_NAMES}
+            self._alerts = set()
+            # 上次 take_changes 之后状态或库存变化过的物资
+            self._changed = set()
+            self.max_item_id = 0
+            item_ids = self._load_thresholds(conn, 0)
+            for item_id, quantity in conn.execute(
+                    "SELECT item_id, SUM(quantity) FROM inventory GROUP BY item_id"):
+                if item_id <= self.max_item_id:
+                    self._stock[item_id] = quantity
+            for item_id in item_ids:
+                self._update_status(item_id)
+        finally:
+            conn.rollback()
+        return {
+            'items': sum(self._counts.values()),
+            'last_event_id': self.last_event_id,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def _load_thresholds(self, conn, after_item_id: int) -> List[int]:
+        """读取 item_id 大于 after_item_id 的物资阈值（新物资按需扩充数组），返回这些物资的ID
+
+        分片部署时分片内的 item_id 不连续，未登记的下标保持 _MISSING 状态。
+        """
+        item_ids = []
+        for item_id, reorder_point, max_stock in conn.execute(_THRESHOLD_SQL, (after_item_id,)):
+            self._ensure_capacity(item_id)
+            self._reorder_point[item_id] = reorder_point or 0
+            self._max_stock[item_id] = max_stock or 0
+            self.max_item_id = max(self.max_item_id, item_id)
+            item_ids.append(item_id)
+        return item_ids
+
+    def _ensure_capacity(self, item_id: int):
+        size = len(self._status)
+        if item_id < size:
+            return
+        grow = max(item_id + 1, size * 2) - size
+        self._stock.frombytes(bytes(8 * grow))
+        self._reorder_point.frombytes(bytes(8 * grow))
+        self._max_stock.frombytes(bytes(8 * grow))
+        self._status.extend(bytes([_MISSING]) * grow)
+
+    def sync(self) -> int:
+        """其他连接提交过写入时追赶流水日志和新物资，返回有新事件的物资数"""
+        conn = self._conn
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return 0
+        applied = 0
+        conn.execute("BEGIN")
+        try:
+            self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            # 新物资先登记阈值，其事件才能计入库存
+            changed = set(self._load_thresholds(conn, self.max_item_id))
+            # GROUP BY +item_id：只有下界的范围条件下规划器会改为全量扫描 (item_id, event_id) 索引来省去排序
+            for item_id, quantity, last_event_id in conn.execute('''
+                SELECT item_id, SUM(quantity), MAX(event_id) FROM movement_journal
+                WHERE event_id > ?
+                GROUP BY +item_id
+            ''', (self.last_event_id,)):
+                self.last_event_id = max(self.last_event_id, last_event_id)
+                if item_id <= self.max_item_id:
+                    self._stock[item_id] += quantity
+                    if item_id in changed or self._status[item_id] != _MISSING:
+                        changed.add(item_id)
+                applied += 1
+        finally:
+            conn.rollback()
+        for item_id in changed:
+            self._update_status(item_id)
+        self._changed.update(changed)
+        return applied
+
+    def reload_thresholds(self, item_ids: Optional[Sequence[int]] = None):
+        """补货点、最低/最高库存变化后重新读取阈值（None 为全部物资）"""
+        self.sync()
+        if item_ids is None:
+            rows = self._conn.execute(_THRESHOLD_SQL, (0,)).fetchall()
+        else:
+            rows = []
+            for item_id in item_ids:
+                rows.extend(self._conn.execute(_THRESHOLD_SQL + " AND i.item_id = ?", (0, item_id)))
+        for item_id, reorder_point, max_stock in rows:
+            if item_id <= self.max_item_id and self._status[item_id] != _MISSING:
+                self._reorder_point[item_id] = reorder_point or 0
+                self._max_stock[item_id] = max_stock or 0
+                self._update_status(item_id)
+                self._changed.add(item_id)
+
+    def _update_status(self, item_id: int):
+        """按库存和阈值重算已登记物资的状态，同时维护状态计数和预警集合"""
+        previous = self._status[item_id]
+        stock = self._stock[item_id]
+        if stock <= self._reorder_point[item_id]:
+            status = _LOW
+        elif stock >= self._max_stock[item_id]:
+            status = _HIGH
+        else:
+            status = _NORMAL
+        if status == previous:
+            return
+        if previous != _MISSING:
+            self._counts[previous] -= 1
+        self._counts[status] += 1
+        self._status[item_id] = status
+        if status == _NORMAL:
+            self._alerts.discard(item_id)
+        else:
+            self._alerts.add(item_id)
+
+    # ---------- 查询 ----------
+    def get_stock(self, item_id: int) -> int:
+        self.sync()
+        if 0 < item_id < len(self._status) and self._status[item_id] != _MISSING:
+            return self._stock[item_id]
+        return 0
+
+    def get_status(self, item_id: int) -> Optional[str]:
+        """物资库存状态（不存在的物资为 None）"""
+        self.sync()
+        if 0 < item_id < len(self._status):
+            return _STATUS_NAMES.get(self._status[item_id])
+        return None
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """各库存状态的物资数"""
+        self.sync()
+        return {_STATUS_NAMES[code]: count for code, count in self._counts.items()}
+
+    def get_alerts(self, status: Optional[str] = None) -> List[Record]:
+        """库存不足/库存过高的物资（按 item_id 排序），status 为 None 时两者都返回"""
+        self.sync()
+        code = _STATUS_CODES[status] if status is not None else None
+        return ItemStatusRecord.from_rows(
+            (item_id, _STATUS_NAMES[self._status[item_id]], self._stock[item_id],
+             self._reorder_point[item_id], self._max_stock[item_id])
+            for item_id in sorted(self._alerts)
+            if code is None or self._status[item_id] == code)
+
+    def get_items(self, item_ids: Sequence[int]) -> List[Record]:
+        """指定物资的库存状态（不存在的物资跳过，不先同步，供变化通知后读取）"""
+        return ItemStatusRecord.from_rows(
+            (item_id, _STATUS_NAMES[self._status[item_id]], self._stock[item_id],
+             self._reorder_point[item_id], self._max_stock[item_id])
+            for item_id in item_ids
+            if 0 < item_id < len(self._status) and self._status[item_id] != _MISSING)
+
+    def take_changes(self) -> List[int]:
+        """取出并清空上次调用以来库存或阈值变化过的物资ID（先同步；只供一个使用方消费）"""
+        self.sync()
+        changed = sorted(self._changed)
+        self._changed.clear()
+        return changed
+
+    def memory_bytes(self) -> int:
+        """数组与预警集合占用的字节数"""
+        arrays = sum(values.buffer_info()[1] * values.itemsize
+                     for values in (self._stock, self._reorder_point, self._max_stock))
+        return arrays + len(self._status) + sys.getsizeof(self._alerts)
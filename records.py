@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量查询结果行
+以元组子类保存一行数据，字段名只在类上保存一份；兼容原来按字典访问的写法
+（row['item_name']、row.get()、keys()、items()、dict(row)），也可按属性访问（row.item_name）
+"""
+
+import gc
+from collections import namedtuple
+from functools import partial
+from typing import Dict, Iterable, List, Sequence
+
+_tuple_getitem = tuple.__getitem__
+
+
+class Record(tuple):
+    """结果行基类，具体的行类型由 record_type 生成
+
+    与 sqlite3.Row 一致，迭代和解包得到的是字段值；
+    按字典方式访问的 []、get、keys、items、in 则以字段名为键。
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            return _tuple_getitem(self, self._index[key])
+        return _tuple_getitem(self, key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else _tuple_getitem(self, index)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return list(zip(self._fields, self))
+
+    def to_dict(self) -> Dict:
+        return dict(zip(self._fields, self))
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self))
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        # 动态生成的类型无法按名称反序列化，序列化为普通字典
+        return dict, (self.to_dict(),)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence]) -> List["Record"]:
+        """把查询结果的元组批量转换为行对象
+
+        逐行构造在 C 层完成；期间暂停垃圾回收：行对象只包含标量值不会成环，
+        而大量新建的元组会反复触发回收、遍历已生成的全部行。
+        """
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return list(map(partial(tuple.__new__, cls), rows))
+        finally:
+            if enabled:
+                gc.enable()
+
+    @classmethod
+    def columns(cls, rows: Sequence[Sequence]) -> Dict[str, List]:
+        """按列返回结果 {字段名: 值列表}，适合导出和批量计算"""
+        if not rows:
+            return {name: [] for name in cls._fields}
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return dict(zip(cls._fields, map(list, zip(*rows))))
+        finally:
+            if enabled:
+                gc.enable()
+
+
+def record_type(name: str, fields: Sequence[str]) -> type:
+    """生成指定字段的行类型
+
+    属性访问沿用 namedtuple 的字段描述符（C 实现，比按键访问快）；
+    与 Record 方法同名的字段（get、keys、items、values）只能用 [] 访问。
+    """
+    fields = tuple(fields)
+    namespace = {
+        '__slots__': (),
+        '_fields': fields,
+        '_index': {field: index for index, field in enumerate(fields)},
+    }
+    return type(name, (Record, namedtuple(name, fields)), namespace)
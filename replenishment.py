@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+补货点与安全库存计算
+按历史出库的日需求分布和供应商交货期计算每种物资的安全库存和补货点，
+结果写入 item_replenishment，库存预警以补货点代替人工设置的最低库存；
+并为低于补货点的物资计算采购量，按供应商生成草稿采购单
+
+    安全库存 = z × √(交货期 × 日需求方差 + 日均需求² × 交货期方差)
+    补货点   = 日均需求 × 交货期 + 安全库存
+"""
+
+import argparse
+import itertools
+import json
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖
+    np = None
+
+from database import DatabaseManager, PO_OPEN_STATUSES, PO_STATUS_DRAFT, TIMESTAMP_FORMAT
+
+# 服务水平 -> 标准正态分位数 z
+SERVICE_LEVEL_Z = {
+    0.90: 1.2816,
+    0.95: 1.6449,
+    0.975: 1.9600,
+    0.99: 2.3263,
+}
+
+# 未登记交货期的供应商使用的默认交货期（天）
+DEFAULT_LEAD_TIME_DAYS = 7
+
+JOB_NAME = 'replenishment'
+
+# 需补货物资：库存位置（当前库存 + 在途量）不高于补货点，补货到 max(最高库存, 补货点 + 1)
+# 库存和在途量各自整表汇总一次后按物资关联，不对每种物资执行相关子查询
+PURCHASE_SUGGESTION_SQL = f'''
+    SELECT i.item_id, COALESCE(i.supplier, '') AS supplier, COALESCE(i.purchase_price, 0),
+           MAX(i.max_stock, COALESCE(r.reorder_point, i.min_stock) + 1),
+           COALESCE(s.quantity, 0) + COALESCE(o.quantity, 0)
+    FROM items i
+    LEFT JOIN item_replenishment r ON r.item_id = i.item_id
+    LEFT JOIN (
+        SELECT item_id, SUM(quantity) AS quantity FROM inventory GROUP BY item_id
+    ) s ON s.item_id = i.item_id
+    LEFT JOIN (
+        SELECT l.item_id, SUM(l.quantity) AS quantity
+        FROM purchase_order_lines l
+        JOIN purchase_orders p ON p.po_id = l.po_id
+        WHERE p.status IN ({", ".join("?" * len(PO_OPEN_STATUSES))})
+        GROUP BY l.item_id
+    ) o ON o.item_id = i.item_id
+    WHERE COALESCE(s.quantity, 0) + COALESCE(o.quantity, 0) <= COALESCE(r.reorder_point, i.min_stock)
+    ORDER BY supplier, i.item_id
+'''
+
+
+class ReplenishmentPlanner:
+    """补货参数批量计算任务
+
+    增量运行：只重算上次运行后有新出库的物资、交货期有变化的供应商的物资，
+    以及超过 refresh_days 未重算的物资（统计窗口随日期滚动）。
+
+    Args:
+        db: 数据库管理器
+        window_days: 需求统计窗口（天）
+        service_level: 服务水平，SERVICE_LEVEL_Z 中的取值之一
+        refresh_days: 参数的最长有效天数
+    """
+
+    def __init__(self, db: DatabaseManager, window_days: int = 90, service_level: float = 0.95,
+                 refresh_days: int = 7):
+        if service_level not in SERVICE_LEVEL_Z:
+            raise ValueError(f"不支持的服务水平: {service_level}，可选 {sorted(SERVICE_LEVEL_Z)}")
+        self.db = db
+        self.window_days = window_days
+        self.z = SERVICE_LEVEL_Z[service_level]
+        self.refresh_days = refresh_days
+
+    def run(self, full: bool = False) -> Dict:
+        """执行一次计算，返回统计信息
+
+        Args:
+            full: 忽略水位，重算全部物资
+        """
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        since = (now - timedelta(days=self.window_days)).strftime(TIMESTAMP_FORMAT)
+        stale_before = (now - timedelta(days=self.refresh_days)).strftime(TIMESTAMP_FORMAT)
+
+        def work(cursor):
+            cursor.execute('''
+                SELECT last_stock_out_id, last_run FROM job_watermarks WHERE job_name = ?
+            ''', (JOB_NAME,))
+            watermark = cursor.fetchone()
+            cursor.execute("SELECT COALESCE(MAX(stock_out_id), 0) FROM stock_out")
+            max_stock_out_id = cursor.fetchone()[0]
+
+            if full or watermark is None:
+                item_ids = self._all_candidates(cursor, since)
+            else:
+                item_ids = self._changed_candidates(cursor, watermark[0], watermark[1], stale_before)
+
+            updated, cleared = self._recompute(cursor, item_ids, since)
+
+            cursor.execute('''
+                INSERT INTO job_watermarks (job_name, last_stock_out_id, last_run)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(job_name) DO UPDATE SET
+                    last_stock_out_id = excluded.last_stock_out_id,
+                    last_run = excluded.last_run
+            ''', (JOB_NAME, max_stock_out_id))
+            return len(item_ids), updated, cleared
+
+        candidates, updated, cleared = self.db.run_in_transaction(work)
+        return {
+            'candidates': candidates,
+            'updated': updated,
+            'cleared': cleared,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    @staticmethod
+    def _all_candidates(cursor, since: str):
+        """全量：窗口内有出库的物资，以及已有补货参数的物资（可能需要清除）"""
+        cursor.execute('''
+            SELECT DISTINCT item_id FROM stock_out WHERE operation_time >= ?
+            UNION
+            SELECT item_id FROM item_replenishment
+        ''', (since,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _changed_candidates(cursor, last_stock_out_id: int, last_run: str, stale_before: str):
+        """增量：新出库的物资、交货期变化的供应商的物资、参数已过期的物资"""
+        cursor.execute('''
+            SELECT DISTINCT item_id FROM stock_out WHERE stock_out_id > ?
+            UNION
+            SELECT i.item_id FROM items i
+            JOIN supplier_lead_times l ON l.supplier = i.supplier
+            WHERE l.updated_at >= ?
+            UNION
+            SELECT item_id FROM item_replenishment WHERE computed_at < ?
+        ''', (last_stock_out_id, last_run or '', stale_before))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _recompute(self, cursor, item_ids, since: str):
+        """计算给定物资的补货参数，一条语句批量写入；窗口内没有需求的物资清除参数（回退到最低库存）"""
+        if not item_ids:
+            return 0, 0
+        ids_json = json.dumps(item_ids)
+        # 先按 (物资, 日) 汇总出库量，再求每种物资日需求的和与平方和（没有出库的日子需求为 0）
+        cursor.execute('''
+            SELECT i.item_id, COALESCE(d.total, 0), COALESCE(d.total_sq, 0),
+                   COALESCE(l.lead_time_days, ?), COALESCE(l.lead_time_std_days, 0)
+            FROM items i
+            LEFT JOIN supplier_lead_times l ON l.supplier = i.supplier
+            LEFT JOIN (
+                SELECT item_id, SUM(qty) AS total, SUM(qty * qty) AS total_sq
+                FROM (
+                    SELECT item_id, substr(operation_time, 1, 10) AS day, SUM(quantity) AS qty
+                    FROM stock_out
+                    WHERE item_id IN (SELECT value FROM json_each(?)) AND operation_time >= ?
+                    GROUP BY item_id, day
+                )
+                GROUP BY item_id
+            ) d ON d.item_id = i.item_id
+            WHERE i.item_id IN (SELECT value FROM json_each(?))
+        ''', (DEFAULT_LEAD_TIME_DAYS, ids_json, since, ids_json))
+
+        rows = []
+        cleared = []
+        days = float(self.window_days)
+        for item_id, total, total_sq, lead_time, lead_time_std in cursor.fetchall():
+            if total <= 0:
+                cleared.append(item_id)
+                continue
+            mean = total / days
+            variance = max(total_sq / days - mean * mean, 0.0)
+            safety_stock = self.z * math.sqrt(lead_time * variance + mean * mean * lead_time_std * lead_time_std)
+            reorder_point = mean * lead_time + safety_stock
+            rows.append([item_id, round(mean, 4), round(math.sqrt(variance), 4), lead_time,
+                         int(math.ceil(safety_stock)), int(math.ceil(reorder_point))])
+
+        if rows:
+            cursor.execute('''
+                INSERT INTO item_replenishment
+                    (item_id, avg_daily_demand, demand_std, lead_time_days, safety_stock, reorder_point, computed_at)
+                SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'),
+                       json_extract(value, '$[3]'), json_extract(value, '$[4]'), json_extract(value, '$[5]'),
+                       CURRENT_TIMESTAMP
+                FROM json_each(?) WHERE 1
+                ON CONFLICT(item_id) DO UPDATE SET
+                    avg_daily_demand = excluded.avg_daily_demand,
+                    demand_std = excluded.demand_std,
+                    lead_time_days = excluded.lead_time_days,
+                    safety_stock = excluded.safety_stock,
+                    reorder_point = excluded.reorder_point,
+                    computed_at = excluded.computed_at
+            ''', (json.dumps(rows),))
+        cleared_count = 0
+        if cleared:
+            cursor.execute('''
+                DELETE FROM item_replenishment WHERE item_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(cleared),))
+            cleared_count = cursor.rowcount
+        return len(rows), cleared_count
+
+
+class PurchasePlanner:
+    """采购建议生成器
+
+    一条集合查询取出全部需补货物资（已按供应商排序），采购量、金额和按供应商分组的合计
+    按列计算（有 NumPy 时向量化），再批量写入草稿采购单。草稿计入在途量，重复生成不会重复下单。
+
+    Args:
+        db: 数据库管理器
+        use_numpy: 是否使用 NumPy（None 表示已安装则使用）
+    """
+
+    def __init__(self, db: DatabaseManager, use_numpy: Optional[bool] = None):
+        self.db = db
+        self.use_numpy = np is not None if use_numpy is None else (use_numpy and np is not None)
+
+    def suggest(self) -> Dict:
+        """计算采购建议（不写入数据库）
+
+        Returns:
+            {'lines': {item_id, supplier, quantity, unit_price, amount 各列},
+             'orders': [{'supplier', 'line_count', 'total_amount'}]}
+        """
+        rows = self.db.execute_query(PURCHASE_SUGGESTION_SQL, PO_OPEN_STATUSES)
+        return self._plan(rows)
+
+    def create_draft_orders(self, created_by: Optional[int] = None) -> Dict:
+        """生成草稿采购单（每个供应商一张），返回统计信息"""
+        started = time.perf_counter()
+
+        def work(cursor):
+            # 在写事务内重新计算，避免并发生成时在途量过期导致重复下单
+            cursor.execute(PURCHASE_SUGGESTION_SQL, PO_OPEN_STATUSES)
+            plan = self._plan(cursor.fetchall())
+            orders = plan['orders']
+            if not orders:
+                return plan
+            cursor.execute("SELECT COALESCE(MAX(po_id), 0) FROM purchase_orders")
+            first_po_id = cursor.fetchone()[0] + 1
+            cursor.executemany('''
+                INSERT INTO purchase_orders (po_id, supplier, status, line_count, total_amount, created_by)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(first_po_id + index, order['supplier'] or None, PO_STATUS_DRAFT,
+                   order['line_count'], order['total_amount'], created_by)
+                  for index, order in enumerate(orders)])
+            lines = plan['lines']
+            po_ids = itertools.chain.from_iterable(
+                itertools.repeat(first_po_id + index, order['line_count'])
+                for index, order in enumerate(orders))
+            cursor.executemany('''
+                INSERT INTO purchase_order_lines (po_id, item_id, quantity, unit_price, amount)
+                VALUES (?, ?, ?, ?, ?)
+            ''', zip(po_ids, lines['item_id'], lines['quantity'], lines['unit_price'], lines['amount']))
+            plan['first_po_id'] = first_po_id
+            return plan
+
+        plan = self.db.run_in_transaction(work)
+        return {
+            'orders': len(plan['orders']),
+            'lines': len(plan['lines']['item_id']),
+            'total_amount': round(sum(order['total_amount'] for order in plan['orders']), 2),
+            'first_po_id': plan.get('first_po_id'),
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def _plan(self, rows) -> Dict:
+        """由查询结果 (item_id, 供应商, 单价, 补货目标, 库存位置) 计算采购量、金额和供应商合计"""
+        if not rows:
+            return {'lines': {'item_id': [], 'supplier': [], 'quantity': [], 'unit_price': [], 'amount': []},
+                    'orders': []}
+        item_ids, suppliers, prices, targets, positions = zip(*rows)
+        if self.use_numpy:
+            return self._plan_numpy(item_ids, suppliers, prices, targets, positions)
+        return self._plan_python(item_ids, suppliers, prices, targets, positions)
+
+    @staticmethod
+    def _plan_numpy(item_ids, suppliers, prices, targets, positions) -> Dict:
+        prices = np.array(prices, dtype=np.float64)
+        quantities = np.array(targets, dtype=np.int64) - np.array(positions, dtype=np.int64)
+        amounts = np.round(quantities * prices, 2)
+        # 结果已按供应商排序，相邻供应商不同处即分组边界
+        supplier_array = np.array(suppliers, dtype=object)
+        starts = np.flatnonzero(np.concatenate(([True], supplier_array[1:] != supplier_array[:-1])))
+        counts = np.diff(np.append(starts, len(supplier_array)))
+        totals = np.round(np.add.reduceat(amounts, starts), 2)
+        orders = [{'supplier': suppliers[start], 'line_count': count, 'total_amount': total}
+                  for start, count, total in zip(starts.tolist(), counts.tolist(), totals.tolist())]
+        return {
+            'lines': {
+                'item_id': list(item_ids),
+                'supplier': list(suppliers),
+                'quantity': quantities.tolist(),
+                'unit_price': prices.tolist(),
+                'amount': amounts.tolist(),
+            },
+            'orders': orders,
+        }
+
+    @staticmethod
+    def _plan_python(item_ids, suppliers, prices, targets, positions) -> Dict:
+        quantities = [target - position for target, position in zip(targets, positions)]
+        amounts = [round(quantity * price, 2) for quantity, price in zip(quantities, prices)]
+        orders = []
+        start = 0
+        for supplier, group in itertools.groupby(suppliers):
+            count = sum(1 for _ in group)
+            orders.append({'supplier': supplier, 'line_count': count,
+                           'total_amount': round(sum(amounts[start:start + count]), 2)})
+            start += count
+        return {
+            'lines': {
+                'item_id': list(item_ids),
+                'supplier': list(suppliers),
+                'quantity': quantities,
+                'unit_price': [float(price) for price in prices],
+                'amount': amounts,
+            },
+            'orders': orders,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="计算物资补货点和安全库存")
+    parser.add_argument("--db", default="inventory.db")
+    parser.add_argument("--full", action="store_true", help="忽略水位，重算全部物资")
+    parser.add_argument("--window-days", type=int, default=90, help="需求统计窗口（天）")
+    parser.add_argument("--service-level", type=float, default=0.95, choices=sorted(SERVICE_LEVEL_Z))
+    parser.add_argument("--lead-time", nargs=2, action="append", metavar=("SUPPLIER", "DAYS"),
+                        help="登记供应商交货期（天），可重复")
+    parser.add_argument("--purchase-orders", action="store_true", help="计算补货点后为低库存物资生成草稿采购单")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db)
+    for supplier, days in args.lead_time or []:
+        db.set_supplier_lead_time(supplier, float(days))
+    planner = ReplenishmentPlanner(db, args.window_days, args.service_level)
+    stats = planner.run(full=args.full)
+    print(f"✓ 检查 {stats['candidates']} 种物资，更新补货点 {stats['updated']} 种，"
+          f"清除 {stats['cleared']} 种（无需求），耗时 {stats['seconds']}s")
+    if args.purchase_orders:
+        result = PurchasePlanner(db).create_draft_orders()
+        print(f"✓ 生成草稿采购单 {result['orders']} 张，{result['lines']} 行，"
+              f"金额 ¥{result['total_amount']:,.2f}，耗时 {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,16 @@
 用于创建丰富的测试数据
 """
 
+import argparse
+import os
 import sqlite3
+import tempfile
+import time
 from datetime import datetime, timedelta
 import random
 
+from database import DatabaseManager
+
 class SampleDataGenerator:
     """示例数据生成器"""
     
@@ -36,11 +42,17 @@ class SampleDataGenerator:
     
     def _clear_existing_data(self):
         """清空现有数据"""
-        tables = ['categories', 'items', 'inventory', 'stock_in', 'stock_out']
+        tables = ['categories', 'items', 'inventory', 'stock_in', 'stock_out', 'stock_out_allocations',
+                  'stock_snapshot_items', 'stock_snapshots', 'item_replenishment', 'supplier_lead_times',
+                  'job_watermarks', 'purchase_order_lines', 'purchase_orders', 'stock_transfers',
+                  'movement_journal', 'projection_checkpoints', 'item_balances', 'stock_alerts',
+                  'item_valuation', 'cost_layers']
         for table in tables:
             self.cursor.execute(f"DELETE FROM {table}")
         # 保留管理员用户
         self.cursor.execute("DELETE FROM users WHERE username != 'admin'")
+        # 重置自增序列，保证类目ID从1开始（子类目按父类目ID引用）
+        self.cursor.execute("DELETE FROM sqlite_sequence WHERE name != 'users'")
         self.conn.commit()
     
     def _generate_categories(self):
@@ -272,6 +284,263 @@ class SampleDataGenerator:
         """关闭数据库连接"""
         self.conn.close()
 
+# 规模预设：物资数、出入库流水数、时间跨度（天）
+SIZE_PRESETS = {
+    "tiny": {"items": 1000, "movements": 20000, "days": 180},
+    "small": {"items": 10000, "movements": 500000, "days": 365},
+    "medium": {"items": 100000, "movements": 5000000, "days": 730},
+    "large": {"items": 1000000, "movements": 50000000, "days": 730},
+}
+
+# 保质期分布（天, 权重），None 表示无有效期管理
+SHELF_LIFE_CHOICES = [(None, 40), (90, 10), (180, 15), (365, 20), (730, 15)]
+
+ITEM_BASE_NAMES = ["打印纸", "中性笔", "文件夹", "墨盒", "硒鼓", "显示器", "键盘", "鼠标", "螺丝刀", "万用表",
+                   "洗手液", "垃圾袋", "抹布", "安全帽", "手套", "口罩", "电池", "胶带", "标签纸", "插线板"]
+UNITS = ["个", "包", "盒", "台", "套", "瓶", "卷", "双", "支", "箱"]
+
+
+class ScaledDataGenerator(SampleDataGenerator):
+    """可扩展的合成数据生成器
+    
+    固定随机种子保证可复现；物资热度服从 Zipf 分布，补货按最低/最高库存触发，
+    出库按先进先出消耗批次。批量写入期间删除二级索引，写完后统一重建。
+    """
+    
+    CHUNK_SIZE = 50000
+    
+    def __init__(self, db_path="inventory.db", items=10000, movements=500000, days=365,
+                 seed=42, zipf_s=1.1, supplier_count=500):
+        # 确保表结构存在
+        DatabaseManager(db_path)
+        super().__init__(db_path)
+        self.item_count = items
+        self.movement_count = movements
+        self.days = days
+        self.zipf_s = zipf_s
+        self.supplier_count = supplier_count
+        self.rng = random.Random(seed)
+        self.stats = {}
+    
+    @classmethod
+    def from_preset(cls, preset, db_path="inventory.db", seed=42, **overrides):
+        """按规模预设创建生成器，overrides 可覆盖 items/movements/days"""
+        options = dict(SIZE_PRESETS[preset])
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(db_path, seed=seed, **options)
+    
+    def generate(self):
+        """生成全部数据，返回各表行数和写入速度统计"""
+        started = time.perf_counter()
+        print(f"开始生成合成数据：{self.item_count} 种物资，{self.movement_count} 条出入库流水，"
+              f"{self.days} 天")
+        
+        self._clear_existing_data()
+        self.cursor.execute("PRAGMA synchronous = OFF")
+        self.cursor.execute("PRAGMA journal_mode = MEMORY")
+        self.cursor.execute("PRAGMA cache_size = -262144")
+        index_sql = self._drop_secondary_indexes()
+        
+        self._generate_categories()
+        self._generate_users()
+        self._timed_step("items", self._generate_scaled_items)
+        self._timed_step("movements", self._generate_movements)
+        
+        index_started = time.perf_counter()
+        for sql in index_sql:
+            self.cursor.execute(sql)
+        self.cursor.execute("ANALYZE")
+        self.conn.commit()
+        self.stats["index_seconds"] = time.perf_counter() - index_started
+        self.stats["total_seconds"] = time.perf_counter() - started
+        
+        total_rows = sum(self.stats.get(key, 0) for key in ("items", "stock_in", "stock_out", "inventory"))
+        print(f"✓ 重建索引耗时 {self.stats['index_seconds']:.1f}s")
+        print(f"✓ 共写入 {total_rows} 行，耗时 {self.stats['total_seconds']:.1f}s，"
+              f"平均 {total_rows / self.stats['total_seconds']:.0f} 行/秒")
+        return self.stats
+    
+    def _timed_step(self, name, func):
+        """执行生成步骤并输出写入速度"""
+        started = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - started
+        print(f"✓ {name}: {rows} 行，{elapsed:.1f}s，{rows / max(elapsed, 1e-9):.0f} 行/秒")
+    
+    def _drop_secondary_indexes(self):
+        """删除二级索引并返回其建表语句，批量写入结束后重建"""
+        self.cursor.execute('''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL
+        ''')
+        indexes = self.cursor.fetchall()
+        for name, _ in indexes:
+            self.cursor.execute(f"DROP INDEX {name}")
+        return [sql for _, sql in indexes]
+    
+    def _zipf_cum_weights(self, count):
+        """Zipf 分布的累计权重（按热度排名）"""
+        cum_weights = []
+        total = 0.0
+        for rank in range(1, count + 1):
+            total += 1.0 / rank ** self.zipf_s
+            cum_weights.append(total)
+        return cum_weights
+    
+    def _generate_scaled_items(self):
+        """批量生成物资信息，供应商按 Zipf 分布"""
+        self.cursor.execute("SELECT category_id FROM categories WHERE parent_category_id IS NOT NULL")
+        leaf_ids = [row[0] for row in self.cursor.fetchall()]
+        suppliers = [f"供应商{n:04d}" for n in range(1, self.supplier_count + 1)]
+        supplier_weights = self._zipf_cum_weights(len(suppliers))
+        shelf_lives = [value for value, _ in SHELF_LIFE_CHOICES]
+        shelf_weights = [weight for _, weight in SHELF_LIFE_CHOICES]
+        rng = self.rng
+        
+        # 每种物资的最低/最高库存和保质期，生成流水时使用
+        self.min_stock = [0] * (self.item_count + 1)
+        self.max_stock = [0] * (self.item_count + 1)
+        self.shelf_life = [None] * (self.item_count + 1)
+        self.prices = [0.0] * (self.item_count + 1)
+        
+        for start in range(1, self.item_count + 1, self.CHUNK_SIZE):
+            rows = []
+            item_ids = range(start, min(start + self.CHUNK_SIZE, self.item_count + 1))
+            picked_suppliers = rng.choices(suppliers, cum_weights=supplier_weights, k=len(item_ids))
+            for item_id, supplier in zip(item_ids, picked_suppliers):
+                min_stock = rng.randint(5, 50)
+                max_stock = min_stock * rng.randint(4, 10)
+                price = round(rng.lognormvariate(3.5, 1.2), 2)
+                self.min_stock[item_id] = min_stock
+                self.max_stock[item_id] = max_stock
+                self.shelf_life[item_id] = rng.choices(shelf_lives, shelf_weights)[0]
+                self.prices[item_id] = price
+                base_name = ITEM_BASE_NAMES[item_id % len(ITEM_BASE_NAMES)]
+                rows.append((item_id, f"SKU{item_id:07d}", f"{base_name}-{item_id}",
+                             rng.choice(leaf_ids), f"规格{item_id % 97}", rng.choice(UNITS),
+                             supplier, price, round(price * 1.25, 2), min_stock, max_stock))
+            self.cursor.executemany('''
+                INSERT INTO items (item_id, item_code, item_name, category_id, specification,
+                                 unit, supplier, purchase_price, selling_price,
+                                 min_stock, max_stock)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.commit()
+        
+        self.stats["items"] = self.item_count
+        return self.item_count
+    
+    def _generate_movements(self):
+        """按时间顺序生成出入库流水，库存低于最低值时补货到最高值，出库先进先出"""
+        rng = self.rng
+        self.cursor.execute("SELECT user_id FROM users")
+        operators = [row[0] for row in self.cursor.fetchall()]
+        
+        # 热度排名到物资ID的随机映射
+        items_by_rank = list(range(1, self.item_count + 1))
+        rng.shuffle(items_by_rank)
+        item_weights = self._zipf_cum_weights(self.item_count)
+        
+        stock = [0] * (self.item_count + 1)
+        batches = {}  # item_id -> [[批次序号, 生产日期, 有效期, 剩余数量], ...]
+        batch_seq = 0
+        start_time = datetime.utcnow() - timedelta(days=self.days)
+        step = self.days * 86400 / max(self.movement_count, 1)
+        stock_in_count = stock_out_count = 0
+        
+        for chunk_start in range(0, self.movement_count, self.CHUNK_SIZE):
+            size = min(self.CHUNK_SIZE, self.movement_count - chunk_start)
+            picked = rng.choices(items_by_rank, cum_weights=item_weights, k=size)
+            stock_in_rows = []
+            stock_out_rows = []
+            for offset, item_id in enumerate(picked):
+                moment = start_time + timedelta(seconds=(chunk_start + offset) * step)
+                operation_time = moment.isoformat(' ', 'seconds')  # 与数据库时间格式一致，比 strftime 快
+                operator_id = operators[offset % len(operators)]
+                current = stock[item_id]
+                
+                if current <= self.min_stock[item_id]:
+                    # 补货到最高库存，形成新批次
+                    quantity = self.max_stock[item_id] - current
+                    batch_seq += 1
+                    production = moment - timedelta(days=rng.randint(0, 30))
+                    shelf_life = self.shelf_life[item_id]
+                    production_date = production.strftime("%Y-%m-%d")
+                    expiry_date = ((production + timedelta(days=shelf_life)).strftime("%Y-%m-%d")
+                                   if shelf_life else None)
+                    batch_number = f"B{batch_seq:09d}"
+                    batches.setdefault(item_id, []).append([batch_number, production_date, expiry_date, quantity])
+                    unit_price = round(self.prices[item_id] * rng.uniform(0.9, 1.1), 2)
+                    stock_in_rows.append((item_id, quantity, unit_price, round(quantity * unit_price, 2),
+                                          batch_number, production_date, expiry_date,
+                                          operator_id, operation_time))
+                    stock[item_id] = current + quantity
+                else:
+                    # 领用出库，从最早批次扣减
+                    quantity = min(current, rng.randint(1, max(1, self.max_stock[item_id] // 8)))
+                    remaining = quantity
+                    item_batches = batches[item_id]
+                    while remaining:
+                        batch = item_batches[0]
+                        used = min(batch[3], remaining)
+                        batch[3] -= used
+                        remaining -= used
+                        if batch[3] == 0:
+                            item_batches.pop(0)
+                    unit_price = round(self.prices[item_id] * 1.25, 2)
+                    stock_out_rows.append((item_id, quantity, unit_price, round(quantity * unit_price, 2),
+                                           "示例领用人", "日常领用", operator_id, operation_time))
+                    stock[item_id] = current - quantity
+            
+            self.cursor.executemany('''
+                INSERT INTO stock_in (item_id, quantity, unit_price, total_amount, batch_number,
+                                    production_date, expiry_date, operator_id, operation_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', stock_in_rows)
+            self.cursor.executemany('''
+                INSERT INTO stock_out (item_id, quantity, unit_price, total_amount,
+                                     recipient, purpose, operator_id, operation_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', stock_out_rows)
+            self.conn.commit()
+            stock_in_count += len(stock_in_rows)
+            stock_out_count += len(stock_out_rows)
+        
+        # 写入剩余批次库存
+        inventory_rows = [(item_id, quantity, batch_number, production_date, expiry_date)
+                          for item_id, item_batches in batches.items()
+                          for batch_number, production_date, expiry_date, quantity in item_batches]
+        self.cursor.executemany('''
+            INSERT INTO inventory (item_id, quantity, batch_number, production_date, expiry_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', inventory_rows)
+        self.conn.commit()
+        
+        self.stats["stock_in"] = stock_in_count
+        self.stats["stock_out"] = stock_out_count
+        self.stats["inventory"] = len(inventory_rows)
+        return stock_in_count + stock_out_count + len(inventory_rows)
+
+
+def get_benchmark_db(preset="small", seed=42, directory=None, **overrides):
+    """返回按预设生成的基准测试数据库路径；相同参数的数据库已存在时直接复用"""
+    directory = directory or os.path.join(tempfile.gettempdir(), "inventory_benchmark")
+    os.makedirs(directory, exist_ok=True)
+    suffix = "".join(f"_{key}{value}" for key, value in sorted(overrides.items()) if value is not None)
+    db_path = os.path.join(directory, f"{preset}_seed{seed}{suffix}.db")
+    if not os.path.exists(db_path):
+        partial_path = db_path + ".partial"
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        generator = ScaledDataGenerator.from_preset(preset, partial_path, seed, **overrides)
+        try:
+            generator.generate()
+        finally:
+            generator.close()
+        os.replace(partial_path, db_path)
+    return db_path
+
+
 def create_sample_data():
     """创建示例数据"""
     generator = SampleDataGenerator()
@@ -289,5 +558,27 @@ def create_sample_data():
     finally:
         generator.close()
 
+def main():
+    """命令行入口：默认生成示例数据，指定 --preset 时生成规模化合成数据"""
+    parser = argparse.ArgumentParser(description="示例/合成数据生成器")
+    parser.add_argument("--preset", choices=sorted(SIZE_PRESETS), help="合成数据规模预设")
+    parser.add_argument("--db", default="inventory.db", help="目标数据库文件")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--items", type=int, help="覆盖预设的物资数")
+    parser.add_argument("--movements", type=int, help="覆盖预设的出入库流水数")
+    parser.add_argument("--days", type=int, help="覆盖预设的时间跨度（天）")
+    args = parser.parse_args()
+    
+    if not args.preset:
+        create_sample_data()
+        return
+    
+    generator = ScaledDataGenerator.from_preset(args.preset, args.db, args.seed, items=args.items,
+                                                movements=args.movements, days=args.days)
+    try:
+        generator.generate()
+    finally:
+        generator.close()
+
 if __name__ == "__main__":
-    create_sample_data()
\ No newline at end of file
+    main()
\ No newline at end of file
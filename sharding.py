@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片部署
+按物资把数据分散到多个数据库文件（每个分片是一个完整的库存数据库），写入各自锁各自的文件；
+读取在线程池中并发查询各分片后按排序键归并，跨分片汇总报表可在一个连接上 ATTACH 全部分片执行
+"""
+
+import heapq
+import itertools
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from database import DEFAULT_LOCATION, DEFAULT_STORAGE_PROFILE, DatabaseManager, StockInRecord, StockOutRecord
+from query_builder import sort_key
+from query_stats import QueryStats
+from records import Record, record_type
+
+# SQLite 默认最多 ATTACH 10 个库（主库之外）
+MAX_ATTACHED = 10
+# SQLite 整数主键的最大值（跨分片游标换算用）
+MAX_ROW_ID = 2 ** 63 - 1
+
+# 带所在分片编号的出入库记录
+ShardStockInRecord = record_type('ShardStockInRecord', StockInRecord._fields + ('shard',))
+ShardStockOutRecord = record_type('ShardStockOutRecord', StockOutRecord._fields + ('shard',))
+
+
+class ShardedDatabaseManager:
+    """分片数据库管理器，接口与 DatabaseManager 的对应方法一致
+
+    分片键为物资：物资按编码哈希分到固定分片，item_id 在分片间交错分配
+    （第 k 个分片的 item_id 满足 (item_id - 1) % 分片数 == k），按 item_id 即可定位分片；
+    入库、出库、调拨只写物资所在分片。类目、用户、供应商交货期等主数据广播写入全部分片
+    （逐个分片写入，不是分布式事务），读取取第一个分片。
+
+    各分片的流水ID（stock_in_id 等）只在分片内唯一，出入库记录带所在分片编号，键集分页游标为
+    (排序列值, 分片, 记录ID)。
+
+    Args:
+        shard_paths: 各分片数据库文件路径，顺序即分片编号，部署后不能改变
+        max_workers: 并发查询线程数，默认等于分片数（SQLite 执行查询时释放 GIL）
+        stats: SQL 执行统计（各分片共用）
+        storage_profile: 各分片的存储配置（常驻读连接按线程分别保留）
+    """
+
+    def __init__(self, shard_paths: Sequence[str], max_workers: Optional[int] = None,
+                 stats: Optional[QueryStats] = None, storage_profile=DEFAULT_STORAGE_PROFILE):
+        if not shard_paths:
+            raise ValueError("至少需要一个分片")
+        self.shards = [DatabaseManager(path, stats, storage_profile=storage_profile) for path in shard_paths]
+        self._pool = ThreadPoolExecutor(max_workers or len(self.shards)) if len(self.shards) > 1 else None
+
+    @classmethod
+    def from_directory(cls, directory: str, shard_count: int, **kwargs) -> "ShardedDatabaseManager":
+        """使用目录下的 inventory_shard0.db ... inventory_shard{N-1}.db"""
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, f"inventory_shard{index}.db") for index in range(shard_count)]
+        return cls(paths, **kwargs)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    # ---------- 路由 ----------
+    def shard_index_for_code(self, item_code: str) -> int:
+        return zlib.crc32(item_code.encode('utf-8')) % len(self.shards)
+
+    def shard_for_item(self, item_id: int) -> DatabaseManager:
+        return self.shards[(item_id - 1) % len(self.shards)]
+
+    def _fan_out(self, method: str, *args, **kwargs) -> List:
+        """在全部分片上并发调用同名方法，按分片顺序返回结果"""
+        if self._pool is None:
+            return [getattr(self.shards[0], method)(*args, **kwargs)]
+        futures = [self._pool.submit(getattr(shard, method), *args, **kwargs) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def _fan_out_each(self, method: str, shard_args: Sequence[Tuple]) -> List:
+        """在各分片上并发调用同名方法，每个分片使用各自的参数，按分片顺序返回结果"""
+        if self._pool is None:
+            return [getattr(self.shards[0], method)(*shard_args[0])]
+        futures = [self._pool.submit(getattr(shard, method), *args)
+                   for shard, args in zip(self.shards, shard_args)]
+        return [future.result() for future in futures]
+
+    def _broadcast(self, method: str, *args, **kwargs) -> bool:
+        """主数据写入全部分片（各分片按相同顺序写入，自增ID保持一致）"""
+        return all([getattr(shard, method)(*args, **kwargs) for shard in self.shards])
+
+    @staticmethod
+    def _merge(results: Sequence[List[Record]], key, reverse: bool = False,
+               limit: Optional[int] = None) -> List[Record]:
+        """归并各分片已排好序的结果"""
+        merged = heapq.merge(*results, key=key, reverse=reverse)
+        if limit is not None:
+            return list(itertools.islice(merged, limit))
+        return list(merged)
+
+    # ---------- 主数据（广播写入） ----------
+    def add_user(self, username: str, password: str, full_name: str, role: str) -> bool:
+        return self._broadcast('add_user', username, password, full_name, role)
+
+    def get_users(self) -> List[Record]:
+        return self.shards[0].get_users()
+
+    def add_category(self, category_name: str, description: str = "", parent_category_id: int = None) -> bool:
+        return self._broadcast('add_category', category_name, description, parent_category_id)
+
+    def get_categories(self) -> List[Record]:
+        return self.shards[0].get_categories()
+
+    def get_category_tree(self):
+        return self.shards[0].get_category_tree()
+
+    def set_supplier_lead_time(self, supplier: str, lead_time_days: float,
+                               lead_time_std_days: float = 0.0) -> bool:
+        return self._broadcast('set_supplier_lead_time', supplier, lead_time_days, lead_time_std_days)
+
+    # ---------- 物资（按编码路由） ----------
+    def add_item(self, item_code: str, item_name: str, category_id: int, **kwargs) -> Optional[int]:
+        """添加物资到编码所在分片，返回分配的 item_id（编码重复时返回 None）
+
+        同一分片的物资须由一个进程创建（下一个 item_id 按分片内最大值计算）。
+        """
+        index = self.shard_index_for_code(item_code)
+        shard = self.shards[index]
+        count = len(self.shards)
+        item_id = shard.execute_query('''
+            SELECT COALESCE(MAX(item_id), ?) + ? FROM items
+        ''', (index + 1 - count, count))[0][0]
+        if shard.add_item(item_code, item_name, category_id, item_id=item_id, **kwargs):
+            return item_id
+        return None
+
+    def get_items(self) -> List[Record]:
+        return self._merge(self._fan_out('get_items'), key=lambda row: row.item_id)
+
+    # ---------- 出入库（按 item_id 路由） ----------
+    def stock_in(self, item_id: int, quantity: int, unit_price: float, **kwargs) -> bool:
+        return self.shard_for_item(item_id).stock_in(item_id, quantity, unit_price, **kwargs)
+
+    def stock_out(self, item_id: int, quantity: int, unit_price: float, **kwargs) -> bool:
+        return self.shard_for_item(item_id).stock_out(item_id, quantity, unit_price, **kwargs)
+
+    def transfer_stock(self, item_id: int, quantity: int, from_location: str, to_location: str,
+                       **kwargs) -> bool:
+        return self.shard_for_item(item_id).transfer_stock(item_id, quantity, from_location, to_location,
+                                                            **kwargs)
+
+    def get_current_stock(self, item_id: int, location: Optional[str] = None) -> int:
+        return self.shard_for_item(item_id).get_current_stock(item_id, location)
+
+    # ---------- 查询（并发查询各分片后归并） ----------
+    def get_inventory_status(self, location: Optional[str] = None,
+                             by_location: bool = False) -> List[Record]:
+        return self._merge(self._fan_out('get_inventory_status', location, by_location),
+                           key=lambda row: row.item_id)
+
+    def search_items(self, keyword: str = "", category_filter: str = "全部", supplier_filter: str = "全部",
+                     sort_by: str = "item_id", descending: bool = False,
+                     after: Tuple = None, limit: int = None) -> List[Record]:
+        """各分片各取一页，归并后截取一页（键集分页条件在各分片上相同）"""
+        results = self._fan_out('search_items', keyword, category_filter, supplier_filter,
+                                sort_by, descending, after, limit)
+        return self._merge(results, key=lambda row: sort_key(row, sort_by), reverse=descending, limit=limit)
+
+    def search_inventory_status(self, keyword: str = "", category_filter: str = "全部",
+                                status_filter: str = "全部", sort_by: str = "item_id",
+                                descending: bool = False, after: Tuple = None,
+                                limit: int = None) -> List[Record]:
+        results = self._fan_out('search_inventory_status', keyword, category_filter, status_filter,
+                                sort_by, descending, after, limit)
+        return self._merge(results, key=lambda row: sort_key(row, sort_by), reverse=descending, limit=limit)
+
+    def get_stock_in_records(self, include_archive: bool = False, start=None, end=None,
+                             sort_by: str = "operation_time", descending: bool = True,
+                             after: Tuple = None, limit: int = None) -> List[Record]:
+        """各分片各取一页，归并后截取一页
+
+        记录ID在各分片内独立编号，返回的行末尾带所在分片编号（shard），按 (排序列值, 分片, 记录ID) 排序；
+        after 为上一页最后一行的 (排序列值, 分片, 记录ID)。
+        """
+        return self._ledger_records('get_stock_in_records', ShardStockInRecord, 'stock_in_id',
+                                    include_archive, start, end, sort_by, descending, after, limit)
+
+    def get_stock_out_records(self, include_archive: bool = False, start=None, end=None,
+                              sort_by: str = "operation_time", descending: bool = True,
+                              after: Tuple = None, limit: int = None) -> List[Record]:
+        """参数与返回值同 get_stock_in_records"""
+        return self._ledger_records('get_stock_out_records', ShardStockOutRecord, 'stock_out_id',
+                                    include_archive, start, end, sort_by, descending, after, limit)
+
+    def _ledger_records(self, method: str, record, key: str, include_archive, start, end,
+                        sort_by: str, descending: bool, after: Optional[Tuple], limit: Optional[int]) -> List[Record]:
+        """流水记录的跨分片键集分页
+
+        各分片只按 (排序列值, 记录ID) 分页，游标中的分片编号换算成各分片自己的游标：
+        排序值与游标相同的行，游标所在分片从记录ID之后继续，排在它前面的分片已经取完
+        （记录ID取最大值，跳过该排序值），排在它后面的分片还没有开始（记录ID取 0，保留该排序值）。
+        升序、降序的换算相同。
+        """
+        if after is None:
+            shard_after = [None] * len(self.shards)
+        else:
+            value, after_shard, after_id = after
+            shard_after = [(value, after_id if index == after_shard else MAX_ROW_ID if index < after_shard else 0)
+                           for index in range(len(self.shards))]
+        results = self._fan_out_each(method, [
+            (include_archive, start, end, sort_by, descending, shard_after[index], limit)
+            for index in range(len(self.shards))])
+        results = [[record(*row, index) for row in rows] for index, rows in enumerate(results)]
+        return self._merge(results, key=lambda row: (row[sort_by], row.shard, row[key]),
+                           reverse=descending, limit=limit)
+
+    def get_expiring_batches(self, *args, **kwargs) -> List[Record]:
+        return self._merge(self._fan_out('get_expiring_batches', *args, **kwargs),
+                           key=lambda row: row.expiry_date)
+
+    def get_location_balances(self, item_id: Optional[int] = None) -> List[Record]:
+        if item_id is not None:
+            return self.shard_for_item(item_id).get_location_balances(item_id)
+        return self._merge(self._fan_out('get_location_balances'),
+                           key=lambda row: (row.item_id, row.location))
+
+    def get_locations(self) -> List[str]:
+        locations = set().union(*self._fan_out('get_locations'))
+        locations.discard(DEFAULT_LOCATION)
+        return [DEFAULT_LOCATION] + sorted(locations)
+
+    # ---------- 跨分片 SQL（ATTACH） ----------
+    def federated_query(self, template: str, params: Sequence = (), outer: Optional[str] = None) -> List[tuple]:
+        """在一个连接上 ATTACH 全部分片，把各分片的查询 UNION ALL 后执行
+
+        Args:
+            template: 单个分片的查询，表名前用 {db} 表示分片库名，如 "SELECT quantity FROM {db}.inventory"
+            params: 单个分片查询的参数，按分片数重复绑定
+            outer: 外层查询，用 {union} 引用合并结果，如 "SELECT SUM(quantity) FROM ({union})"
+        """
+        if len(self.shards) - 1 > MAX_ATTACHED:
+            raise ValueError(f"分片数超过 ATTACH 上限 {MAX_ATTACHED + 1}")
+        conn = self.shards[0]._connect()
+        try:
+            names = ['main']
+            for index, shard in enumerate(self.shards[1:], 1):
+                conn.execute(f"ATTACH DATABASE ? AS shard{index}", (shard.db_path,))
+                names.append(f"shard{index}")
+            union = "\nUNION ALL\n".join(template.format(db=name) for name in names)
+            query = outer.format(union=union) if outer else union
+            return conn.execute(query, tuple(params) * len(names)).fetchall()
+        finally:
+            conn.close()
+
+    def get_location_totals(self) -> Dict[str, int]:
+        """全部分片按库位汇总的库存总量"""
+        rows = self.federated_query(
+            "SELECT location, quantity FROM {db}.inventory",
+            outer="SELECT location, SUM(quantity) FROM ({union}) GROUP BY location ORDER BY location")
+        return {location: quantity for location, quantity in rows}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存分析：统计窗口跨过归档截止时间时，已归档的流水仍计入消耗量
+运行：python -m pytest test_analytics.py（或 python -m unittest test_analytics）
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from analytics import InventoryAnalytics
+from database import DatabaseManager, TIMESTAMP_FORMAT
+from maintenance import DatabaseMaintenance
+
+
+class AnalyticsArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="inventory_test_")
+        self.db = DatabaseManager(os.path.join(self.work_dir, "inventory.db"))
+        self.db.add_category("测试类目")
+        category_id = self.db.get_categories()[0]['category_id']
+        self.db.add_item("T001", "测试物资", category_id, purchase_price=1.0)
+        self.item_id = self.db.execute_query("SELECT item_id FROM items WHERE item_code = 'T001'")[0][0]
+
+        # 18 个月前入库 100、出库 40，最近再出库 10
+        old = (datetime.utcnow() - timedelta(days=540)).strftime(TIMESTAMP_FORMAT)
+        self.assertTrue(self.db.stock_in(self.item_id, 100, 1.0))
+        self.assertTrue(self.db.stock_out(self.item_id, 40, 1.0))
+        for table in ('stock_in', 'stock_out'):
+            self.db.execute_update(f"UPDATE {table} SET operation_time = ?", (old,))
+        self.assertTrue(self.db.stock_out(self.item_id, 10, 1.0))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _usage(self, analytics):
+        row = analytics.get_rows(730)[0]
+        return row.usage, row.current_stock
+
+    def test_window_reads_archived_partitions(self):
+        analytics = InventoryAnalytics(self.db)
+        self.assertEqual(self._usage(analytics), (50, 50))
+
+        result = DatabaseMaintenance(self.db).archive_ledgers(months=12)
+        self.assertEqual(result['rows']['stock_out'], 1)
+
+        # 缓存随归档失效，重新汇总时读取归档分区
+        self.assertEqual(self._usage(analytics), (50, 50))
+        self.assertEqual(self._usage(InventoryAnalytics(self.db)), (50, 50))
+        # 窗口不到归档截止时间时只计主库中的流水
+        self.assertEqual(InventoryAnalytics(self.db).get_rows(90)[0].usage, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
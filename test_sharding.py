@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片部署：各分片的记录ID独立编号，出入库记录跨分片键集分页不重复、不遗漏
+运行：python -m pytest test_sharding.py（或 python -m unittest test_sharding）
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from sharding import ShardedDatabaseManager
+
+
+class ShardedRecordPagingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="inventory_test_")
+        self.db = ShardedDatabaseManager.from_directory(self.work_dir, 2)
+        self.db.add_category("测试类目")
+        category_id = self.db.get_categories()[0]['category_id']
+        item_ids = [self.db.add_item(f"T{index:03d}", f"测试物资{index}", category_id) for index in range(6)]
+        self.assertEqual({(item_id - 1) % 2 for item_id in item_ids}, {0, 1})
+
+        # 两个分片的记录ID都从 1 开始，且同一秒内写入（操作时间大量相同）
+        for item_id in item_ids:
+            for _ in range(3):
+                self.assertTrue(self.db.stock_in(item_id, 5, 1.0))
+                self.assertTrue(self.db.stock_out(item_id, 1, 1.0))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _pages(self, fetch, sort_by, descending, key):
+        rows = []
+        after = None
+        while True:
+            page = fetch(sort_by=sort_by, descending=descending, after=after, limit=5)
+            if not page:
+                return rows
+            rows.extend(page)
+            last = page[-1]
+            after = (last[sort_by], last.shard, last[key])
+
+    def test_keyset_paging_across_shards(self):
+        for fetch, key in ((self.db.get_stock_in_records, 'stock_in_id'),
+                           (self.db.get_stock_out_records, 'stock_out_id')):
+            full = fetch(sort_by=key, descending=False)
+            self.assertEqual(len({(row.shard, row[key]) for row in full}), 18)
+            for sort_by in (key, 'operation_time'):
+                for descending in (False, True):
+                    expected = [(row.shard, row[key]) for row in fetch(sort_by=sort_by, descending=descending)]
+                    paged = [(row.shard, row[key]) for row in self._pages(fetch, sort_by, descending, key)]
+                    self.assertEqual(paged, expected, (key, sort_by, descending))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史时点库存：归档历史流水后，截止时间之前的时点仍按完整流水重建
+运行：python -m pytest test_stock_as_of.py（或 python -m unittest test_stock_as_of）
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from database import DatabaseManager
+from maintenance import DatabaseMaintenance
+
+
+class StockAsOfArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="inventory_test_")
+        self.db = DatabaseManager(os.path.join(self.work_dir, "inventory.db"))
+        self.db.add_category("测试类目")
+        category_id = self.db.get_categories()[0]['category_id']
+        self.db.add_item("T001", "测试物资", category_id)
+        self.item_id = self.db.execute_query("SELECT item_id FROM items WHERE item_code = 'T001'")[0][0]
+
+        # 2020 年的流水（操作时间改为历史时间），之后再有一笔当前入库
+        self._stock_in(10, '2020-01-10 09:00:00')
+        self._stock_in(5, '2020-03-01 09:00:00')
+        self.assertTrue(self.db.stock_out(self.item_id, 3, 1.0))
+        self._set_time('stock_out', '2020-06-01 09:00:00')
+        self.assertTrue(self.db.stock_in(self.item_id, 7, 1.0))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _stock_in(self, quantity, operation_time):
+        self.assertTrue(self.db.stock_in(self.item_id, quantity, 1.0))
+        self._set_time('stock_in', operation_time)
+
+    def _set_time(self, table, operation_time):
+        key = f"{table}_id"
+        self.db.execute_update(f'''
+            UPDATE {table} SET operation_time = ? WHERE {key} = (SELECT MAX({key}) FROM {table})
+        ''', (operation_time,))
+
+    def _archive(self):
+        # 截止时间 2020-07-01：2020 年的流水全部迁入归档库
+        result = DatabaseMaintenance(self.db).archive_ledgers(months=6, now=datetime(2021, 1, 1))
+        self.assertEqual(result['rows']['stock_in'], 2)
+        self.assertEqual(result['rows']['stock_out'], 1)
+
+    def test_stock_before_archive_cutoff(self):
+        expected = {'2020-02-01': 10, '2020-04-01': 15, '2020-12-31': 12, None: 19}
+        for timestamp, quantity in expected.items():
+            self.assertEqual(self.db.get_stock_as_of(timestamp, self.item_id), quantity)
+
+        self._archive()
+
+        for timestamp, quantity in expected.items():
+            self.assertEqual(self.db.get_stock_as_of(timestamp, self.item_id), quantity, timestamp)
+        self.assertEqual(self.db.get_stock_as_of('2020-04-01'), {self.item_id: 15})
+
+    def test_snapshot_before_archive_cutoff(self):
+        self._archive()
+        self.assertIsNotNone(self.db.create_stock_snapshot('2020-03-15 00:00:00'))
+        self.assertEqual(self.db.get_stock_as_of('2020-03-20', self.item_id), 15)
+        self.assertEqual(self.db.get_stock_as_of('2020-01-31', self.item_id), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
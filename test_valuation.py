@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存估值：先进先出成本层按入库先后消耗，与移动加权平均并列
+运行：python -m pytest test_valuation.py（或 python -m unittest test_valuation）
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from database import DatabaseManager
+from valuation import METHOD_FIFO, METHOD_MOVING_AVERAGE, InventoryValuation
+
+
+class FifoCostLayerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="inventory_test_")
+        self.db = DatabaseManager(os.path.join(self.work_dir, "inventory.db"))
+        self.db.add_category("测试类目")
+        category_id = self.db.get_categories()[0]['category_id']
+        self.db.add_item("T001", "测试物资", category_id)
+        self.item_id = self.db.execute_query("SELECT item_id FROM items WHERE item_code = 'T001'")[0][0]
+        self.valuation = InventoryValuation(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_layers_consumed_oldest_first(self):
+        # 三笔无批次号的入库合并为同一个批次库存行，但各自是一个成本层
+        for unit_price in (2.0, 4.0, 6.0):
+            self.assertTrue(self.db.stock_in(self.item_id, 10, unit_price))
+        self.assertTrue(self.db.stock_out(self.item_id, 15, 9.0))
+
+        cost = self.valuation.get_item_cost(self.item_id)
+        self.assertEqual([(layer.remaining, layer.unit_cost) for layer in cost['layers']], [(5, 4.0), (10, 6.0)])
+        self.assertEqual(cost['fifo_value'], 80.0)
+        self.assertEqual(cost['moving_average_value'], 60.0)
+        self.assertEqual(self.valuation.get_total_value(METHOD_FIFO), 80.0)
+        self.assertEqual(self.valuation.get_total_value(METHOD_MOVING_AVERAGE), 60.0)
+
+        # 调拨不改变成本层；库位金额按物资的先进先出单位成本分摊
+        self.assertTrue(self.db.transfer_stock(self.item_id, 3, "主仓库", "二号仓库"))
+        by_location = {row.location: row.value for row in self.valuation.get_value_by_location(METHOD_FIFO)}
+        self.assertAlmostEqual(by_location["二号仓库"], 16.0)
+        self.assertAlmostEqual(sum(by_location.values()), 80.0)
+        self.assertEqual(self.valuation.verify(),
+                         {'quantity_mismatches': 0, 'layer_mismatches': 0, 'missing_costs': 0})
+
+    def test_failed_stock_out_keeps_layers(self):
+        self.assertTrue(self.db.stock_in(self.item_id, 5, 3.0))
+        self.assertFalse(self.db.stock_out(self.item_id, 6, 1.0))
+        self.assertEqual(self.valuation.get_item_cost(self.item_id)['fifo_value'], 15.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
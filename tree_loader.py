@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Treeview 分批加载与表头排序
+一次性 insert 全部行会让 Tk 事件循环停顿到插入完成。TreeviewLoader 先同步插入首批行（约一屏），
+其余行在 after_idle 回调中按时间片分批插入，两批之间界面照常响应输入和重绘；
+加载期间在表格右下角显示进度，离开界面或重新加载时调用 cancel 停止。
+TreeviewSorter 让表头可点击：按排序列重新查询（数据库 ORDER BY 走索引），
+只读取首页，滚动到接近底部时再按键集读取下一页
+"""
+
+import time
+import tkinter as tk
+from tkinter import messagebox, ttk
+from typing import Callable, Dict, Optional, Sequence
+
+# 同步插入的首批行数（首屏可见行数的数倍，保证首屏内容立即出现）
+FIRST_CHUNK_ROWS = 100
+# 每个空闲回调插入行的时间片（毫秒），期间每 CHECK_EVERY_ROWS 行检查一次时间
+CHUNK_BUDGET_MS = 15
+CHECK_EVERY_ROWS = 50
+# 表头排序后每页读取的行数，滚动位置超过 NEXT_PAGE_THRESHOLD 时读取下一页
+SORT_PAGE_SIZE = 200
+NEXT_PAGE_THRESHOLD = 0.9
+
+
+class TreeviewLoader:
+    """分批向 Treeview 插入行
+
+    Args:
+        tree: 目标表格（不会清空已有的行）
+        rows: 数据行
+        row_values: 行 -> 表格 values
+        row_options: 行 -> 额外的 insert 参数（如 iid、tags），None 表示没有
+        on_done: 全部插入后调用（取消时不调用）
+        first_chunk: 同步插入的首批行数
+        budget_ms: 每批插入的时间片
+    """
+
+    def __init__(self, tree: ttk.Treeview, rows: Sequence, row_values: Callable,
+                 row_options: Optional[Callable[..., Dict]] = None, on_done: Optional[Callable] = None,
+                 first_chunk: int = FIRST_CHUNK_ROWS, budget_ms: float = CHUNK_BUDGET_MS):
+        self.tree = tree
+        self.rows = rows
+        self.row_values = row_values
+        self.row_options = row_options
+        self.on_done = on_done
+        self.first_chunk = first_chunk
+        self.budget_ms = budget_ms
+        self.loaded = 0
+        # 回调挂在顶层窗口上：表格被销毁后回调仍可执行并自行停止
+        self._scheduler = tree.winfo_toplevel()
+        self._job = None
+        self._progress_frame = None
+
+    @property
+    def active(self) -> bool:
+        """是否还有未插入的行（取消后为 False）"""
+        return self._job is not None
+
+    def start(self) -> 'TreeviewLoader':
+        """同步插入首批行，剩余行交给空闲回调"""
+        self._insert(limit=self.first_chunk)
+        if self.loaded < len(self.rows):
+            self._show_progress()
+            self._job = self._scheduler.after_idle(self._step)
+        elif self.on_done is not None:
+            self.on_done()
+        return self
+
+    def cancel(self):
+        """停止加载（已插入的行保留）"""
+        if self._job is not None:
+            try:
+                self._scheduler.after_cancel(self._job)
+            except tk.TclError:
+                pass
+            self._job = None
+        self._hide_progress()
+
+    def _insert(self, limit: Optional[int] = None, deadline: Optional[float] = None):
+        """插入到 limit 行或到达 deadline 为止"""
+        tree = self.tree
+        rows = self.rows
+        row_values = self.row_values
+        row_options = self.row_options
+        end = len(rows) if limit is None else min(len(rows), self.loaded + limit)
+        index = self.loaded
+        while index < end:
+            row = rows[index]
+            if row_options is None:
+                tree.insert('', 'end', values=row_values(row))
+            else:
+                tree.insert('', 'end', values=row_values(row), **row_options(row))
+            index += 1
+            if deadline is not None and index % CHECK_EVERY_ROWS == 0 and time.perf_counter() >= deadline:
+                break
+        self.loaded = index
+
+    def _step(self):
+        self._job = None
+        if not self.tree.winfo_exists():
+            self._progress_frame = None
+            return
+        self._insert(deadline=time.perf_counter() + self.budget_ms / 1000)
+        if self.loaded < len(self.rows):
+            self._update_progress()
+            self._job = self._scheduler.after_idle(self._step)
+            return
+        self._hide_progress()
+        if self.on_done is not None:
+            self.on_done()
+
+    # ---------- 进度显示 ----------
+    def _show_progress(self):
+        """在表格右下角叠放进度条（不改变原有布局）"""
+        frame = tk.Frame(self.tree.master, bg='white', bd=1, relief='solid')
+        self._progress_label = tk.Label(frame, bg='white', font=('微软雅黑', 9))
+        self._progress_label.pack(side='left', padx=(5, 5))
+        self._progress_bar = ttk.Progressbar(frame, length=120, maximum=len(self.rows))
+        self._progress_bar.pack(side='left', padx=(0, 5), pady=3)
+        frame.place(in_=self.tree, relx=1.0, rely=1.0, anchor='se', x=-5, y=-5)
+        self._progress_frame = frame
+        self._update_progress()
+
+    def _update_progress(self):
+        self._progress_label.configure(text=f"正在加载 {self.loaded}/{len(self.rows)}")
+        self._progress_bar.configure(value=self.loaded)
+
+    def _hide_progress(self):
+        if self._progress_frame is not None:
+            try:
+                self._progress_frame.destroy()
+            except tk.TclError:
+                pass
+            self._progress_frame = None
+
+
+class TreeviewSorter:
+    """表头点击排序：第一次点击升序，再次点击同一列切换降序
+
+    Args:
+        tree: 目标表格（排序时清空后按页插入）
+        columns: 可排序的表格列 -> 查询排序列（只应列出有索引的列）
+        fetch_page: (sort_by, descending, after, limit) -> 一页数据行
+        page_key: (行, sort_by) -> 下一页的键集值 (排序列值, 记录ID)
+        row_values, row_options: 同 TreeviewLoader
+        on_sort: 重新查询前调用（如取消表格上未完成的分批加载）
+        page_size: 每页行数
+    """
+
+    def __init__(self, tree: ttk.Treeview, columns: Dict[str, str], fetch_page: Callable,
+                 page_key: Callable, row_values: Callable, row_options: Optional[Callable[..., Dict]] = None,
+                 on_sort: Optional[Callable] = None, page_size: int = SORT_PAGE_SIZE):
+        self.tree = tree
+        self.columns = columns
+        self.fetch_page = fetch_page
+        self.page_key = page_key
+        self.row_values = row_values
+        self.row_options = row_options
+        self.on_sort = on_sort
+        self.page_size = page_size
+        self.sort_by = None
+        self.descending = False
+        self._after = None
+        self._exhausted = True
+        self._scheduler = tree.winfo_toplevel()
+        self._job = None
+        self._headings = {column: tree.heading(column, 'text') for column in columns}
+        for column in columns:
+            tree.heading(column, command=lambda column=column: self.sort(column))
+        # 接管纵向滚动回调：先转发给原来的滚动条，再判断是否需要下一页
+        self._yscrollcommand = tree.tk.splitlist(tree.cget('yscrollcommand'))
+        tree.configure(yscrollcommand=self._on_yscroll)
+
+    def sort(self, column: str):
+        """按表格列排序并重新读取首页"""
+        sort_by = self.columns[column]
+        if sort_by == self.sort_by:
+            self.descending = not self.descending
+        else:
+            self.sort_by, self.descending = sort_by, False
+        if self.on_sort is not None:
+            self.on_sort()
+        self.cancel()
+        self.tree.delete(*self.tree.get_children())
+        self._after = None
+        self._exhausted = False
+        for name, text in self._headings.items():
+            arrow = (' ▼' if self.descending else ' ▲') if name == column else ''
+            self.tree.heading(name, text=text + arrow)
+        self._load_page()
+
+    def reset(self):
+        """表格内容被其他方式替换（搜索、清除搜索）后恢复为未排序状态"""
+        self.cancel()
+        self.sort_by = None
+        self._exhausted = True
+        for name, text in self._headings.items():
+            self.tree.heading(name, text=text)
+
+    def cancel(self):
+        if self._job is not None:
+            try:
+                self._scheduler.after_cancel(self._job)
+            except tk.TclError:
+                pass
+            self._job = None
+
+    def _load_page(self):
+        try:
+            rows = self.fetch_page(self.sort_by, self.descending, self._after, self.page_size)
+        except Exception as e:
+            self._exhausted = True
+            messagebox.showerror("错误", f"排序查询出错：{str(e)}")
+            return
+        tree = self.tree
+        for row in rows:
+            if self.row_options is None:
+                tree.insert('', 'end', values=self.row_values(row))
+                continue
+            options = self.row_options(row)
+            # 翻页期间排序值被修改过的行可能再次出现
+            if 'iid' in options and tree.exists(options['iid']):
+                continue
+            tree.insert('', 'end', values=self.row_values(row), **options)
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        else:
+            self._after = self.page_key(rows[-1], self.sort_by)
+
+    def _next_page(self):
+        self._job = None
+        if self.tree.winfo_exists() and not self._exhausted:
+            self._load_page()
+
+    def _on_yscroll(self, first, last):
+        if self._yscrollcommand:
+            self.tree.tk.call(*self._yscrollcommand, first, last)
+        if not self._exhausted and self._job is None and float(last) >= NEXT_PAGE_THRESHOLD:
+            self._job = self._scheduler.after_idle(self._next_page)
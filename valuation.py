@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存估值：移动加权平均成本、先进先出成本层与批次成本
+成本状态在出入库事务中随库存一起维护（DatabaseManager._apply_moving_average、_consume_cost_layers、
+inventory.unit_cost），估值查询只读取维护好的状态，不回放出入库流水：
+- 移动加权平均（moving_average）：item_valuation 每种物资一行（数量、库存金额、平均成本），
+  入库按入库单价加权重算平均成本，出库按平均成本减少金额
+- 先进先出（fifo）：cost_layers 每笔入库一个成本层（剩余数量、入库单价），出库按入库先后消耗，
+  库存金额为各物资未消耗成本层的剩余数量 × 单价
+- 批次成本（batch_cost，个别计价）：每个批次库存行带有成本（inventory.unit_cost），按批次实际成本计价；
+  同一物资、库位、批次号的多次入库（以及无批次号的库存）合并为一行，成本为各次入库的加权平均，
+  因此不是逐笔入库的先进先出计价。出库消耗的批次成本记在 stock_out_allocations.unit_cost
+"""
+
+import time
+from typing import Dict, List
+
+from database import DatabaseManager
+from records import Record, record_type
+
+METHOD_MOVING_AVERAGE = 'moving_average'
+METHOD_FIFO = 'fifo'
+METHOD_BATCH_COST = 'batch_cost'
+VALUATION_METHODS = (METHOD_MOVING_AVERAGE, METHOD_FIFO, METHOD_BATCH_COST)
+
+# 按类目/库位汇总的库存金额
+CategoryValueRecord = record_type('CategoryValueRecord', (
+    'category_id', 'category_name', 'item_count', 'quantity', 'value'))
+LocationValueRecord = record_type('LocationValueRecord', ('location', 'item_count', 'quantity', 'value'))
+# 物资未消耗完的先进先出成本层（期初成本层没有入库记录ID）
+CostLayerRecord = record_type('CostLayerRecord', (
+    'layer_id', 'stock_in_id', 'created_at', 'remaining', 'unit_cost', 'value'))
+# 物资各批次的成本
+BatchCostRecord = record_type('BatchCostRecord', (
+    'inventory_id', 'location', 'batch_number', 'expiry_date', 'quantity', 'unit_cost', 'value'))
+
+# 各物资的先进先出库存数量和金额（只读取未消耗完的成本层，走 idx_cost_layers_open 覆盖索引）
+_FIFO_ITEMS_SQL = '''
+    SELECT item_id, SUM(remaining) AS quantity, SUM(remaining * unit_cost) AS value
+    FROM cost_layers
+    WHERE remaining > 0
+    GROUP BY item_id
+'''
+
+# 各估值方法下批次库存行的金额（先进先出成本层按物资计，库位库存按物资的先进先出单位成本计价）
+_BATCH_VALUE_SQL = {
+    METHOD_MOVING_AVERAGE: "inv.quantity * COALESCE(v.average_cost, 0)",
+    METHOD_FIFO: "inv.quantity * COALESCE(f.value / f.quantity, 0)",
+    METHOD_BATCH_COST: "inv.quantity * COALESCE(inv.unit_cost, 0)",
+}
+
+
+def _check_method(method: str):
+    if method not in VALUATION_METHODS:
+        raise ValueError(f"不支持的估值方法: {method}")
+
+
+class InventoryValuation:
+    """库存估值查询
+
+    Args:
+        db: 数据库管理器
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def get_item_cost(self, item_id: int) -> Dict:
+        """单个物资的成本（按主键读取 item_valuation、该物资未消耗完的成本层和批次，与流水量无关）
+
+        Returns:
+            {'item_id', 'quantity', 'average_cost', 'moving_average_value', 'fifo_value', 'layers',
+             'batch_value', 'batches'}
+        """
+        row = self.db.execute_query('''
+            SELECT quantity, total_cost, average_cost FROM item_valuation WHERE item_id = ?
+        ''', (item_id,))
+        quantity, total_cost, average_cost = row[0] if row else (0, 0.0, 0.0)
+        batches = BatchCostRecord.from_rows(self.db.execute_query('''
+            SELECT inventory_id, location, batch_number, expiry_date, quantity, unit_cost,
+                   quantity * COALESCE(unit_cost, 0)
+            FROM inventory
+            WHERE item_id = ? AND quantity > 0
+            ORDER BY inventory_id
+        ''', (item_id,)))
+        layers = CostLayerRecord.from_rows(self.db.execute_query('''
+            SELECT layer_id, stock_in_id, created_at, remaining, unit_cost, remaining * unit_cost
+            FROM cost_layers
+            WHERE item_id = ? AND remaining > 0
+            ORDER BY layer_id
+        ''', (item_id,)))
+        return {
+            'item_id': item_id,
+            'quantity': quantity,
+            'average_cost': round(average_cost, 4),
+            'moving_average_value': round(total_cost, 2),
+            'fifo_value': round(sum(layer.value for layer in layers), 2),
+            'layers': layers,
+            'batch_value': round(sum(batch.value for batch in batches), 2),
+            'batches': batches,
+        }
+
+    def get_total_value(self, method: str = METHOD_MOVING_AVERAGE) -> float:
+        """全部库存金额"""
+        _check_method(method)
+        if method == METHOD_MOVING_AVERAGE:
+            query = "SELECT COALESCE(SUM(total_cost), 0) FROM item_valuation"
+        elif method == METHOD_FIFO:
+            query = "SELECT COALESCE(SUM(remaining * unit_cost), 0) FROM cost_layers WHERE remaining > 0"
+        else:
+            query = "SELECT COALESCE(SUM(quantity * COALESCE(unit_cost, 0)), 0) FROM inventory"
+        return round(self.db.execute_query(query)[0][0], 2)
+
+    def get_value_by_category(self, method: str = METHOD_MOVING_AVERAGE) -> List[Record]:
+        """按物资所属类目汇总库存金额（金额降序）"""
+        _check_method(method)
+        if method == METHOD_MOVING_AVERAGE:
+            # 每种物资一行，直接汇总维护好的库存金额
+            source = '''
+                SELECT i.category_id, v.quantity, v.total_cost AS value
+                FROM item_valuation v
+                JOIN items i ON i.item_id = v.item_id
+                WHERE v.quantity > 0
+            '''
+        elif method == METHOD_FIFO:
+            source = f'''
+                SELECT i.category_id, f.quantity, f.value
+                FROM ({_FIFO_ITEMS_SQL}) f
+                JOIN items i ON i.item_id = f.item_id
+            '''
+        else:
+            source = f'''
+                SELECT i.category_id, SUM(inv.quantity) AS quantity, SUM({_BATCH_VALUE_SQL[METHOD_BATCH_COST]}) AS value
+                FROM inventory inv
+                JOIN items i ON i.item_id = inv.item_id
+                WHERE inv.quantity > 0
+                GROUP BY inv.item_id
+            '''
+        result = self.db.execute_query(f'''
+            SELECT c.category_id, c.category_name, COUNT(*), SUM(s.quantity), ROUND(SUM(s.value), 2)
+            FROM ({source}) s
+            JOIN categories c ON c.category_id = s.category_id
+            GROUP BY c.category_id
+            ORDER BY SUM(s.value) DESC
+        ''')
+        return CategoryValueRecord.from_rows(result)
+
+    def get_value_by_location(self, method: str = METHOD_MOVING_AVERAGE) -> List[Record]:
+        """按库位汇总库存金额（金额降序）
+
+        移动加权平均法下各库位的库存按物资平均成本计价；先进先出成本层按物资计，
+        各库位的库存按物资的先进先出单位成本（成本层金额 / 剩余数量）计价。
+        """
+        _check_method(method)
+        if method == METHOD_MOVING_AVERAGE:
+            join = "LEFT JOIN item_valuation v ON v.item_id = inv.item_id"
+        elif method == METHOD_FIFO:
+            join = f"LEFT JOIN ({_FIFO_ITEMS_SQL}) f ON f.item_id = inv.item_id"
+        else:
+            join = ""
+        result = self.db.execute_query(f'''
+            SELECT inv.location, COUNT(DISTINCT inv.item_id), SUM(inv.quantity),
+                   ROUND(SUM({_BATCH_VALUE_SQL[method]}), 2)
+            FROM inventory inv
+            {join}
+            WHERE inv.quantity > 0
+            GROUP BY inv.location
+            ORDER BY 4 DESC
+        ''')
+        return LocationValueRecord.from_rows(result)
+
+    def verify(self) -> Dict[str, int]:
+        """核对成本状态：移动平均数量、先进先出成本层剩余数量与批次库存合计不一致的物资数，
+        有库存但没有成本的批次数
+        """
+        batches = "SELECT item_id, SUM(quantity) FROM inventory GROUP BY item_id HAVING SUM(quantity) != 0"
+        result = {}
+        for name, valued in (('quantity_mismatches', "SELECT item_id, quantity FROM item_valuation WHERE quantity != 0"),
+                             ('layer_mismatches', "SELECT item_id, quantity FROM (" + _FIFO_ITEMS_SQL + ")")):
+            result[name] = self.db.execute_query(f'''
+                SELECT (SELECT COUNT(*) FROM ({batches} EXCEPT {valued}))
+                     + (SELECT COUNT(*) FROM ({valued} EXCEPT {batches}))
+            ''')[0][0]
+        result['missing_costs'] = self.db.execute_query(
+            "SELECT COUNT(*) FROM inventory WHERE quantity > 0 AND unit_cost IS NULL")[0][0]
+        return result
+
+    def rebuild(self) -> Dict:
+        """按当前批次成本重建移动平均成本和先进先出成本层（批次缺少成本时补为该批次最近的入库单价或物资进价）
+
+        用于导入数据或直接修改批次库存之后：重建后各物资的平均成本等于其批次成本的加权平均，
+        成本层替换为每个批次库存行一层（按 inventory_id 先后），原有的逐笔入库成本层不再保留。
+        """
+        started = time.perf_counter()
+
+        def work(cursor):
+            cursor.execute("DELETE FROM item_valuation")
+            cursor.execute("DELETE FROM cost_layers")
+            self.db._seed_valuation(cursor)
+            self.db._seed_cost_layers(cursor)
+            cursor.execute("SELECT COUNT(*) FROM item_valuation")
+            return cursor.fetchone()[0]
+
+        items = self.db.run_in_transaction(work)
+        return {'items': items, 'seconds': round(time.perf_counter() - started, 3)}